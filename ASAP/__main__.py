@@ -33,19 +33,34 @@ TODO: Check correctness of code (.copy()?)
 import sys
 import os
 import inspect
+import json
 import collections
 import datetime
 import math
 import random
-from typing import Dict, List, Tuple
-
-import pandas as pd
-
+import sqlite3
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ASAP.backend import artifact
+from ASAP.backend import cache as allocation_cache
+from ASAP.backend import editor as allocation_editor
+from ASAP.backend import exact
+from ASAP.backend import feasibility
+from ASAP.backend import history as run_history
+from ASAP.backend import instrumentation
 from ASAP.backend import match
 from ASAP.backend import parser
+from ASAP.backend import sharding
+from ASAP.backend import streaming
 from ASAP.backend.allocation import SuiteAllocation
+from ASAP.backend.checkpoint import RestartCheckpoint
 from ASAP.backend import scoring
 from ASAP.backend.student import StudentData
+from ASAP.backend import util
+
+np = util.LazyModule("numpy")
+pd = util.LazyModule("pandas")
 
 
 class ColumnType:
@@ -101,15 +116,20 @@ class LivingPrefColumnType(NonExclusiveColumnType):
 class ASAP:
     RC_LIST = ("Saga", "Elm", "Cendana")
     RC_LIST_WITH_UNALLOCATED = (*RC_LIST, "Unallocated")
+    NUM_RESTARTS = 100
 
     def __init__(self, filepath):
         self.filepath = filepath
         self.filename = os.path.basename(filepath)
-        self.students_df = pd.read_csv(filepath)
+        self.input_hash = allocation_cache.file_hash(filepath)
+        self.students_df, self.column_profiles = parser.read_student_csv(filepath)
         self.verify_csv()
 
         self.total_students = len(self.students_df)
         self.colnames = list(self.students_df.columns)
+        self.head_values: List[List[str]] = []
+        self.data_version = 0
+        self.refresh_column_profiles(cols=[])
         self.col_to_type: Dict[str, ColumnType] = {}
 
         self.ID = ExclusiveColumnType("Student ID", mandatory=True)
@@ -149,9 +169,18 @@ class ASAP:
         self.num_a11y_males = 0
         self.num_a11y_students = 0
 
+        self.num_restarts = self.NUM_RESTARTS
+        self.seed: Optional[int] = None
+        self.num_shards = 1
+        self.top_k: Optional[int] = None
+        self.exact_max_students: Optional[int] = None
+        self.exact_time_limit = exact.DEFAULT_TIME_LIMIT
         self.female_suites = None
         self.male_suites = None
         self.suites = None
+        self.suite_scores: Dict[str, Any] = {}
+        self.run_report: Optional[instrumentation.RunReport] = None
+        self.editor: Optional[allocation_editor.AllocationEditor] = None
         self.female_stats = {}
         self.male_stats = {}
         self.datetime = None
@@ -169,14 +198,29 @@ class ASAP:
         return f"ASAP({self.filename})"
 
     def verify_csv(self):
-        if self.students_df.isnull().values.any():
-            raise ValueError(f"Number of missing values: {self.students_df.isnull().sum().sum()}. "
+        num_nulls = sum(profile.num_nulls for profile in self.column_profiles.values())
+        if num_nulls:
+            raise ValueError(f"Number of missing values: {num_nulls}. "
                              f"Please ensure there are no missing values.")
 
     def get_colnames_and_unique_values(self) -> Tuple[List[str], List[List[str]], List[List[str]]]:
-        unique_values: List[List[str]] = [self.students_df[col].value_counts().index.tolist() for col in self.colnames]
-        head_values: List[List[str]] = [self.students_df.loc[i, :].values.tolist() for i in range(5)]
-        return self.colnames, unique_values, head_values
+        """Returns the column names, the unique values of each column and the first 5 rows of the student data.
+
+        These are served from the column profiles that are cached when the data is loaded, so this is cheap to call on
+        every request.
+        """
+        unique_values: List[List[str]] = [self.column_profiles[col].values for col in self.colnames]
+        return self.colnames, unique_values, self.head_values
+
+    def refresh_column_profiles(self, cols=None):
+        """Recomputes the cached column profiles and head rows after the student data has been modified.
+
+        Args:
+            cols: (optional) A list of the column names that were modified. Defaults to all columns.
+        """
+        self.column_profiles.update(parser.profile_columns(self.students_df, cols))
+        self.head_values = self.students_df.head(5).values.tolist()
+        self.data_version += 1
 
     def set_column_types(self, col_type_assoc: List[Tuple[str, str]]):
         if self.col_types_defined:
@@ -211,34 +255,44 @@ class ASAP:
             if _type.mandatory and not _type.defined:
                 raise ValueError(f"You did not select any column for '{_type.desc}'. Please try again.")
 
+        # Store the columns that are used for allocation as categoricals, since they only have a few unique values
+        for col in (self.SEX.col, self.SCHOOL.col, *self.COUNTRY.cols, self.ACCESSIBILITY.col, self.AVAILABLE_RCS.col,
+                    *self.LIVING_PREF.cols):
+            if self.students_df[col].dtype != "category":
+                self.students_df[col] = self.students_df[col].astype("category")
+        # The dtypes changed, so the next session checkpoint must rewrite the student data
+        self.data_version += 1
+
         # Check that Sex is just M and F
-        self.students_df[self.SEX.col] = self.students_df[self.SEX.col].str.upper()
-        for value in self.students_df[self.SEX.col].unique():
+        if any(value != value.upper() for value in self.column_profiles[self.SEX.col].values):
+            self.students_df[self.SEX.col] = self.students_df[self.SEX.col].astype(str).str.upper().astype("category")
+            self.refresh_column_profiles(cols=[self.SEX.col])
+        for value in self.column_profiles[self.SEX.col].values:
             if value not in ("M", "F"):
                 raise ValueError(f"Column that represents '{self.SEX.desc}' should only contain 'M' and 'F'. "
                                  f"Currently it contains '{value}' as well.")
-        self.num_males = len(self.students_df[self.students_df[self.SEX.col] == 'M'])
-        self.num_females = len(self.students_df[self.students_df[self.SEX.col] == 'F'])
+        self.num_males = self.column_profiles[self.SEX.col].count("M")
+        self.num_females = self.column_profiles[self.SEX.col].count("F")
 
         # Check that Singapore is present in the country column
-        if "Singapore" not in self.students_df[self.COUNTRY.cols[0]].unique():
+        if "Singapore" not in self.column_profiles[self.COUNTRY.cols[0]].values:
             raise ValueError(f"The value 'Singapore' cannot be found in the column you selected for "
                              f"'{self.COUNTRY.desc}' (column '{self.COUNTRY.cols[0]}'). "
                              f"Did you identify the columns correctly?")
 
         # Check that ID column in unique
-        if not self.students_df[self.ID.col].is_unique:
+        if self.column_profiles[self.ID.col].num_unique != self.total_students:
             raise ValueError(f"The column that you selected for '{self.ID.desc}' (column '{self.ID.col}') "
                              f"contains duplicate values. Did you identify the columns correctly?")
 
         # Check that Accessibility is just Yes and No
-        for value in self.students_df[self.ACCESSIBILITY.col].unique():
+        for value in self.column_profiles[self.ACCESSIBILITY.col].values:
             if value not in ("Yes", "No"):
                 raise ValueError(f"Column that represents '{self.ACCESSIBILITY.desc}' should only contain 'Yes' and "
                                  f"'No'. Currently it contains '{value}' as well.")
 
         # Check that Available RCs is just Saga, Elm, Cendana (separated by ", ")
-        for rc_list in self.students_df[self.AVAILABLE_RCS.col].unique():
+        for rc_list in self.column_profiles[self.AVAILABLE_RCS.col].values:
             for value in rc_list.split(", "):
                 if value not in self.RC_LIST:
                     raise ValueError(f"Column that represents '{self.AVAILABLE_RCS.desc}' should only contain the "
@@ -278,6 +332,17 @@ class ASAP:
 
         self.weights_defined = True
 
+    def activate_scores(self):
+        """Applies the max scores and weights of this object's living preferences to the scoring module.
+
+        The scoring module stores them per thread, so this is called before any scoring is done, in case another
+        session's allocation has run in the same thread or the object has been restored from storage.
+        """
+        if self.living_pref_order_defined:
+            self.set_max_scores()
+        if self.weights_defined:
+            scoring.Scores.set_weights({col: weight / 100 for col, weight in self.LIVING_PREF.weights.items()})
+
     def set_options(self, saga_sextets, elm_sextets, cendana_sextets, saga_a11y_suites, elm_a11y_suites,
                     cendana_a11y_suites):
         """
@@ -307,10 +372,9 @@ class ASAP:
         self.avail_a11y_suites_elm = elm_a11y_suites
         self.avail_a11y_suites_cendana = cendana_a11y_suites
 
-        self.num_a11y_females = len(self.students_df[(self.students_df[self.ACCESSIBILITY.col] == 'Yes')
-                                                     & (self.students_df[self.SEX.col] == 'F')])
-        self.num_a11y_males = len(self.students_df[(self.students_df[self.ACCESSIBILITY.col] == 'Yes')
-                                                   & (self.students_df[self.SEX.col] == 'M')])
+        a11y_counts = self.students_df.groupby([self.ACCESSIBILITY.col, self.SEX.col], observed=True).size()
+        self.num_a11y_females = int(a11y_counts.get(("Yes", "F"), 0))
+        self.num_a11y_males = int(a11y_counts.get(("Yes", "M"), 0))
         self.num_a11y_students = self.num_a11y_females + self.num_a11y_females
 
         self.total_sextets = self.avail_sextets_saga + self.avail_sextets_elm + self.avail_sextets_cendana
@@ -362,24 +426,283 @@ class ASAP:
                     raise ValueError(f"Student {self.students_df.loc[i, self.ID.col]} needs an accessibility suite in "
                                      f"one of the following RCs: {self.students_df.loc[i, self.AVAILABLE_RCS.col]}.")
 
+        # Check that the suites in each RC can house the students who are allowed to live there
+        report = self.check_feasibility()
+        if not report.feasible:
+            raise ValueError(report.explanation)
+
         self.options_defined = True
 
-    def run_allocation(self):
-        female_students, male_students = self.add_students()
-        self.female_suites = self.allocate_suites(female_students, "Female", self.num_a11y_females)
-        self.male_suites = self.allocate_suites(male_students, "Male", self.num_a11y_males)
-        # DONE up till here
-        rca_match = match.RCAMatch(self.female_suites, self.male_suites,
-                                   saga_sextets=self.avail_sextets_saga,
-                                   elm_sextets=self.avail_sextets_elm,
-                                   cendana_sextets=self.avail_sextets_cendana,
-                                   saga_a11y_suites=self.avail_a11y_suites_saga,
-                                   elm_a11y_suites=self.avail_a11y_suites_elm,
-                                   cendana_a11y_suites=self.avail_a11y_suites_cendana)
-        rca_match.run_match()
-        self.suites = self.male_suites + self.female_suites
+    def check_feasibility(self) -> feasibility.FeasibilityReport:
+        """Checks that the available suites in each RC can house the students who are allowed to live there.
+
+        This runs in milliseconds, so infeasible options are rejected before any allocation is attempted.
+
+        Returns:
+            A FeasibilityReport object.
+        """
+        group_cols = [self.SEX.col, self.AVAILABLE_RCS.col, self.ACCESSIBILITY.col]
+        student_groups = collections.Counter()
+        # groupby().size() rather than DataFrame.value_counts(), which needs pandas 1.1
+        group_counts = self.students_df.groupby(group_cols, observed=True).size()
+        for (sex, available_rcs, accessibility), count in group_counts.items():
+            if count:
+                student_groups[(sex, tuple(available_rcs.split(", ")), accessibility == "Yes")] += int(count)
+        rc_capacities = {
+            "Saga": (self.avail_sextets_saga, self.avail_a11y_suites_saga),
+            "Elm": (self.avail_sextets_elm, self.avail_a11y_suites_elm),
+            "Cendana": (self.avail_sextets_cendana, self.avail_a11y_suites_cendana),
+        }
+        return feasibility.check_feasibility(dict(student_groups), rc_capacities)
+
+    def config(self) -> Dict[str, Any]:
+        """Returns the configuration chosen in the setup steps as a JSON-serialisable dictionary.
+
+        Together with the CSV file, this is everything needed to reproduce an allocation.
+        """
+        return {
+            "columns": {col: _type.desc for col, _type in self.col_to_type.items()},
+            "living_pref_order": {col: list(order)
+                                  for col, order in zip(self.LIVING_PREF.cols, self.LIVING_PREF.selected_order)},
+            "weights": dict(self.LIVING_PREF.weights),
+            "options": {
+                "saga_sextets": self.avail_sextets_saga,
+                "elm_sextets": self.avail_sextets_elm,
+                "cendana_sextets": self.avail_sextets_cendana,
+                "saga_a11y_suites": self.avail_a11y_suites_saga,
+                "elm_a11y_suites": self.avail_a11y_suites_elm,
+                "cendana_a11y_suites": self.avail_a11y_suites_cendana,
+            },
+            "num_restarts": self.num_restarts,
+            "seed": self.seed,
+            "num_shards": self.num_shards,
+            "top_k": self.top_k,
+            "exact_max_students": self.exact_max_students,
+            "exact_time_limit": self.exact_time_limit,
+        }
+
+    def apply_config(self, config: Dict[str, Any]):
+        """Runs the setup steps with the choices in a configuration returned by config().
+
+        Args:
+            config: A dictionary in the same format as the one returned by config(). "num_restarts", "seed",
+                "num_shards", "top_k", "exact_max_students" and "exact_time_limit" are optional.
+        """
+        try:
+            columns = config["columns"]
+            col_type_assoc = [(col, columns[col]) for col in self.colnames]
+            self.set_column_types(col_type_assoc)
+            self.set_living_pref_order([config["living_pref_order"][col] for col in self.LIVING_PREF.cols])
+            self.set_weights({col: config["weights"][col] for col in self.LIVING_PREF.cols})
+            self.set_options(**config["options"])
+        except KeyError as e:
+            raise ValueError(f"The configuration does not specify {e}.")
+        self.num_restarts = config.get("num_restarts", self.NUM_RESTARTS)
+        self.seed = config.get("seed")
+        self.num_shards = config.get("num_shards", 1)
+        self.top_k = config.get("top_k")
+        if self.top_k is not None and self.top_k < 1:
+            raise ValueError("top_k must be at least 1.")
+        self.exact_max_students = config.get("exact_max_students")
+        self.exact_time_limit = config.get("exact_time_limit", exact.DEFAULT_TIME_LIMIT)
+        self.exact_mode()  # Validates the settings of the exact mode
+
+    def run_allocation(self, progress: Callable[[str, int, int, Optional[float]], None] = None,
+                       should_stop: Callable[[], bool] = None, checkpoint: RestartCheckpoint = None,
+                       cache: allocation_cache.AllocationCache = None, history: run_history.RunHistory = None):
+        """Allocates students to suites, then pairs female and male suites into RCA groups and assigns their RCs.
+
+        Args:
+            progress: (optional) A function that is called after every restart with the name of the current phase,
+                the number of restarts completed in that phase, the total number of restarts in that phase and the
+                best global score so far (None if there is no score for the phase).
+            should_stop: (optional) A function that is called before every restart. If it returns True, the remaining
+                restarts are skipped and the best allocation found so far is used (every phase still runs at least
+                one restart).
+            checkpoint: (optional) A RestartCheckpoint object. Completed restarts are saved to it, and restarts that
+                were saved by an earlier run with the same configuration are not repeated.
+            cache: (optional) An AllocationCache object. If it has an allocation of the same CSV file with the same
+                configuration, that allocation is loaded instead of running a new one. Otherwise the new allocation is
+                added to it, unless it was stopped early.
+            history: (optional) A RunHistory object. The new allocation is recorded in it (allocations loaded from the
+                cache are not recorded again).
+        """
+        # An allocation that runs while a report is already being recorded (e.g. to profile memory) is added to it
+        self.run_report = instrumentation.active() or instrumentation.RunReport()
+        self.editor = None
+        start_time = time.perf_counter()
+        try:
+            with instrumentation.recording(self.run_report):
+                if cache:
+                    cached_filepath = cache.get(self.cache_key())
+                    if cached_filepath:
+                        self.load_allocation(cached_filepath)
+                        return
+                self.activate_scores()
+                female_students, male_students = self.add_students()
+                self.female_suites = self.allocate_suites(female_students, "Female", self.num_a11y_females,
+                                                          self.rng("Female"), progress, should_stop, checkpoint)
+                self.male_suites = self.allocate_suites(male_students, "Male", self.num_a11y_males,
+                                                        self.rng("Male"), progress, should_stop, checkpoint)
+                # DONE up till here
+                if progress:
+                    progress("RCA match", 0, 1, None)
+                with instrumentation.phase("RCA match"):
+                    rca_match = match.RCAMatch(self.female_suites, self.male_suites,
+                                               saga_sextets=self.avail_sextets_saga,
+                                               elm_sextets=self.avail_sextets_elm,
+                                               cendana_sextets=self.avail_sextets_cendana,
+                                               saga_a11y_suites=self.avail_a11y_suites_saga,
+                                               elm_a11y_suites=self.avail_a11y_suites_elm,
+                                               cendana_a11y_suites=self.avail_a11y_suites_cendana,
+                                               rng=self.rng("RCA"), top_k=self.top_k)
+                    rca_match.run_match()
+                self.suites = self.male_suites + self.female_suites
+                with instrumentation.phase("Score table"):
+                    self.suite_scores = self.score_suites(self.suites)
+                self.calculate_statistics()
+                self.allocation_completed = True
+                if cache and not (should_stop and should_stop()):
+                    cache.put(self.cache_key(), self)
+        finally:
+            self.run_report.total_seconds = time.perf_counter() - start_time
+        if history:
+            # The history is a best-effort record, so failing to write it (e.g. the database is locked or the disk is
+            # full) must not throw away a completed allocation
+            try:
+                history.record(self, completed=not (should_stop and should_stop()))
+            except (sqlite3.Error, OSError) as e:
+                print(f"Could not record the allocation in the run history: {e}", file=sys.stderr)
+        if progress:
+            progress("RCA match", 1, 1, None)
+
+    def cache_key(self):
+        """Returns the key of this allocation in an AllocationCache, based on the CSV file and the configuration."""
+        return allocation_cache.cache_key(self.input_hash, self.config())
+
+    def rescore(self, weights, demographic_weight=0.4) -> Dict[str, Any]:
+        """Scores the current allocation under other weights, without changing the allocation or the weights.
+
+        Args:
+            weights: A dictionary mapping each living preference column to its weight in percent. The weights must
+                add up to 100, as in set_weights().
+            demographic_weight: (optional) A float between 0 and 1 representing the weight of the demographic score
+                in the final score of each suite.
+
+        Returns:
+            A dictionary mapping "Demographic Score", "Living Pref Score" and "Final Score" to an array with the score
+            of each suite (in the same order as self.suites), and "Global Score" to a dictionary mapping "Female",
+            "Male" and "All" to the mean final score of those suites.
+        """
+        if not self.allocation_completed:
+            raise ValueError("self.run_allocation() MUST be called first")
+        if set(weights) != set(self.LIVING_PREF.cols):
+            raise ValueError(f"Weights must be given for exactly these living preferences: "
+                             f"{', '.join(self.LIVING_PREF.cols)}.")
+        total = sum(weights.values())
+        if total != 100:
+            raise ValueError(f"Sum of weights should be exactly 100%. Currently it is {total}%.")
+        if not 0 <= demographic_weight <= 1:
+            raise ValueError("The demographic weight should be between 0% and 100%.")
+        scores = scoring.rescore_suites(self.suite_scores, {col: weights[col] / 100 for col in self.LIVING_PREF.cols},
+                                        demographic_weight)
+        # self.suites contains the male suites followed by the female suites
+        final_scores = scores["Final Score"]
+        num_male_suites = len(self.male_suites)
+        scores["Global Score"] = {
+            "Female": float(final_scores[num_male_suites:].mean()) if len(self.female_suites) else None,
+            "Male": float(final_scores[:num_male_suites].mean()) if num_male_suites else None,
+            "All": float(final_scores.mean()) if len(final_scores) else None,
+        }
+        return scores
+
+    def edit_allocation(self, student_id, other, apply=False) -> Dict[str, Any]:
+        """Previews or applies a manual change to the allocation: a swap of two students, or a move to a vacancy.
+
+        Only the suites and RCA groups that the change affects are scored (see editor.AllocationEditor), so a change
+        takes milliseconds even for large allocations. Applied changes update the suites, their scores and the
+        statistics of each RC, so they are included when the allocation is exported.
+
+        Args:
+            student_id: A string representing the Matric/ID of a student.
+            other: A string representing the Matric/ID of another student of the same sex, or the name of a suite with
+                a vacancy.
+            apply: (optional) A boolean indicating whether to apply the change. Otherwise it is only previewed.
+
+        Returns:
+            A dictionary describing the change (see editor.Change).
+        """
+        if not self.allocation_completed:
+            raise ValueError("self.run_allocation() MUST be called first")
+        self.activate_scores()
+        if self.editor is None:
+            self.editor = allocation_editor.AllocationEditor(self.female_suites, self.male_suites)
+        if not apply:
+            return self.editor.preview(student_id, other).as_dict()
+        # The editor's suites are in the same order as self.suites (the male suites followed by the female suites).
+        # The new scores are calculated before the suites are changed, so that an error leaves the allocation as it was.
+        new_scores = {i: scoring.suite_scores(students)
+                      for i, students in self.editor.changed_students(student_id, other).items()}
+        change = self.editor.apply(student_id, other)
+        for i, scores in new_scores.items():
+            for name, score in scores.items():
+                # Scores loaded from an allocation.npz file are integer arrays if every score was a whole number
+                if self.suite_scores[name].dtype.kind != "f":
+                    self.suite_scores[name] = self.suite_scores[name].astype(float)
+                self.suite_scores[name][i] = score
+        allocation_datetime = self.datetime
         self.calculate_statistics()
-        self.allocation_completed = True
+        self.datetime = allocation_datetime
+        return change.as_dict()
+
+    def score_suites(self, suites) -> Dict[str, Any]:
+        """Calculates the scores of every suite, so that exporting the results does not need to recalculate them.
+
+        Args:
+            suites: A list of SuiteAllocation.SuiteData objects.
+
+        Returns:
+            A dictionary mapping the name of each score (see scoring.suite_scores()) to an array with the score of each
+            suite, in the same order as the suites.
+        """
+        if not suites:
+            return {}
+        # The diversity scores of every suite are looked up at once from the counts that they depend on
+        counts = np.array([scoring.diversity_counts(suite.students) for suite in suites]).T
+        diversity_scores = scoring.diversity_scores_from_counts(*counts)
+        citizenship_diversity, country_diversity, school_diversity, demographic_score = diversity_scores
+        weights = scoring.Scores.get_weights()
+        pref_scores = {living_pref: np.array([scoring.living_pref_score(suite.students, living_pref, higher_better=True)
+                                              for suite in suites])
+                       for living_pref in weights}
+        pref_score = sum(pref_scores[living_pref] * weight for living_pref, weight in weights.items())
+        return {
+            "Citizenship Diversity": citizenship_diversity,
+            "Country Diversity": country_diversity,
+            "School Diversity": school_diversity,
+            **{f"Score: {living_pref}": score for living_pref, score in pref_scores.items()},
+            "Demographic Score": demographic_score,
+            "Living Pref Score": pref_score,
+            "Final Score": scoring.combine_success_scores(demographic_score, pref_score),
+        }
+
+    def exact_mode(self) -> Optional[exact.ExactMode]:
+        """Returns the settings of the exact mode (see exact.py), or None if it is off."""
+        if self.exact_max_students is None:
+            return None
+        return exact.ExactMode(self.exact_max_students, self.exact_time_limit)
+
+    def rng(self, phase):
+        """Returns the random number generator for a phase of the allocation.
+
+        If a seed is set, every phase gets its own generator derived from it, so the random numbers used by one phase
+        do not depend on how many restarts an earlier phase ran (e.g. when a run is stopped early and resumed).
+        Otherwise the phase gets its own generator seeded by the operating system, so that restoring its state from a
+        checkpoint does not change the global random module.
+        """
+        if self.seed is None:
+            return random.Random()
+        return random.Random(f"{self.seed}:{phase}")
 
     def set_max_scores(self):
         unique_options = {col: list(val_dict)
@@ -395,21 +718,27 @@ class ASAP:
         Returns:
             Two lists containing StudentData objects, one list for female students and one list for male students.
         """
+        with instrumentation.phase("Student construction"):
+            return self._add_students()
+
+    def _add_students(self):
         female_students = []
         male_students = []
+        # Reading whole columns at once is much faster than looking up every value with self.students_df.loc
+        values = {col: self.students_df[col].tolist() for col in self.colnames}
         for i in range(len(self.students_df)):
             # Gathers data for one student in a dictionary that maps variable names to the values
             new_student = StudentData(index=i,
-                                      matric=self.students_df.loc[i, self.ID.col],
-                                      sex=self.students_df.loc[i, self.SEX.col],
-                                      school=self.students_df.loc[i, self.SCHOOL.col],
-                                      country=[self.students_df.loc[i, col] for col in self.COUNTRY.cols if col],
-                                      living_prefs={col: self.LIVING_PREF.text_to_num[j][self.students_df.loc[i, col]]
+                                      matric=values[self.ID.col][i],
+                                      sex=values[self.SEX.col][i],
+                                      school=values[self.SCHOOL.col][i],
+                                      country=[values[col][i] for col in self.COUNTRY.cols if col],
+                                      living_prefs={col: self.LIVING_PREF.text_to_num[j][values[col][i]]
                                                     for j, col in enumerate(self.LIVING_PREF.cols)},
-                                      others={col: self.students_df.loc[i, col] for col in self.OTHERS.cols},
-                                      available_rcs=self.students_df.loc[i, self.AVAILABLE_RCS.col].split(", "),
-                                      accessibility=self.students_df.loc[i, self.ACCESSIBILITY.col] == "Yes")
-            sex = self.students_df.loc[i, self.SEX.col]
+                                      others={col: values[col][i] for col in self.OTHERS.cols},
+                                      available_rcs=values[self.AVAILABLE_RCS.col][i].split(", "),
+                                      accessibility=values[self.ACCESSIBILITY.col][i] == "Yes")
+            sex = values[self.SEX.col][i]
             if sex == "F":
                 female_students.append(new_student)
             elif sex == "M":
@@ -429,78 +758,163 @@ class ASAP:
             self.male_stats[suite.rc] = (len(suite.students) + num_students, 1 + num_suites)
         self.datetime = datetime.datetime.now().strftime("%d %b %Y %H:%M")
 
-    def allocate_suites(self, students, name, num_a11y_students):
-        allocations = {}
-        for i in range(100):
-            suite_allocation = SuiteAllocation(students, name, num_a11y_students)
-            suite_allocation.match()
-            global_score = suite_allocation.global_score()
-            allocated_suites = suite_allocation.get_allocation()
-            print(f"Global score: {global_score}")
-            allocations[global_score] = allocated_suites
-        final_score = max(allocations)
-        allocated_suites = allocations[final_score]
+    def allocate_suites(self, students, name, num_a11y_students, rng=None, progress=None, should_stop=None,
+                        checkpoint=None):
+        if rng is None:
+            rng = self.rng(name)
+        if self.num_shards > 1:
+            # Shards are allocated in worker processes, so their restarts are not checkpointed
+            return sharding.allocate_sharded(students, name, num_a11y_students, self.num_shards, self.num_restarts,
+                                             rng, progress, should_stop, top_k=self.top_k,
+                                             exact_mode=self.exact_mode())
+        final_score = None
+        allocated_suites = None
+        start = 0
+        exact_mode = self.exact_mode()
+        restart_stats = streaming.RestartStats()
+        saved = checkpoint.load(name) if checkpoint else None
+        if saved:
+            start, final_score, allocated_suites = saved.completed, saved.best_score, saved.best_suites
+            restart_stats = saved.restart_stats or restart_stats
+            rng.setstate(saved.rng_state)
+            print(f"Resuming {name} suites from restart {start}")
+            if progress:
+                progress(f"{name} suites", start, self.num_restarts, final_score)
+        instrumentation.record_restarts(f"{name} suites", restart_stats)
+        with instrumentation.phase("Restarts"):
+            for i in range(start, self.num_restarts):
+                if allocated_suites is not None and should_stop and should_stop():
+                    print(f"Stopped after {i} restarts")
+                    break
+                instrumentation.count("Restarts")
+                suite_allocation = SuiteAllocation(students, name, num_a11y_students, rng, self.top_k, exact_mode)
+                suite_allocation.match()
+                global_score = suite_allocation.global_score()
+                print(f"Global score: {global_score}")
+                restart_stats.add(global_score)
+                # Later allocations replace earlier ones with the same score
+                improved = final_score is None or global_score >= final_score
+                if improved:
+                    final_score = global_score
+                    allocated_suites = suite_allocation.get_allocation()
+                if checkpoint:
+                    checkpoint.save(name, i + 1, final_score, rng.getstate(), allocated_suites if improved else None,
+                                    restart_stats)
+                if progress:
+                    progress(f"{name} suites", i + 1, self.num_restarts, final_score)
         print(f"\nFinal score: {final_score}\n")
         return allocated_suites
 
     def export_files(self, folder_path):
         if not self.allocation_completed:
             raise ValueError("self.run_allocation() MUST be called first")
+        self.activate_scores()
 
         def filepath(filename):
             return os.path.join(folder_path, filename)
 
-        self.generate_suite_results(self.female_suites, filepath("female_suites.csv"))
-        self.generate_suite_results(self.male_suites, filepath("male_suites.csv"))
-        self.generate_suite_results(self.suites, filepath("rca_groups.csv"))
+        with instrumentation.recording(self.run_report or instrumentation.RunReport()), instrumentation.phase("Export"):
+            self._export_files(filepath)
+
+    def _export_files(self, filepath):
+        # self.suites contains the male suites followed by the female suites, so each CSV file is a slice of one table
+        suites_df = self.generate_suite_results()
+        num_male_suites = len(self.male_suites)
+        for df, filename in ((suites_df.iloc[num_male_suites:], "female_suites.csv"),
+                             (suites_df.iloc[:num_male_suites], "male_suites.csv"),
+                             (suites_df, "rca_groups.csv")):
+            df.sort_values(by=['RCA', 'Suite'], kind="mergesort").to_csv(filepath(filename), index=False)
         self.generate_masterlist(self.suites, filepath("masterlist.csv"))
+        # Save the exact configuration used, so that the allocation can be reproduced with the headless mode
+        with open(filepath("config.json"), "w", encoding="utf-8") as f:
+            json.dump(self.config(), f, indent=4, ensure_ascii=False)
+        artifact.save_artifact(self, filepath("allocation.npz"))
 
-    def generate_suite_results(self, suites, csv_path):
-        """
-        Temporary function to generate results for an allocation
+    def load_allocation(self, filepath):
+        """Restores the results of an allocation from the allocation.npz file saved by export_files().
+
+        The setup steps are run with the configuration saved in the file, so this can be called on a new ASAP object
+        instead of running the allocation again.
 
         Args:
-            suites:
-            csv_path:
+            filepath: A string representing the path of the allocation.npz file, or a file object of it (e.g. from
+                RunHistory.allocation()). It must have been saved from an allocation of the same CSV file.
         """
-        suite_living_prefs = {
-            k: v
-            for i, living_pref in enumerate(self.LIVING_PREF.cols)
-            for k, v in {
-                f"Living Pref: {living_pref}": [[self.LIVING_PREF.num_to_text[i][student.data.living_prefs[living_pref]]
-                                                 for student in suite.students]
-                                                for suite in suites],
-                living_pref: [[student.data.living_prefs[living_pref]
-                               for student in suite.students]
-                              for suite in suites],
-                f"Score: {living_pref}": [scoring.living_pref_score(suite.students, living_pref, higher_better=True)
-                                          for suite in suites]
-            }.items()
-        }
+        report = instrumentation.active() or instrumentation.RunReport()
+        with instrumentation.recording(report), instrumentation.phase("Load allocation"):
+            self._load_allocation(filepath)
+        self.run_report = report
+
+    def _load_allocation(self, filepath):
+        allocation = artifact.load_artifact(filepath)
+        self.apply_config(allocation.config)
+        self.editor = None
+        if list(allocation["student_matric"]) != list(self.students_df[self.ID.col].astype(str)):
+            raise ValueError(f"{os.path.basename(getattr(filepath, 'name', filepath))} is the allocation of a "
+                             f"different CSV file.")
+        female_students, male_students = self.add_students()
+        students = {student.index: student for student in female_students + male_students}
+        self.suites = []
+        for i, suite_num in enumerate(allocation["suite_names"]):
+            suite = SuiteAllocation.SuiteData(str(suite_num), 6)
+            for j in allocation.suite_students(i):
+                student = match.SuiteRound.StudentMatchee(students[j])
+                suite.add_student(student)
+                student.current_choice = match.SuiteRound.SuiteMatchee(suite)
+            suite.suite_num = str(suite_num)  # Undo the " (Accessibility)" added again by add_student()
+            rca = allocation["suite_rca"][i]
+            if rca >= 0:
+                suite.rca = str(allocation["rca_names"][rca])
+                suite.rc = str(allocation["rc_names"][allocation["rca_rc"][rca]])
+            else:
+                suite.rca = suite.rc = artifact.UNALLOCATED
+            self.suites.append(suite)
+        self.female_suites = [suite for suite, sex in zip(self.suites, allocation["suite_sex"]) if sex == "F"]
+        self.male_suites = [suite for suite, sex in zip(self.suites, allocation["suite_sex"]) if sex == "M"]
+        self.suite_scores = allocation.suite_scores()
+        self.calculate_statistics()
+        self.datetime = allocation.datetime
+        self.allocation_completed = True
+
+    def generate_suite_results(self) -> "pd.DataFrame":
+        """Builds a table of the results of every suite, with the scores taken from self.suite_scores.
+
+        Returns:
+            A Pandas DataFrame with one row per suite, in the same order as self.suites.
+        """
+        suites = self.suites
+        suite_students = [suite.students for suite in suites]
+        suite_living_prefs = {}
+        for i, living_pref in enumerate(self.LIVING_PREF.cols):
+            num_to_text = self.LIVING_PREF.num_to_text[i]
+            values = [[student.data.living_prefs[living_pref] for student in students] for students in suite_students]
+            suite_living_prefs[f"Living Pref: {living_pref}"] = [[num_to_text[value] for value in suite_values]
+                                                                  for suite_values in values]
+            suite_living_prefs[living_pref] = values
+            suite_living_prefs[f"Score: {living_pref}"] = self.suite_scores[f"Score: {living_pref}"]
         suite_data = {
             "Suite": [repr(suite) for suite in suites],
             "RC": [suite.rc for suite in suites],
             "RCA": [suite.rca for suite in suites],
-            "Num_students": [len(suite.students) for suite in suites],
-            "Countries": [[student.data.country for student in suite.students] for suite in suites],
-            "Citizenship Diversity": [scoring.citizenship_diversity_score(suite.students) for suite in suites],
-            "Country Diversity": [scoring.country_diversity_score(suite.students) for suite in suites],
-            "Schools": [[student.data.school for student in suite.students] for suite in suites],
-            "School Diversity": [scoring.school_diversity_score(suite.students) for suite in suites],
+            "Num_students": np.array([len(students) for students in suite_students]),
+            "Countries": [[student.data.country for student in students] for students in suite_students],
+            "Citizenship Diversity": self.suite_scores["Citizenship Diversity"],
+            "Country Diversity": self.suite_scores["Country Diversity"],
+            "Schools": [[student.data.school for student in students] for students in suite_students],
+            "School Diversity": self.suite_scores["School Diversity"],
             **suite_living_prefs,
-            "Demographic Score": [scoring.demographic_scores(suite.students) for suite in suites],
-            "Living Pref Score": [scoring.living_pref_scores(suite.students, higher_better=True) for suite in suites],
-            "Final Score": [scoring.calculate_success(suite.students) for suite in suites]
+            "Demographic Score": self.suite_scores["Demographic Score"],
+            "Living Pref Score": self.suite_scores["Living Pref Score"],
+            "Final Score": self.suite_scores["Final Score"],
         }
-        suites_df = pd.DataFrame(suite_data, columns=list(suite_data.keys()))
-        suites_df.sort_values(by=['RCA', 'Suite'], inplace=True, kind="mergesort")
-        suites_df.to_csv(csv_path, index=False)
+        return pd.DataFrame(suite_data, columns=list(suite_data.keys()))
 
     def generate_masterlist(self, suites, csv_path):
         # The algorithm always allocates locals first followed by internationals so they are ordered in that way
         # [local, local, local, intl, intl, intl]
         # random.sample ensures that the local and international students are mixed together
-        students = [student for suite in suites for student in random.sample(suite.students, len(suite.students))]
+        rng = self.rng("Masterlist")
+        students = [student for suite in suites for student in rng.sample(suite.students, len(suite.students))]
         df = self.students_df.reindex(student.data.index for student in students)
         CURRENT_YEAR = datetime.datetime.now().year
         num_students = len(students)
@@ -1,14 +1,16 @@
 import math
 import random
 import itertools
-
-import numpy as np
 from typing import List
 
+from ASAP.backend import instrumentation
 from ASAP.backend import match
 from ASAP.backend import scoring
 from ASAP.backend.student import Citizenship
 from ASAP.backend.student import StudentData
+from ASAP.backend import util
+
+np = util.LazyModule("numpy")
 
 
 class SuiteAllocation:
@@ -45,7 +47,12 @@ class SuiteAllocation:
         def __str__(self):
             return str(self.suite_num)
 
-    def __init__(self, students, name, num_a11y_students):
+    def __init__(self, students, name, num_a11y_students, rng=random, top_k=None, exact_mode=None):
+        self.rng = rng
+        # The number of candidates that each participant of a suite round ranks (see match.generate_ranking())
+        self.top_k = top_k
+        # An exact.ExactMode object if small suite rounds are solved exactly
+        self.exact_mode = exact_mode
         self.students: List[StudentData] = students.copy()
         self.student_results = []
         self.total_students = len(students)
@@ -56,7 +63,8 @@ class SuiteAllocation:
         # self.batch_size = math.ceil(self.total_students/6)
         self.suites = [SuiteAllocation.SuiteData(f"FY {name} Suite {i:02d}", 6)
                        for i in range(1, self.batch_size + 1)]
-        self.batches = self.split_into_batches()
+        with instrumentation.phase("Batching"):
+            self.batches = self.split_into_batches()
 
     @staticmethod
     def get_citizenship(student):
@@ -66,7 +74,7 @@ class SuiteAllocation:
             return 1
 
     def split_into_batches(self):
-        random.shuffle(self.students)
+        self.rng.shuffle(self.students)
         local_students = [student for student in self.students
                           if student.citizenship == Citizenship.LOCAL and not student.accessibility]
         local_a11y = [student for student in self.students
@@ -90,10 +98,10 @@ class SuiteAllocation:
             batches_of_students.append(sorted_students[start_id:end_id])
         return batches_of_students
 
-    def match(self):
+    def match(self, suite_propose=True):
         self.allocate_first_batch()
-        self.allocate_remaining_batches()
-        self.allocate_last_batch()
+        self.allocate_remaining_batches(suite_propose)
+        self.allocate_last_batch(suite_propose)
 
     def allocate_first_batch(self):
         students = self.batches.pop(0)
@@ -107,22 +115,24 @@ class SuiteAllocation:
         """
         for i in range(4):
             students = self.batches.pop(0)
-            student_results = match.SuiteRound(students, self.suites, suite_propose).run_match()
+            student_results = match.SuiteRound(students, self.suites, suite_propose, self.top_k,
+                                              self.exact_mode).run_match()
             self.student_results.extend(student_results)
 
     def allocate_last_batch(self, suite_propose=True):
         # In the last batch, only use sextets, because a11y suites would have reached capacity (5 rooms) already.
         students = self.batches.pop(0)
         sextets = [suite for suite in self.suites if not suite.accessibility]
-        student_results = match.SuiteRound(students, sextets, suite_propose).run_match()
+        student_results = match.SuiteRound(students, sextets, suite_propose, self.top_k, self.exact_mode).run_match()
         self.student_results.extend(student_results)
 
     def global_score(self):
-        scores = []
-        for suite in self.suites:
-            # scores.append(scoring.calculate_score(suite, student=None))
-            scores.append(scoring.calculate_success(suite.students))
-        return np.mean(scores)
+        with instrumentation.phase("Restart scoring"):
+            scores = []
+            for suite in self.suites:
+                # scores.append(scoring.calculate_score(suite, student=None))
+                scores.append(scoring.calculate_success(suite.students))
+            return np.mean(scores)
 
     def get_allocation(self):
         return self.suites.copy()
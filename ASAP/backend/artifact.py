@@ -0,0 +1,139 @@
+"""This module provides a compact binary format for the results of an allocation.
+
+The allocation is stored as typed arrays in a NumPy .npz file, so that it can be loaded back in milliseconds and read by
+other tools without parsing the lists that are written to the CSV files. Students and suites are referred to by their
+position: students by their row in the CSV file, and suites by their position in ASAP.suites (the male suites followed
+by the female suites). The arrays are:
+
+    * student_matric: The student ID of each student, to check that the artifact belongs to the CSV file.
+    * student_suite: The suite of each student (-1 if the student was not allocated).
+    * suite_offsets, suite_members: The students of each suite, in order. The students of suite i are
+        suite_members[suite_offsets[i]:suite_offsets[i + 1]].
+    * suite_names, suite_sex, suite_accessibility: The name, sex ("F" or "M") and accessibility of each suite.
+    * suite_rca: The RCA group of each suite (-1 if the suite was not paired).
+    * rca_names, rca_rc: The name and RC of each RCA group. RCs are positions in rc_names.
+    * score_names, suite_scores: The scores of each suite (one column per score, see scoring.suite_scores()).
+        score_integral marks the scores that are whole numbers for every suite.
+    * config, seed: The configuration (as JSON) and the random seed (empty if there was none).
+    * datetime: When the allocation finished.
+
+    Typical usage example:
+
+    save_artifact(asap_obj, "allocation.npz")
+    artifact = load_artifact("allocation.npz")
+"""
+
+import json
+import zipfile
+from typing import Any, Dict
+
+from ASAP.backend import util
+
+np = util.LazyModule("numpy")
+
+FORMAT_VERSION = 1
+UNALLOCATED = "Unallocated"
+
+
+class AllocationArtifact:
+    """Contains the arrays of an allocation artifact
+
+    Attributes:
+        arrays: A dictionary mapping the name of each array (see the module docstring) to the array.
+        config: A dictionary of the configuration, in the same format as the one returned by ASAP.config().
+        seed: An integer representing the random seed, or None if there was none.
+        datetime: A string representing when the allocation finished.
+    """
+
+    def __init__(self, arrays):
+        self.arrays: Dict[str, Any] = arrays
+        self.config: Dict[str, Any] = json.loads(str(arrays["config"]))
+        self.seed = int(arrays["seed"][0]) if len(arrays["seed"]) else None
+        self.datetime = str(arrays["datetime"])
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def suite_students(self, suite):
+        """Returns the positions of the students of a suite, in order."""
+        offsets = self.arrays["suite_offsets"]
+        return self.arrays["suite_members"][offsets[suite]:offsets[suite + 1]]
+
+    def suite_scores(self) -> Dict[str, Any]:
+        """Returns the scores of every suite in the same format as ASAP.suite_scores."""
+        return {str(name): (self.arrays["suite_scores"][:, i].astype(np.int64) if integral
+                            else self.arrays["suite_scores"][:, i])
+                for i, (name, integral) in enumerate(zip(self.arrays["score_names"], self.arrays["score_integral"]))}
+
+
+def save_artifact(asap_obj, filepath):
+    """Saves the results of a completed allocation to a .npz file.
+
+    Args:
+        asap_obj: The ASAP object of a completed allocation.
+        filepath: A string representing the path of the file.
+    """
+    suites = asap_obj.suites
+    female_suites = {id(suite) for suite in asap_obj.female_suites}
+    rca_names = sorted({suite.rca for suite in suites if suite.rca != UNALLOCATED})
+    rca_to_index = {rca: i for i, rca in enumerate(rca_names)}
+    rc_names = list(asap_obj.RC_LIST)
+    rca_rc = np.full(len(rca_names), -1, dtype=np.int8)
+    suite_rca = np.full(len(suites), -1, dtype=np.int32)
+    student_suite = np.full(asap_obj.total_students, -1, dtype=np.int32)
+    suite_offsets = np.zeros(len(suites) + 1, dtype=np.int32)
+    suite_members = []
+    for i, suite in enumerate(suites):
+        if suite.rca != UNALLOCATED:
+            suite_rca[i] = rca_to_index[suite.rca]
+            rca_rc[suite_rca[i]] = rc_names.index(suite.rc)
+        for student in suite.students:
+            student_suite[student.data.index] = i
+            suite_members.append(student.data.index)
+        suite_offsets[i + 1] = len(suite_members)
+    score_names = list(asap_obj.suite_scores)
+    suite_scores = np.empty((len(suites), len(score_names)), dtype=np.float64)
+    for j, name in enumerate(score_names):
+        suite_scores[:, j] = asap_obj.suite_scores[name]
+    np.savez_compressed(
+        filepath,
+        format_version=np.array(FORMAT_VERSION),
+        student_matric=np.array(asap_obj.students_df[asap_obj.ID.col], dtype=str),
+        student_suite=student_suite,
+        suite_offsets=suite_offsets,
+        suite_members=np.array(suite_members, dtype=np.int32),
+        suite_names=np.array([repr(suite) for suite in suites], dtype=str),
+        suite_sex=np.array(["F" if id(suite) in female_suites else "M" for suite in suites], dtype="U1"),
+        suite_accessibility=np.array([suite.accessibility for suite in suites], dtype=bool),
+        suite_rca=suite_rca,
+        rca_names=np.array(rca_names, dtype=str),
+        rca_rc=rca_rc,
+        rc_names=np.array(rc_names, dtype=str),
+        score_names=np.array(score_names, dtype=str),
+        score_integral=np.array([asap_obj.suite_scores[name].dtype.kind in "iu" for name in score_names], dtype=bool),
+        suite_scores=suite_scores,
+        config=np.array(json.dumps(asap_obj.config(), ensure_ascii=False)),
+        seed=np.array([] if asap_obj.seed is None else [asap_obj.seed], dtype=np.int64),
+        datetime=np.array(asap_obj.datetime or ""),
+    )
+
+
+def load_artifact(filepath) -> AllocationArtifact:
+    """Loads an allocation artifact that was saved with save_artifact().
+
+    Raises:
+        ValueError: The file is not an allocation artifact, or was saved in a newer format.
+    """
+    try:
+        npz = np.load(filepath, allow_pickle=False)
+    except (ValueError, zipfile.BadZipFile):
+        npz = None
+    arrays = {}
+    if isinstance(npz, np.lib.npyio.NpzFile):  # Not a single .npy array
+        with npz:
+            arrays = {name: npz[name] for name in npz.files}
+    if "format_version" not in arrays:
+        raise ValueError(f"{filepath} is not an allocation file.")
+    if int(arrays["format_version"]) > FORMAT_VERSION:
+        raise ValueError(f"{filepath} was saved by a newer version of this program.")
+    return AllocationArtifact(arrays)
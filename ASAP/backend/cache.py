@@ -0,0 +1,119 @@
+"""This module provides an on-disk cache of completed allocations.
+
+Allocations are stored as allocation artifacts (see artifact.py) under a key that is a hash of the bytes of the CSV file
+and the full configuration, including the number of restarts and the seed. Running an allocation again with the same
+data and configuration loads the stored artifact instead of redoing the computation. Once the cache is larger than
+max_bytes, the least recently used allocations are deleted.
+
+    Typical usage example:
+
+    cache = AllocationCache(folder_path)
+    asap_obj.run_allocation(cache=cache)
+"""
+
+import glob
+import hashlib
+import json
+import os
+import uuid
+from typing import Any, Dict, Optional
+
+from ASAP.backend import artifact
+
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+def file_hash(filepath) -> str:
+    """Returns the SHA-256 hash of the contents of a file."""
+    sha256 = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def cache_key(input_hash, config: Dict[str, Any]) -> str:
+    """Returns the cache key of an allocation.
+
+    Args:
+        input_hash: A string representing the hash of the CSV file (see file_hash()).
+        config: A dictionary of the configuration, in the same format as the one returned by ASAP.config().
+    """
+    sha256 = hashlib.sha256()
+    sha256.update(input_hash.encode())
+    sha256.update(json.dumps(config, sort_keys=True).encode())
+    sha256.update(str(artifact.FORMAT_VERSION).encode())
+    return sha256.hexdigest()
+
+
+class AllocationCache:
+    """Stores the allocation artifacts of completed allocations, evicting the least recently used ones
+
+    Attributes:
+        folder_path: A string representing the folder that the artifacts are stored in.
+        max_bytes: An integer representing the maximum total size of the artifacts.
+    """
+
+    def __init__(self, folder_path, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder_path = folder_path
+        self.max_bytes = max_bytes
+
+    def __contains__(self, key):
+        return os.path.exists(self._filepath(key))
+
+    def get(self, key) -> Optional[str]:
+        """Returns the path of the artifact stored under a key, or None if there is none."""
+        filepath = self._filepath(key)
+        try:
+            # The modification time records when the artifact was last used
+            os.utime(filepath)
+        except FileNotFoundError:
+            return None
+        return filepath
+
+    def put(self, key, asap_obj):
+        """Stores the artifact of a completed allocation under a key, then evicts artifacts if the cache is too big."""
+        os.makedirs(self.folder_path, exist_ok=True)
+        # Write to a temporary file first so that a crash never leaves a half-written artifact behind
+        tmp_filepath = os.path.join(self.folder_path, f"{key}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_filepath, "wb") as f:
+            artifact.save_artifact(asap_obj, f)
+        os.replace(tmp_filepath, self._filepath(key))
+        self.evict()
+
+    def discard(self, key):
+        """Deletes the artifact stored under a key, if there is one."""
+        try:
+            os.remove(self._filepath(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Deletes the least recently used artifacts until the cache is no larger than max_bytes.
+
+        The most recently used artifact is always kept.
+        """
+        entries = []
+        for filepath in glob.glob(os.path.join(self.folder_path, "*.npz")):
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:  # Deleted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filepath))
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, filepath in entries[:-1]:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def clear(self):
+        for filepath in glob.glob(os.path.join(self.folder_path, "*.npz")):
+            os.remove(filepath)
+
+    def _filepath(self, key):
+        return os.path.join(self.folder_path, f"{key}.npz")
@@ -0,0 +1,126 @@
+"""This module provides checkpoints of the restarts of an allocation, so that it can be resumed.
+
+After every restart, the number of restarts completed and the state of the random number generator are saved, and the
+best allocation so far is saved whenever it improves. If the program is closed before the allocation finishes, running
+the allocation again with the same configuration continues from the last completed restart instead of starting over.
+
+    Typical usage example:
+
+    checkpoint = RestartCheckpoint(folder_path, asap_obj.config())
+    asap_obj.run_allocation(checkpoint=checkpoint)
+"""
+
+import gzip
+import json
+import os
+import pickle
+import shutil
+from typing import Any, Dict, Optional
+
+CONFIG_FILENAME = "config.json"
+
+
+class PhaseCheckpoint:
+    """Contains the saved progress of the restarts of one phase (e.g. the female suites)
+
+    Attributes:
+        completed: An integer representing the number of restarts completed.
+        best_score: A float representing the best global score so far.
+        best_suites: A list of the suites of the best allocation so far.
+        rng_state: The state of the random number generator after the last completed restart.
+        restart_stats: A streaming.RestartStats object of the global scores of the completed restarts, or None if the
+            checkpoint was saved without it.
+    """
+
+    def __init__(self, completed, best_score, best_suites, rng_state, restart_stats=None):
+        self.completed: int = completed
+        self.best_score: float = best_score
+        self.best_suites: list = best_suites
+        self.rng_state = rng_state
+        self.restart_stats = restart_stats
+
+
+class RestartCheckpoint:
+    """Saves and loads the progress of the restarts of an allocation
+
+    Attributes:
+        folder_path: A string representing the folder that the checkpoint is written to.
+        config: A JSON-serialisable dictionary of the configuration of the allocation. A checkpoint that was saved with
+            a different configuration is discarded.
+    """
+
+    def __init__(self, folder_path, config: Dict[str, Any]):
+        self.folder_path = folder_path
+        self.config = config
+        self._valid = None
+
+    def load(self, name) -> Optional[PhaseCheckpoint]:
+        """Returns the saved progress of a phase, or None if there is none for this configuration."""
+        if not self.is_valid():
+            return None
+        try:
+            # Checkpoints saved before restart statistics were added do not have them
+            completed, best_score, rng_state, *restart_stats = _read(self._filepath(name, "progress"))
+            best_suites = _read(self._filepath(name, "best"))
+        except FileNotFoundError:
+            return None
+        return PhaseCheckpoint(completed, best_score, best_suites, rng_state, *restart_stats)
+
+    def save(self, name, completed, best_score, rng_state, best_suites=None, restart_stats=None):
+        """Saves the progress of a phase after a restart.
+
+        Args:
+            name: A string representing the phase.
+            completed: An integer representing the number of restarts completed.
+            best_score: A float representing the best global score so far.
+            rng_state: The state of the random number generator.
+            best_suites: (optional) The suites of the best allocation so far. Only pass this when it has improved.
+            restart_stats: (optional) A streaming.RestartStats object of the global scores of the completed restarts.
+        """
+        if not self.is_valid():
+            self.clear()
+            os.makedirs(self.folder_path, exist_ok=True)
+            with open(os.path.join(self.folder_path, CONFIG_FILENAME), "w") as f:
+                json.dump(self.config, f)
+            self._valid = True
+        if best_suites is not None:
+            _write(self._filepath(name, "best"), best_suites)
+        _write(self._filepath(name, "progress"), (completed, best_score, rng_state, restart_stats))
+
+    def restarts_completed(self) -> int:
+        """Returns the total number of restarts saved for this configuration."""
+        total = 0
+        if self.is_valid():
+            for filename in os.listdir(self.folder_path):
+                if filename.endswith(".progress.pickle.gz"):
+                    total += _read(os.path.join(self.folder_path, filename))[0]
+        return total
+
+    def is_valid(self):
+        if self._valid is None:
+            try:
+                with open(os.path.join(self.folder_path, CONFIG_FILENAME)) as f:
+                    self._valid = json.load(f) == self.config
+            except (FileNotFoundError, ValueError):
+                self._valid = False
+        return self._valid
+
+    def clear(self):
+        shutil.rmtree(self.folder_path, ignore_errors=True)
+        self._valid = False
+
+    def _filepath(self, name, kind):
+        return os.path.join(self.folder_path, f"{name}.{kind}.pickle.gz")
+
+
+def _write(filepath, obj):
+    # Write to a temporary file first so that a crash never leaves a half-written checkpoint behind
+    tmp_filepath = filepath + ".tmp"
+    with gzip.open(tmp_filepath, "wb", compresslevel=1) as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_filepath, filepath)
+
+
+def _read(filepath):
+    with gzip.open(filepath, "rb") as f:
+        return pickle.load(f)
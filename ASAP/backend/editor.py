@@ -0,0 +1,359 @@
+"""This module provides manual changes to a finished allocation, with the change in score of every suite they affect.
+
+Staff can swap two students of the same sex between their suites, or move a student to a suite with a vacancy. Before
+a change is applied, it can be previewed: the success score of both suites (see scoring.calculate_success(), higher is
+better) and the score of both RCA groups (see scoring.calculate_rca_score(), lower is better) are calculated before and
+after the change, together with any constraints that the affected suites break.
+
+The scores are calculated from aggregates of each suite and RCA group (the counts of citizenships, countries, schools
+and RCs, and the sum of the differences between every pair of students in each living preference), which are updated
+for the students that move rather than recalculated from every student. The aggregates are kept between changes, so a
+preview only looks at the students of the suites involved.
+
+    Typical usage example:
+
+    editor = AllocationEditor(female_suites, male_suites)
+    change = editor.preview("A0000001", "A0000002")
+    if not change.violations:
+        editor.apply("A0000001", "A0000002")
+"""
+
+import collections
+import math
+from typing import Dict, List, Optional
+
+from ASAP.backend import artifact
+from ASAP.backend import match
+from ASAP.backend import scoring
+from ASAP.backend.student import Citizenship, StudentData
+
+RC_LIST = ("Saga", "Elm", "Cendana")
+
+
+class GroupAggregate:
+    """Contains the aggregates of a group of students (a suite or an RCA group) that its scores are calculated from
+
+    Attributes:
+        students: A list of StudentData objects.
+        num_locals: An integer representing the number of local students.
+        countries: A Counter of the overseas countries of the students.
+        schools: A Counter of the schools of the students.
+        rcs: A Counter of the number of students that can live in each RC.
+        pref_sums: A dictionary mapping each living preference to the sum of the square roots of the differences
+            between every pair of students (see scoring.pairwise_root_diff()).
+    """
+
+    def __init__(self, students: List[StudentData]):
+        self.students = []
+        self.num_locals = 0
+        self.countries = collections.Counter()
+        self.schools = collections.Counter()
+        self.rcs = collections.Counter()
+        self.pref_sums = {living_pref: 0.0 for living_pref in scoring.Scores.get_weights()}
+        for student in students:
+            self.add(student)
+
+    def copy(self) -> "GroupAggregate":
+        aggregate = GroupAggregate([])
+        aggregate.students = self.students.copy()
+        aggregate.num_locals = self.num_locals
+        aggregate.countries = self.countries.copy()
+        aggregate.schools = self.schools.copy()
+        aggregate.rcs = self.rcs.copy()
+        aggregate.pref_sums = self.pref_sums.copy()
+        return aggregate
+
+    def changed(self, removed: StudentData = None, added: StudentData = None) -> "GroupAggregate":
+        """Returns a copy of the aggregate with one student removed and/or one student added."""
+        aggregate = self.copy()
+        if removed is not None:
+            aggregate.remove(removed)
+        if added is not None:
+            aggregate.add(added)
+        return aggregate
+
+    def add(self, student: StudentData):
+        for living_pref in self.pref_sums:
+            value = student.living_prefs[living_pref]
+            self.pref_sums[living_pref] += sum(math.sqrt(abs(value - other.living_prefs[living_pref]))
+                                               for other in self.students)
+        self.students.append(student)
+        self._count(student, 1)
+
+    def remove(self, student: StudentData):
+        self.students.remove(student)
+        for living_pref in self.pref_sums:
+            value = student.living_prefs[living_pref]
+            self.pref_sums[living_pref] -= sum(math.sqrt(abs(value - other.living_prefs[living_pref]))
+                                               for other in self.students)
+        self._count(student, -1)
+
+    def _count(self, student: StudentData, n):
+        self.num_locals += n if student.citizenship == Citizenship.LOCAL else 0
+        self.countries.update({country: n for country in student.country if country != "Singapore"})
+        self.schools.update({student.school: n})
+        self.rcs.update({rc: n for rc in set(student.available_rcs)})
+        # Counter.update() keeps counts of 0, which would be counted as distinct values
+        for counter in (self.countries, self.schools, self.rcs):
+            for key in [key for key, count in counter.items() if count <= 0]:
+                del counter[key]
+
+    def allowable_rcs(self):
+        """Returns the set of RCs that every student can live in."""
+        return {rc for rc in RC_LIST if self.rcs[rc] == len(self.students)}
+
+    def pref_score(self, higher_better=False) -> float:
+        # The same as scoring.living_pref_scores(), with the pairwise sums kept from before
+        num_pairs = math.comb(len(self.students), 2)
+        score = 0
+        for living_pref, weight in scoring.Scores.get_weights().items():
+            pref_score = self.pref_sums[living_pref] / num_pairs / scoring.Scores.get_max(living_pref)
+            score += (1 - pref_score if higher_better else pref_score) * weight
+        return score
+
+    def success_score(self) -> Optional[float]:
+        """Returns the success score of the group as a suite (see scoring.calculate_success()), or None if it has fewer
+        than two students."""
+        if len(self.students) < 2:
+            return None
+        num_duplicate_countries = sum(self.countries.values()) - len(self.countries)
+        demographic_score = scoring.combine_demographic_scores(
+            scoring.lookup_citizenship_diversity(self.num_locals, len(self.students) - self.num_locals),
+            scoring.lookup_duplicates(scoring.COUNTRY_DIVERSITY, num_duplicate_countries),
+            scoring.lookup_duplicates(scoring.SCHOOL_DIVERSITY, len(self.students) - len(self.schools)))
+        return scoring.combine_success_scores(demographic_score, self.pref_score(higher_better=True))
+
+    def rca_score(self, demographic_weight=0.8) -> Optional[float]:
+        """Returns the score of the group as an RCA group (see scoring.calculate_rca_score()), or None if it has fewer
+        than two students."""
+        if len(self.students) < 2:
+            return None
+        num_locals = self.num_locals
+        num_intls = len(self.students) - num_locals
+        if num_locals <= scoring.MAX_GROUP_SIZE and num_intls <= scoring.MAX_GROUP_SIZE:
+            citizenship_diversity = scoring.RCA_CITIZENSHIP_DIVERSITY[num_locals][num_intls]
+        else:
+            citizenship_diversity = abs(num_locals - num_intls) / 2
+        demographic_score = (0.4 * citizenship_diversity
+                             + 0.3 * scoring.lookup_rca_duplicates(sum(self.countries.values()), len(self.countries))
+                             + 0.3 * scoring.lookup_rca_duplicates(len(self.students), len(self.schools)))
+        if (num_locals == 7 and num_intls == 4) or (num_locals == 8 and num_intls == 4):
+            demographic_score += 2000
+        if len(scoring.SOUTH_ASIAN_COUNTRIES.intersection(self.countries)) > 1:
+            demographic_score += 2000
+        if "China" not in self.countries:
+            demographic_score += 2000
+        score = demographic_weight * demographic_score + (1 - demographic_weight) * self.pref_score()
+        if not self.allowable_rcs():
+            score += 2000
+        return score
+
+
+class Change:
+    """Contains the effect of a manual change to an allocation
+
+    Attributes:
+        description: A string describing the change.
+        suites: A list of dictionaries with the name ("name"), score before ("before"), score after ("after") and
+            change in score ("delta") of each suite that the change affects. Scores are None for suites with fewer than
+            two students.
+        rca_groups: A list of dictionaries in the same format for each RCA group that the change affects.
+        violations: A list of dictionaries with the suite ("suite") and description ("message") of every constraint
+            that an affected suite breaks after the change, and whether it is broken because of the change ("new").
+    """
+
+    def __init__(self, description):
+        self.description = description
+        self.suites = []
+        self.rca_groups = []
+        self.violations = []
+
+    def as_dict(self):
+        return {"description": self.description, "suites": self.suites, "rca_groups": self.rca_groups,
+                "violations": self.violations}
+
+
+class AllocationEditor:
+    """Previews and applies manual changes to the suites of a finished allocation
+
+    Attributes:
+        suites: A list of SuiteAllocation.SuiteData objects (the male suites followed by the female suites, as in
+            ASAP.suites). Changes are made to these objects.
+        changes: A list of the descriptions of the changes that have been applied.
+    """
+
+    def __init__(self, female_suites, male_suites):
+        self.suites = male_suites + female_suites
+        self.changes: List[str] = []
+        # Suites and students are referred to by their index and Matric/ID rather than by the objects, which are
+        # copied when the ASAP object is saved and restored
+        self._num_male_suites = len(male_suites)
+        self._suite_index = {str(suite.suite_num): i for i, suite in enumerate(self.suites)}
+        self._students: Dict[str, "match.SuiteRound.StudentMatchee"] = {}
+        self._suite_of: Dict[str, int] = {}
+        for i, suite in enumerate(self.suites):
+            for student in suite.students:
+                self._students[str(student.data.matric)] = student
+                self._suite_of[str(student.data.matric)] = i
+        # The female suite of each RCA group is listed first, as in the RCA match
+        self._rca_groups = collections.defaultdict(list)
+        for i in sorted(range(len(self.suites)), key=lambda i: not self._is_female(i)):
+            if self.suites[i].rca not in (None, artifact.UNALLOCATED):
+                self._rca_groups[self.suites[i].rca].append(i)
+        self._suite_aggregates: Dict[int, GroupAggregate] = {}
+        self._rca_aggregates: Dict[str, GroupAggregate] = {}
+
+    def preview(self, student_id, other) -> Change:
+        """Returns the effect of a change without applying it.
+
+        Args:
+            student_id: A string representing the Matric/ID of a student.
+            other: A string representing either the Matric/ID of another student of the same sex, to swap the two
+                students, or the name of a suite with a vacancy, to move the student there.
+
+        Raises:
+            ValueError: If the student or the other student or suite does not exist, or the change is not possible.
+        """
+        student, other_student, i, j = self._resolve(student_id, other)
+        suite, other_suite = self.suites[i], self.suites[j]
+        if other_student is None:
+            change = Change(f"Moved {student.data.matric} from {suite.suite_num} to {other_suite.suite_num}")
+        else:
+            change = Change(f"Swapped {student.data.matric} ({suite.suite_num}) with {other_student.data.matric} "
+                            f"({other_suite.suite_num})")
+        other_data = other_student.data if other_student else None
+        # Both suites have students of the same sex, so they are never in the same RCA group
+        for k, removed, added in ((i, student.data, other_data), (j, other_data, student.data)):
+            name = str(self.suites[k].suite_num)
+            before = self._suite_aggregate(k)
+            after = before.changed(removed, added)
+            change.suites.append(_delta(name, before.success_score(), after.success_score()))
+            old_violations = self._violations(self.suites[k], before)
+            for message in self._violations(self.suites[k], after):
+                change.violations.append({"suite": name, "message": message, "new": message not in old_violations})
+            rca = self.suites[k].rca
+            if rca in self._rca_groups:
+                before = self._rca_aggregate(rca)
+                after = before.changed(removed, added)
+                change.rca_groups.append(_delta(rca, before.rca_score(), after.rca_score()))
+        return change
+
+    def apply(self, student_id, other) -> Change:
+        """Applies a change to the suites (see preview()) and returns its effect."""
+        change = self.preview(student_id, other)
+        student, other_student, i, j = self._resolve(student_id, other)
+        suite, other_suite = self.suites[i], self.suites[j]
+        if other_student is None:
+            suite.students.remove(student)
+            other_suite.students.append(student)
+            suite.vacancies += 1
+            other_suite.vacancies -= 1
+            student.current_choice = match.SuiteRound.SuiteMatchee(other_suite)
+        else:
+            suite.students[suite.students.index(student)] = other_student
+            other_suite.students[other_suite.students.index(other_student)] = student
+            student.current_choice, other_student.current_choice = other_student.current_choice, student.current_choice
+            self._suite_of[str(other_student.data.matric)] = i
+        self._suite_of[str(student.data.matric)] = j
+        for k in (i, j):
+            self.suites[k].allowable_rcs = _allowable_rcs(self.suites[k].students)
+            # Recalculated from the students rather than updated, so that rounding errors do not build up
+            self._suite_aggregates.pop(k, None)
+            self._rca_aggregates.pop(self.suites[k].rca, None)
+        self.changes.append(change.description)
+        return change
+
+    def changed_students(self, student_id, other) -> Dict[int, list]:
+        """Returns the students that the suites affected by a change would have after it, without applying it.
+
+        Returns:
+            A dictionary mapping the index (in self.suites) of each affected suite to a list of its students.
+        """
+        student, other_student, i, j = self._resolve(student_id, other)
+        if other_student is None:
+            return {i: [s for s in self.suites[i].students if s is not student], j: self.suites[j].students + [student]}
+        return {i: [other_student if s is student else s for s in self.suites[i].students],
+                j: [student if s is other_student else s for s in self.suites[j].students]}
+
+    def _resolve(self, student_id, other):
+        student = self._student(student_id)
+        i = self._suite_of[str(student.data.matric)]
+        other = str(other)
+        if other in self._students:
+            other_student = self._student(other)
+            j = self._suite_of[other]
+            if i == j:
+                raise ValueError(f"{student.data.matric} and {other_student.data.matric} are already in the same "
+                                 f"suite.")
+        elif other in self._suite_index:
+            other_student = None
+            j = self._suite_index[other]
+            if i == j:
+                raise ValueError(f"{student.data.matric} is already in {other}.")
+            if len(self.suites[j].students) >= self.suites[j].capacity:
+                raise ValueError(f"{other} has no vacancies.")
+            # The scores of a suite are only defined for two or more students
+            if len(self.suites[i].students) <= 2:
+                raise ValueError(f"{self.suites[i].suite_num} would have fewer than two students.")
+        else:
+            raise ValueError(f"There is no student or suite called {other}.")
+        if self._is_female(i) != self._is_female(j):
+            raise ValueError("Students can only be moved between suites of the same sex.")
+        return student, other_student, i, j
+
+    def _is_female(self, i):
+        return i >= self._num_male_suites
+
+    def _student(self, student_id):
+        try:
+            return self._students[str(student_id)]
+        except KeyError:
+            raise ValueError(f"There is no student with the Matric/ID {student_id}.")
+
+    def _suite_aggregate(self, i) -> GroupAggregate:
+        if i not in self._suite_aggregates:
+            self._suite_aggregates[i] = GroupAggregate([student.data for student in self.suites[i].students])
+        return self._suite_aggregates[i]
+
+    def _rca_aggregate(self, rca) -> GroupAggregate:
+        if rca not in self._rca_aggregates:
+            self._rca_aggregates[rca] = GroupAggregate([student.data for i in self._rca_groups[rca]
+                                                        for student in self.suites[i].students])
+        return self._rca_aggregates[rca]
+
+    @staticmethod
+    def _violations(suite, aggregate: GroupAggregate) -> List[str]:
+        """Returns a description of every constraint that a suite would break with the students of an aggregate."""
+        violations = []
+        if suite.rc not in (None, artifact.UNALLOCATED):
+            for student in aggregate.students:
+                if suite.rc not in student.available_rcs:
+                    violations.append(f"{student.matric} cannot live in {suite.rc}")
+        a11y_students = [student.matric for student in aggregate.students if student.accessibility]
+        if len(a11y_students) > 1:
+            violations.append(f"More than one accessibility student: {', '.join(a11y_students)}")
+        elif a11y_students and not suite.accessibility:
+            violations.append(f"{a11y_students[0]} needs an accessibility suite")
+        duplicate_countries = sorted(country for country, count in aggregate.countries.items() if count > 1)
+        if duplicate_countries:
+            violations.append(f"More than one student from {', '.join(duplicate_countries)}")
+        duplicate_schools = sorted(str(school) for school, count in aggregate.schools.items() if count > 1)
+        if duplicate_schools:
+            violations.append(f"More than one student from {', '.join(duplicate_schools)}")
+        if len(scoring.SOUTH_ASIAN_COUNTRIES.intersection(aggregate.countries)) > 1:
+            violations.append("Students from more than one South Asian country")
+        if len(scoring.NON_ASIAN_COUNTRIES.intersection(aggregate.countries)) > 1:
+            violations.append("Students from more than one non-Asian country")
+        return violations
+
+
+def _delta(name, before, after):
+    return {"name": name, "before": before, "after": after,
+            "delta": after - before if before is not None and after is not None else None}
+
+
+def _allowable_rcs(students):
+    rcs = set(RC_LIST)
+    for student in students:
+        rcs.intersection_update(student.data.available_rcs)
+    return rcs
@@ -0,0 +1,142 @@
+"""This module provides an exact mode for small suite rounds, which solves them as mixed-integer linear programs.
+
+In a suite round, every student of a batch is matched to a different suite with a vacancy, and the Gale-Shapley
+algorithm finds a stable match between them. Each suite gains at most one student per round, so the score of a suite
+after the round is the score of its new student (scoring.calculate_score()), and the total score of the round is linear
+in the choice of pairs. For a small round, the pairs with the lowest total score can be found exactly with a
+mixed-integer linear program (MILP):
+
+    * A binary variable for every pair of a student and a suite that the student is allowed to join, i.e. the student
+      can live in one of the suite's allowable RCs, no other student in the suite has the same school or overseas
+      country, the suite would not have students from more than one South Asian or non-Asian country, and (for an
+      accessibility student) the suite is not an accessibility suite and has two vacancies.
+    * Every student joins exactly one suite, and every suite gains at most one student.
+    * The objective is the sum of the scores of the chosen pairs.
+
+The MILP is solved with scipy.optimize.milp, which is an optional dependency. The exact mode is off unless a maximum
+number of students is set, and then it is only used for rounds with at most that many students. If SciPy is not
+installed, the MILP has no solution (e.g. a student cannot join any suite without breaking a constraint) or it is not
+solved within the time limit, the round falls back to the Gale-Shapley algorithm. A warning is printed (once) when the
+exact mode is turned on without SciPy, as the configuration still says that it is on.
+
+    Typical usage example:
+
+    exact_mode = ExactMode(max_students=40, time_limit=5)
+    student_results = match.SuiteRound(students, suites, exact_mode=exact_mode).run_match()
+"""
+
+import importlib.util
+import sys
+from typing import List, Optional
+
+from ASAP.backend import scoring
+from ASAP.backend import util
+
+np = util.LazyModule("numpy")
+optimize = util.LazyModule("scipy.optimize")
+sparse = util.LazyModule("scipy.sparse")
+
+DEFAULT_TIME_LIMIT = 10
+
+_warned_unavailable = False
+
+
+def solver_available() -> bool:
+    return importlib.util.find_spec("scipy") is not None
+
+
+def warn_if_unavailable():
+    """Prints a warning to stderr if SciPy is not installed, the first time that this is called."""
+    global _warned_unavailable
+    if _warned_unavailable or solver_available():
+        return
+    _warned_unavailable = True
+    print("Warning: exact_max_students is set but SciPy is not installed, so every round falls back to the usual "
+          "matching (pip install scipy).", file=sys.stderr)
+
+
+class ExactMode:
+    """Contains the settings of the exact mode
+
+    Attributes:
+        max_students: An integer representing the largest number of students in a round that is solved exactly.
+        time_limit: A number representing the seconds that the solver may spend on a round before falling back to the
+            Gale-Shapley algorithm.
+    """
+
+    def __init__(self, max_students, time_limit=DEFAULT_TIME_LIMIT):
+        if max_students < 1:
+            raise ValueError("exact_max_students must be at least 1.")
+        if time_limit <= 0:
+            raise ValueError("exact_time_limit must be more than 0 seconds.")
+        self.max_students = max_students
+        self.time_limit = time_limit
+        warn_if_unavailable()
+
+    def applies(self, num_students) -> bool:
+        return num_students <= self.max_students
+
+
+def allowed(suite, student) -> bool:
+    """Returns whether a student can join a suite without breaking a constraint.
+
+    Args:
+        suite: A SuiteAllocation.SuiteData object.
+        student: A StudentData object.
+    """
+    if student.accessibility and (suite.accessibility or suite.vacancies < 2):
+        return False
+    if not suite.allowable_rcs.intersection(student.available_rcs):
+        return False
+    if any(other.data.school == student.school for other in suite.students):
+        return False
+    countries = [country for other in suite.students for country in other.data.country if country != "Singapore"]
+    new_countries = [country for country in student.country if country != "Singapore"]
+    if set(countries).intersection(new_countries) or len(new_countries) != len(set(new_countries)):
+        return False
+    countries = set(countries + new_countries)
+    if len(scoring.SOUTH_ASIAN_COUNTRIES.intersection(countries)) > 1:
+        return False
+    if len(scoring.NON_ASIAN_COUNTRIES.intersection(countries)) > 1:
+        return False
+    return True
+
+
+def solve_round(scores, allowed_pairs, time_limit=DEFAULT_TIME_LIMIT) -> Optional[List[int]]:
+    """Finds the match of a suite round with the lowest total score.
+
+    Args:
+        scores: An array with the score of every pair, with one row per suite and one column per student.
+        allowed_pairs: A boolean array of the same shape, True for the pairs that are allowed (see allowed()).
+        time_limit: (optional) The number of seconds that the solver may take.
+
+    Returns:
+        A list with the index of the suite of each student, or None if SciPy is not installed, there is no match that
+        only uses allowed pairs, or the solver did not prove the best match within the time limit.
+    """
+    if not solver_available():
+        return None
+    num_suites, num_students = scores.shape
+    suite_ids, student_ids = np.nonzero(allowed_pairs)
+    if len(set(student_ids.tolist())) < num_students:
+        return None
+    num_pairs = len(suite_ids)
+    # One row per student (joins exactly one suite), then one row per suite (gains at most one student). Each pair has
+    # exactly two non-zero entries, so the matrix is sparse.
+    constraints = sparse.csr_array((np.ones(2 * num_pairs),
+                                    (np.concatenate([student_ids, num_students + suite_ids]),
+                                     np.tile(np.arange(num_pairs), 2))),
+                                   shape=(num_students + num_suites, num_pairs))
+    lower_bounds = np.concatenate([np.ones(num_students), np.zeros(num_suites)])
+    result = optimize.milp(scores[suite_ids, student_ids],
+                           constraints=optimize.LinearConstraint(constraints, lower_bounds, np.ones(len(lower_bounds))),
+                           integrality=np.ones(num_pairs), bounds=optimize.Bounds(0, 1),
+                           options={"time_limit": time_limit})
+    # Status 0 means that the solution is proven to be optimal
+    if result.status != 0:
+        return None
+    chosen = result.x > 0.5
+    student_suites = [0] * num_students
+    for suite_id, student_id in zip(suite_ids[chosen].tolist(), student_ids[chosen].tolist()):
+        student_suites[student_id] = suite_id
+    return student_suites
@@ -0,0 +1,160 @@
+"""This module provides a pre-flight check that the available suites can house every student.
+
+The check models students -> suites -> RCs as a flow network. Students are grouped into classes that share the same
+sex, available RCs and accessibility requirement, and each class sends its students to the RCs it is allowed to live
+in. Every RC can only take as many students as its suites have beds, and every accessibility student additionally
+needs one of the RC's accessibility suites. If the maximum flow is smaller than the number of students, the minimum
+cut of the network names the smallest group of students that cannot be housed, together with the RCs that they are
+competing for.
+
+The network is a relaxation of the real allocation (it ignores single-sex suites and RCA pairing), so passing the
+check does not guarantee that an allocation will be found, but failing it guarantees that none exists.
+
+    Typical usage example:
+
+    report = check_feasibility(student_groups, rc_capacities)
+    if not report.feasible:
+        raise ValueError(report.explanation)
+"""
+
+import collections
+from typing import Dict, Hashable, List, Set, Tuple
+
+SOURCE = "source"
+SINK = "sink"
+INFINITY = float("inf")
+
+
+class FeasibilityReport:
+    """Contains the outcome of a feasibility check
+
+    Attributes:
+        feasible: A boolean indicating whether every student can be housed.
+        num_students: An integer representing the total number of students.
+        num_housed: An integer representing the maximum number of students that can be housed.
+        bottleneck_rcs: A list of RCs that are saturated in the minimum cut.
+        bottleneck_students: An integer representing the number of students competing for the bottleneck RCs.
+        explanation: A string explaining why the allocation is infeasible (empty if it is feasible).
+    """
+
+    def __init__(self, *, feasible, num_students, num_housed, bottleneck_rcs=None, bottleneck_students=0,
+                 explanation=""):
+        self.feasible: bool = feasible
+        self.num_students: int = num_students
+        self.num_housed: int = num_housed
+        self.bottleneck_rcs: List[str] = bottleneck_rcs or []
+        self.bottleneck_students: int = bottleneck_students
+        self.explanation: str = explanation
+
+    def __bool__(self):
+        return self.feasible
+
+    def __repr__(self):
+        return f"FeasibilityReport(feasible={self.feasible}, housed={self.num_housed}/{self.num_students})"
+
+
+def check_feasibility(student_groups: Dict[Tuple[str, Tuple[str, ...], bool], int],
+                      rc_capacities: Dict[str, Tuple[int, int]]) -> FeasibilityReport:
+    """Checks whether the available suites can house every student.
+
+    Args:
+        student_groups: A dictionary mapping (sex, available RCs, accessibility) to the number of students with that
+            combination.
+        rc_capacities: A dictionary mapping each RC to a tuple of (number of sextets, number of accessibility suites).
+
+    Returns:
+        A FeasibilityReport object.
+    """
+    capacity = collections.defaultdict(dict)
+
+    def add_edge(u, v, cap):
+        capacity[u][v] = capacity[u].get(v, 0) + cap
+        capacity[v].setdefault(u, 0)
+
+    for rc, (sextets, a11y_suites) in rc_capacities.items():
+        # An accessibility suite is always paired with a sextet from the same RC, and it has 5 usable rooms
+        usable_a11y_suites = min(a11y_suites, sextets)
+        add_edge(("rc", rc), SINK, 6 * sextets + 5 * usable_a11y_suites)
+        add_edge(("a11y", rc), ("rc", rc), usable_a11y_suites)
+
+    num_students = 0
+    for group, count in student_groups.items():
+        _, available_rcs, accessibility = group
+        num_students += count
+        add_edge(SOURCE, ("group", group), count)
+        for rc in available_rcs:
+            if rc in rc_capacities:
+                add_edge(("group", group), ("a11y", rc) if accessibility else ("rc", rc), INFINITY)
+
+    num_housed, source_side = max_flow(capacity, SOURCE, SINK)
+    if num_housed >= num_students:
+        return FeasibilityReport(feasible=True, num_students=num_students, num_housed=num_housed)
+
+    # The groups on the source side of the minimum cut can only reach the saturated RCs on the source side, and
+    # there are more of them than those RCs can take.
+    stuck_groups = [node[1] for node in source_side if node[0] == "group"]
+    stuck_students = sum(student_groups[group] for group in stuck_groups)
+    bottleneck_rcs = [rc for rc in rc_capacities if ("rc", rc) in source_side or ("a11y", rc) in source_side]
+    a11y_limited = [rc for rc in bottleneck_rcs if ("a11y", rc) in source_side and ("rc", rc) not in source_side]
+
+    descriptions = []
+    for sex, available_rcs, accessibility in sorted(stuck_groups, key=lambda g: (not g[2], g[0], g[1])):
+        count = student_groups[(sex, available_rcs, accessibility)]
+        kind = "accessibility " if accessibility else ""
+        descriptions.append(f"{count} {kind}{'female' if sex == 'F' else 'male'} student(s) who can only live in "
+                            f"{' or '.join(available_rcs) if available_rcs else 'no RC'}")
+    capacity_descriptions = []
+    for rc in bottleneck_rcs:
+        sextets, a11y_suites = rc_capacities[rc]
+        if rc in a11y_limited:
+            capacity_descriptions.append(f"{rc} ({min(a11y_suites, sextets)} usable accessibility suite(s))")
+        else:
+            capacity_descriptions.append(f"{rc} ({sextets} sextets, {a11y_suites} accessibility suites)")
+    explanation = (f"Only {num_housed} of {num_students} students can be housed with the suites available. "
+                   f"There are {stuck_students} students competing for "
+                   f"{', '.join(capacity_descriptions) if capacity_descriptions else 'no available RC'}: "
+                   f"{'; '.join(descriptions)}. Please increase the number of suites in these RCs or check the "
+                   f"available RCs of these students.")
+    return FeasibilityReport(feasible=False, num_students=num_students, num_housed=num_housed,
+                             bottleneck_rcs=bottleneck_rcs, bottleneck_students=stuck_students,
+                             explanation=explanation)
+
+
+def max_flow(capacity: Dict[Hashable, Dict[Hashable, float]], source, sink) -> Tuple[float, Set[Hashable]]:
+    """Computes the maximum flow from source to sink using the Edmonds-Karp algorithm.
+
+    The capacity dictionary is used as the residual graph and is modified in place.
+
+    Args:
+        capacity: A dictionary mapping each node to a dictionary of neighbouring nodes and edge capacities.
+        source: The source node.
+        sink: The sink node.
+
+    Returns:
+        A tuple of the value of the maximum flow and the set of nodes on the source side of the minimum cut.
+    """
+    total = 0
+    while True:
+        parents = {source: None}
+        queue = collections.deque([source])
+        while queue and sink not in parents:
+            u = queue.popleft()
+            for v, cap in capacity[u].items():
+                if cap > 0 and v not in parents:
+                    parents[v] = u
+                    queue.append(v)
+        if sink not in parents:
+            return total, set(parents)
+
+        bottleneck = INFINITY
+        v = sink
+        while parents[v] is not None:
+            bottleneck = min(bottleneck, capacity[parents[v]][v])
+            v = parents[v]
+        v = sink
+        while parents[v] is not None:
+            u = parents[v]
+            capacity[u][v] -= bottleneck
+            capacity[v][u] += bottleneck
+            v = u
+        total += bottleneck
@@ -0,0 +1,243 @@
+"""This module provides a local history of allocation runs, stored in an SQLite database.
+
+Every completed run is recorded with its configuration, seed, timings, a summary of its scores and its allocation
+artifact (see artifact.py), which holds the compact assignment arrays that the run can be reloaded from. Runs can then
+be listed and filtered by the CSV file they allocated (its hash), their configuration and their date, e.g. to compare
+this year's allocation with one from last week.
+
+The summaries and the artifacts are kept in separate tables, and the summaries are indexed by input hash, configuration
+and date, so listing runs never reads an artifact and stays fast with thousands of runs stored. The configuration is
+indexed without its seed, so runs that only differ in their seed have the same configuration hash.
+
+    Typical usage example:
+
+    history = RunHistory(database_path)
+    asap_obj.run_allocation(history=history)
+    for run in history.runs(input_hash=asap_obj.input_hash):
+        print(run.id, run.created_at, run.global_scores["All"])
+    asap_obj.load_allocation(history.allocation(run.id))
+"""
+
+import contextlib
+import datetime
+import hashlib
+import io
+import json
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+from ASAP.backend import artifact
+
+DEFAULT_LIMIT = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    csv_filename TEXT,
+    config_hash TEXT NOT NULL,
+    config TEXT NOT NULL,
+    seed INTEGER,
+    num_restarts INTEGER,
+    num_students INTEGER,
+    completed INTEGER NOT NULL,
+    total_seconds REAL,
+    phase_seconds TEXT NOT NULL,
+    female_score REAL,
+    male_score REAL,
+    global_score REAL,
+    score_summary TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_input ON runs (input_hash, created_at);
+CREATE INDEX IF NOT EXISTS runs_by_config ON runs (config_hash, created_at);
+CREATE INDEX IF NOT EXISTS runs_by_date ON runs (created_at);
+CREATE TABLE IF NOT EXISTS allocations (
+    run_id INTEGER PRIMARY KEY REFERENCES runs (id) ON DELETE CASCADE,
+    artifact BLOB NOT NULL
+);
+"""
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    """Returns the hash of a configuration (in the format returned by ASAP.config()), ignoring its seed."""
+    config = {name: value for name, value in config.items() if name != "seed"}
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+class RunRecord:
+    """Contains the summary of a run in the history
+
+    Attributes:
+        id: An integer identifying the run.
+        created_at: A string representing when the run was recorded, in ISO 8601 format (local time).
+        input_hash: A string representing the hash of the CSV file (see cache.file_hash()).
+        csv_filename: A string representing the name of the CSV file.
+        config: A dictionary of the configuration, in the same format as the one returned by ASAP.config().
+        seed: An integer representing the random seed, or None if there was none.
+        num_restarts: An integer representing the number of restarts of each phase.
+        num_students: An integer representing the number of students.
+        completed: A boolean that is False if the run was stopped before all its restarts finished.
+        total_seconds: A float representing the wall time of the run, or None if it was not recorded.
+        phase_seconds: A dictionary mapping each phase of the run report to the seconds spent in it.
+        global_scores: A dictionary mapping "Female", "Male" and "All" to the mean final score of those suites.
+        score_summary: A dictionary mapping the name of each score of the suites (see scoring.suite_scores()) to a
+            dictionary of its "mean", "min" and "max".
+    """
+
+    COLUMNS = ("id", "created_at", "input_hash", "csv_filename", "config", "seed", "num_restarts", "num_students",
+               "completed", "total_seconds", "phase_seconds", "female_score", "male_score", "global_score",
+               "score_summary")
+
+    def __init__(self, row):
+        values = dict(zip(self.COLUMNS, row))
+        self.id: int = values["id"]
+        self.created_at: str = values["created_at"]
+        self.input_hash: str = values["input_hash"]
+        self.csv_filename: Optional[str] = values["csv_filename"]
+        self.config: Dict[str, Any] = json.loads(values["config"])
+        self.seed: Optional[int] = values["seed"]
+        self.num_restarts: Optional[int] = values["num_restarts"]
+        self.num_students: Optional[int] = values["num_students"]
+        self.completed = bool(values["completed"])
+        self.total_seconds: Optional[float] = values["total_seconds"]
+        self.phase_seconds: Dict[str, float] = json.loads(values["phase_seconds"])
+        self.global_scores = {"Female": values["female_score"], "Male": values["male_score"],
+                              "All": values["global_score"]}
+        self.score_summary: Dict[str, Dict[str, float]] = json.loads(values["score_summary"])
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in ("id", "created_at", "input_hash", "csv_filename", "config",
+                                                         "seed", "num_restarts", "num_students", "completed",
+                                                         "total_seconds", "phase_seconds", "global_scores",
+                                                         "score_summary")}
+
+
+class RunHistory:
+    """Records allocation runs in an SQLite database, and lists and reloads them
+
+    A new connection is opened for every operation, so one RunHistory object can be shared by several threads (e.g.
+    the allocation jobs of the GUI).
+
+    Attributes:
+        database_path: A string representing the path of the SQLite database. It is created if it does not exist.
+    """
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+        os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+        with self._connect() as connection:
+            # Write-ahead logging lets runs be listed while another run is being recorded
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.database_path, timeout=30)
+        try:
+            connection.execute("PRAGMA foreign_keys=ON")
+            with connection:  # Commits the transaction, or rolls it back if there is an error
+                yield connection
+        finally:
+            connection.close()
+
+    def record(self, asap_obj, completed=True) -> int:
+        """Records a completed allocation and returns the ID of its run.
+
+        Args:
+            asap_obj: The ASAP object of a completed allocation.
+            completed: (optional) A boolean that is False if the allocation was stopped before all its restarts
+                finished.
+        """
+        allocation = io.BytesIO()
+        artifact.save_artifact(asap_obj, allocation)
+        config = asap_obj.config()
+        # ASAP.suites contains the male suites followed by the female suites
+        final_scores = asap_obj.suite_scores["Final Score"]
+        num_male_suites = len(asap_obj.male_suites)
+        report = asap_obj.run_report
+        score_summary = {name: {"mean": float(scores.mean()), "min": float(scores.min()), "max": float(scores.max())}
+                         for name, scores in asap_obj.suite_scores.items() if len(scores)}
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO runs (created_at, input_hash, csv_filename, config_hash, config, seed, num_restarts, "
+                "num_students, completed, total_seconds, phase_seconds, female_score, male_score, global_score, "
+                "score_summary) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (datetime.datetime.now().isoformat(timespec="seconds"), asap_obj.input_hash, asap_obj.filename,
+                 config_hash(config), json.dumps(config, ensure_ascii=False), asap_obj.seed, asap_obj.num_restarts,
+                 asap_obj.total_students, completed, report.total_seconds if report else None,
+                 json.dumps(dict(report.phase_seconds) if report else {}),
+                 _mean(final_scores[num_male_suites:]), _mean(final_scores[:num_male_suites]), _mean(final_scores),
+                 json.dumps(score_summary)))
+            connection.execute("INSERT INTO allocations (run_id, artifact) VALUES (?, ?)",
+                               (cursor.lastrowid, allocation.getvalue()))
+            return cursor.lastrowid
+
+    def runs(self, input_hash=None, config: Dict[str, Any] = None, since: datetime.date = None,
+             until: datetime.date = None, limit=DEFAULT_LIMIT) -> List[RunRecord]:
+        """Returns the most recent runs that match the filters, newest first.
+
+        Args:
+            input_hash: (optional) A string representing the hash of a CSV file. Only runs of that file are returned.
+            config: (optional) A configuration. Only runs with the same configuration (apart from the seed) are
+                returned.
+            since: (optional) A date. Only runs recorded on or after it are returned.
+            until: (optional) A date. Only runs recorded on or before it are returned.
+            limit: (optional) An integer representing the maximum number of runs returned.
+        """
+        conditions = []
+        parameters = []
+        if input_hash is not None:
+            conditions.append("input_hash = ?")
+            parameters.append(input_hash)
+        if config is not None:
+            conditions.append("config_hash = ?")
+            parameters.append(config_hash(config))
+        if since is not None:
+            conditions.append("created_at >= ?")
+            parameters.append(since.isoformat())
+        if until is not None:
+            conditions.append("created_at < ?")
+            parameters.append((until + datetime.timedelta(days=1)).isoformat())
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        with self._connect() as connection:
+            rows = connection.execute(f"SELECT {', '.join(RunRecord.COLUMNS)} FROM runs {where}"
+                                      f"ORDER BY created_at DESC, id DESC LIMIT ?", (*parameters, limit)).fetchall()
+        return [RunRecord(row) for row in rows]
+
+    def get(self, run_id) -> RunRecord:
+        """Returns the summary of a run.
+
+        Raises:
+            ValueError: There is no run with the ID.
+        """
+        with self._connect() as connection:
+            row = connection.execute(f"SELECT {', '.join(RunRecord.COLUMNS)} FROM runs WHERE id = ?",
+                                     (run_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"There is no run {run_id} in the history.")
+        return RunRecord(row)
+
+    def allocation(self, run_id) -> io.BytesIO:
+        """Returns the allocation artifact of a run as a file object, which can be passed to ASAP.load_allocation().
+
+        Raises:
+            ValueError: There is no run with the ID.
+        """
+        with self._connect() as connection:
+            row = connection.execute("SELECT artifact FROM allocations WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"There is no run {run_id} in the history.")
+        allocation = io.BytesIO(row[0])
+        allocation.name = f"Run {run_id}"
+        return allocation
+
+    def delete(self, run_id):
+        """Deletes a run and its allocation from the history, if it is there."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+
+
+def _mean(scores) -> Optional[float]:
+    return float(scores.mean()) if len(scores) else None
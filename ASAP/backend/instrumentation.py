@@ -0,0 +1,231 @@
+"""This module provides low-overhead instrumentation of the phases of an allocation.
+
+A RunReport records the wall time spent in each phase (e.g. building the student objects, ranking, Gale-Shapley),
+counters (e.g. the number of calls to calculate_score) and the distribution of the global scores of the restarts of
+each phase (see streaming.RestartStats). Phases and counters are only recorded while a report is active
+in the current thread, so concurrent allocations in different threads each get their own report, and code that runs
+without a report pays almost nothing. Counters in hot loops are kept in local variables and added to the report once
+at the end, rather than on every iteration.
+
+Memory profiling is opt-in (RunReport(profile_memory=True)) because tracing allocations slows the allocation down
+severalfold. While it is on, tracemalloc records, for each phase, the peak memory allocated above what was allocated
+when the phase started and the memory that is still allocated when it ends (retained), and a background thread samples
+the resident set size (RSS) of the process. tracemalloc traces the whole process, so only one allocation should be
+profiled at a time. RSS is only sampled on Linux.
+
+    Typical usage example:
+
+    report = RunReport(profile_memory=True)
+    with recording(report):
+        with phase("Ranking"):
+            ...
+        count("Proposals", num_proposals)
+    print(report.as_dict())
+"""
+
+import collections
+import contextlib
+import os
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, Optional
+
+from ASAP.backend.streaming import RestartStats
+
+# Seconds between samples of the RSS while memory is being profiled
+RSS_SAMPLE_INTERVAL = 0.01
+
+_local = threading.local()
+
+
+class RunReport:
+    """Contains the time spent in each phase of an allocation and the counters recorded during it
+
+    Attributes:
+        phase_seconds: A dictionary mapping each phase to the total number of seconds spent in it.
+        phase_calls: A dictionary mapping each phase to the number of times it was entered.
+        counters: A dictionary mapping the name of each counter to its value.
+        total_seconds: A float representing the wall time of the whole allocation, or None if it was not recorded.
+        profile_memory: A boolean representing whether the memory used by each phase is recorded.
+        phase_memory: A dictionary mapping each phase to a dictionary with its largest peak_bytes, its total
+            retained_bytes and its largest peak_rss_bytes (None if the RSS could not be sampled).
+        peak_rss_bytes: An integer representing the largest RSS sampled while the report was recorded, or None.
+        restart_stats: A dictionary mapping each phase with restarts (e.g. "Female suites") to its RestartStats.
+    """
+
+    def __init__(self, profile_memory=False):
+        self.phase_seconds: Dict[str, float] = collections.defaultdict(float)
+        self.phase_calls: Dict[str, int] = collections.Counter()
+        self.counters: Dict[str, int] = collections.Counter()
+        self.total_seconds: Optional[float] = None
+        self.profile_memory = profile_memory
+        self.phase_memory: Dict[str, Dict[str, Optional[int]]] = {}
+        self.peak_rss_bytes: Optional[int] = None
+        self.restart_stats: Dict[str, RestartStats] = {}
+        self._memory_frames = []
+
+    def add_time(self, name, seconds):
+        self.phase_seconds[name] += seconds
+        self.phase_calls[name] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def merge(self, other: "RunReport"):
+        """Adds the phases and counters of another report (e.g. one recorded in a worker process) to this one."""
+        for name, seconds in other.phase_seconds.items():
+            self.phase_seconds[name] += seconds
+        self.phase_calls.update(other.phase_calls)
+        self.counters.update(other.counters)
+        for name, memory in other.phase_memory.items():
+            self._add_memory(name, memory["peak_bytes"], memory["retained_bytes"], memory["peak_rss_bytes"])
+        self.peak_rss_bytes = _max(self.peak_rss_bytes, other.peak_rss_bytes)
+        self.restart_stats.update(other.restart_stats)
+
+    def enter_memory_phase(self) -> "MemoryFrame":
+        """Starts measuring the memory used by a phase. Phases can be nested."""
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        # Resetting the peak would lose the peaks of the phases that this one is nested in, so they are updated first
+        for frame in self._memory_frames:
+            frame.peak_bytes = max(frame.peak_bytes, peak_bytes)
+        tracemalloc.reset_peak()
+        frame = MemoryFrame(current_bytes, current_rss())
+        self._memory_frames.append(frame)
+        return frame
+
+    def exit_memory_phase(self, name, frame: "MemoryFrame"):
+        """Records the memory used by a phase that was started with enter_memory_phase()."""
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        self._memory_frames.remove(frame)
+        frame.peak_bytes = max(frame.peak_bytes, peak_bytes)
+        for parent in self._memory_frames:
+            parent.peak_bytes = max(parent.peak_bytes, frame.peak_bytes)
+        frame.sample_rss(current_rss())
+        self._add_memory(name, frame.peak_bytes - frame.start_bytes, current_bytes - frame.start_bytes,
+                         frame.peak_rss_bytes)
+
+    def sample_rss(self, rss_bytes):
+        self.peak_rss_bytes = _max(self.peak_rss_bytes, rss_bytes)
+        for frame in list(self._memory_frames):
+            frame.sample_rss(rss_bytes)
+
+    def _add_memory(self, name, peak_bytes, retained_bytes, peak_rss_bytes):
+        memory = self.phase_memory.setdefault(name, {"peak_bytes": 0, "retained_bytes": 0, "peak_rss_bytes": None})
+        memory["peak_bytes"] = max(memory["peak_bytes"], peak_bytes)
+        memory["retained_bytes"] += retained_bytes
+        memory["peak_rss_bytes"] = _max(memory["peak_rss_bytes"], peak_rss_bytes)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Returns the report as a JSON-serialisable dictionary, with the phases in the order they were first entered."""
+        return {
+            "total_seconds": self.total_seconds,
+            "phases": [{"name": name, "seconds": seconds, "calls": self.phase_calls[name],
+                        **self.phase_memory.get(name, {})}
+                       for name, seconds in self.phase_seconds.items()],
+            "counters": dict(self.counters),
+            "profile_memory": self.profile_memory,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "restarts": {name: stats.as_dict() for name, stats in self.restart_stats.items()},
+        }
+
+
+class MemoryFrame:
+    """Contains the memory measurements of a phase that is in progress"""
+
+    def __init__(self, start_bytes, rss_bytes):
+        self.start_bytes = start_bytes
+        self.peak_bytes = start_bytes
+        self.peak_rss_bytes = rss_bytes
+
+    def sample_rss(self, rss_bytes):
+        self.peak_rss_bytes = _max(self.peak_rss_bytes, rss_bytes)
+
+
+def _max(a, b):
+    # Like max(), but ignores values that are None (e.g. RSS on platforms where it cannot be sampled)
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def current_rss() -> Optional[int]:
+    """Returns the resident set size of this process in bytes, or None if it cannot be read on this platform."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def active() -> Optional[RunReport]:
+    """Returns the report that is being recorded in the current thread, or None if there is none."""
+    return getattr(_local, "report", None)
+
+
+@contextlib.contextmanager
+def recording(report: RunReport):
+    """Records the phases and counters of the current thread to a report while the context is active."""
+    previous = active()
+    _local.report = report
+    profiling = report.profile_memory and previous is not report
+    if profiling:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        stop_sampling = threading.Event()
+        sampler = None
+        if current_rss() is not None:
+            sampler = threading.Thread(target=_sample_rss, args=(report, stop_sampling), daemon=True)
+            sampler.start()
+    try:
+        yield report
+    finally:
+        _local.report = previous
+        if profiling:
+            stop_sampling.set()
+            if sampler:
+                sampler.join()
+            if started_tracing:
+                tracemalloc.stop()
+
+
+def _sample_rss(report: RunReport, stop_sampling: threading.Event):
+    while True:
+        report.sample_rss(current_rss())
+        if stop_sampling.wait(RSS_SAMPLE_INTERVAL):
+            return
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Adds the wall time (and memory, if profiled) spent in the context to a phase of the active report, if any."""
+    report = active()
+    if report is None:
+        yield
+        return
+    frame = report.enter_memory_phase() if report.profile_memory and tracemalloc.is_tracing() else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report.add_time(name, time.perf_counter() - start)
+        if frame:
+            report.exit_memory_phase(name, frame)
+
+
+def record_restarts(name, stats: RestartStats):
+    """Adds the statistics of the restarts of a phase to the active report, if there is one. The statistics can still
+    be updated after they are added."""
+    report = active()
+    if report is not None:
+        report.restart_stats[name] = stats
+
+
+def count(name, n=1):
+    """Adds n to a counter of the active report, if there is one."""
+    report = active()
+    if report is not None:
+        report.count(name, n)
@@ -0,0 +1,436 @@
+"""This module provides compiled kernels for the hot loops of an allocation.
+
+There are three kernels: scoring every suite against every student of a suite round (scoring.calculate_score()),
+scoring every female suite against every male suite in the RCA match (scoring.calculate_rca_score()), and the proposal
+loop of the Gale-Shapley algorithm (match.gale_shapley()). They work on NumPy arrays, with the same arithmetic in the
+same order as the Python code, so they give exactly the same scores and matches.
+
+The kernels are compiled with Numba, which is an optional dependency. The backend is chosen automatically: the kernels
+are used if Numba is installed, and the Python code in match.py is used otherwise. It can be overridden with
+set_backend() or with the ASAP_KERNELS environment variable, which also applies to the worker processes of a sharded
+allocation. The backends are:
+
+    * "numba": The kernels, compiled with Numba.
+    * "python": The Python code in match.py and scoring.py.
+    * "interpreted": The kernels, run by the Python interpreter without compiling them. This is much slower than either
+      of the others, and is only meant for checking the kernels on machines without Numba.
+
+    Typical usage example:
+
+    if kernels.backend() != "python":
+        scores = kernels.suite_round_scores(suites, students)
+        proposals, rejections = kernels.gale_shapley(scores, suites, students)
+"""
+
+import importlib.util
+import math
+import os
+import sys
+
+from ASAP.backend import scoring
+from ASAP.backend import util
+from ASAP.backend.student import Citizenship
+
+np = util.LazyModule("numpy")
+
+BACKENDS = ("numba", "python", "interpreted")
+RC_BITS = {"Saga": 1, "Elm": 2, "Cendana": 4}
+# From Python 3.12, sum() adds floats with Neumaier's compensated summation, so the kernels do the same
+COMPENSATED_SUM = sys.version_info >= (3, 12)
+
+_backend = None
+_compiled = False
+_warned_top_k = False
+
+
+def numba_available() -> bool:
+    return importlib.util.find_spec("numba") is not None
+
+
+def backend() -> str:
+    """Returns the name of the backend in use (see BACKENDS)."""
+    global _backend
+    if _backend is None:
+        set_backend(os.environ.get("ASAP_KERNELS") or None)
+    return _backend
+
+
+def set_backend(name=None):
+    """Selects the backend of the hot loops.
+
+    Args:
+        name: (optional) One of BACKENDS. Defaults to "numba" if Numba is installed and "python" otherwise.
+    """
+    global _backend
+    if name is None:
+        name = "numba" if numba_available() else "python"
+    if name not in BACKENDS:
+        raise ValueError(f"The kernel backend must be one of {', '.join(BACKENDS)}, not {name}.")
+    if name == "numba" and not numba_available():
+        raise ValueError("The numba kernel backend needs Numba to be installed.")
+    _backend = name
+
+
+def warn_if_top_k(top_k):
+    """Prints a warning to stderr if top_k is set, the first time that this is called with it set.
+
+    The kernels score every pair into one array and rank every candidate, so top_k does not apply to them.
+    """
+    global _warned_top_k
+    if _warned_top_k or top_k is None:
+        return
+    _warned_top_k = True
+    print(f"Warning: top_k is ignored by the {backend()} kernel backend, which ranks every candidate (set "
+          "ASAP_KERNELS=python to use it).", file=sys.stderr)
+
+
+def _kernels():
+    """Returns this module's namespace, with the kernels compiled if the backend is numba.
+
+    Numba resolves the functions that a kernel calls when it compiles the kernel, so every function is replaced with
+    its compiled version before any of them is called. Numba is only imported (which is slow) when it is first needed.
+    """
+    global _compiled
+    namespace = globals()
+    if backend() == "numba" and not _compiled:
+        import numba
+        for name in ("_pairwise_root_diff", "_living_pref_scores", "_count_distinct", "_country_counts",
+                     "_suite_round_scores", "_rca_scores", "_gale_shapley"):
+            namespace[name] = numba.njit(cache=True)(namespace[name])
+        _compiled = True
+    return namespace
+
+
+class _People:
+    """Encodes the students that are scored as arrays, with one row per student
+
+    Attributes:
+        rows: A dictionary mapping each StudentData object to its row.
+        living_prefs: An array of the value of each living preference (the columns are in the order of the weights).
+        local: An array of 1 for local students and 0 for international students.
+        accessibility: An array of 1 for accessibility students and 0 for others.
+        schools: An array of the ID of each student's school.
+        countries: An array of the IDs of each student's overseas countries, padded with -1.
+        rcs: An array of the RCs each student can live in, as bits of RC_BITS.
+        south_asian, non_asian: Arrays of 1 for every country ID that is in scoring.SOUTH_ASIAN_COUNTRIES (or
+            scoring.NON_ASIAN_COUNTRIES) and 0 for the others.
+        china: The country ID of China, or -2 if no student is from China.
+    """
+
+    def __init__(self, students):
+        self.rows = {}
+        weights = scoring.Scores.get_weights()
+        self.weights = np.array(list(weights.values()), dtype=float)
+        self.max_scores = np.array([scoring.Scores.get_max(living_pref) for living_pref in weights], dtype=float)
+        school_ids = {}
+        country_ids = {}
+        people = []
+        for student in students:
+            if student not in self.rows:
+                self.rows[student] = len(people)
+                people.append(student)
+        max_countries = max([len(student.country) for student in people], default=1) or 1
+        self.living_prefs = np.array([[student.living_prefs[living_pref] for living_pref in weights]
+                                      for student in people], dtype=float).reshape(len(people), len(weights))
+        self.local = np.array([student.citizenship == Citizenship.LOCAL for student in people], dtype=np.int64)
+        self.accessibility = np.array([bool(student.accessibility) for student in people], dtype=np.int64)
+        self.schools = np.array([school_ids.setdefault(student.school, len(school_ids)) for student in people],
+                                dtype=np.int64)
+        self.countries = np.full((len(people), max_countries), -1, dtype=np.int64)
+        for i, student in enumerate(people):
+            overseas_countries = [country for country in student.country if country != "Singapore"]
+            for j, country in enumerate(overseas_countries):
+                self.countries[i, j] = country_ids.setdefault(country, len(country_ids))
+        self.rcs = np.array([rc_bits(student.available_rcs) for student in people], dtype=np.int64)
+        self.south_asian = np.array([country in scoring.SOUTH_ASIAN_COUNTRIES for country in country_ids],
+                                    dtype=np.int64)
+        self.non_asian = np.array([country in scoring.NON_ASIAN_COUNTRIES for country in country_ids], dtype=np.int64)
+        self.china = country_ids.get("China", -2)
+
+    def members(self, suites):
+        """Returns an array of the rows of the students of each suite, padded with -1, and the number of each."""
+        members = np.full((len(suites), max([len(suite.students) for suite in suites], default=0)), -1,
+                          dtype=np.int64)
+        for i, suite in enumerate(suites):
+            for j, student in enumerate(suite.students):
+                members[i, j] = self.rows[student.data]
+        return members, np.array([len(suite.students) for suite in suites], dtype=np.int64)
+
+
+def rc_bits(rcs) -> int:
+    return sum(RC_BITS[rc] for rc in set(rcs))
+
+
+def suite_round_scores(suites, students):
+    """Returns an array of scoring.calculate_score() for every suite (rows) and student (columns) of a suite round.
+
+    Args:
+        suites: A list of SuiteAllocation.SuiteData objects.
+        students: A list of StudentData objects.
+    """
+    people = _People([student.data for suite in suites for student in suite.students] + list(students))
+    members, num_members = people.members(suites)
+    suite_accessibility = np.array([bool(suite.accessibility) for suite in suites], dtype=np.int64)
+    suite_rcs = np.array([rc_bits(suite.allowable_rcs) for suite in suites], dtype=np.int64)
+    student_rows = np.array([people.rows[student] for student in students], dtype=np.int64)
+    return _kernels()["_suite_round_scores"](
+        members, num_members, suite_accessibility, suite_rcs, student_rows, people.living_prefs, people.weights,
+        people.max_scores, people.local, people.accessibility, people.schools, people.countries, people.rcs,
+        people.south_asian, people.non_asian, COMPENSATED_SUM)
+
+
+def rca_scores(female_suites, male_suites, demographic_weight=0.8):
+    """Returns an array of scoring.calculate_rca_score() for every female suite (rows) and male suite (columns).
+
+    Args:
+        female_suites: A list of SuiteAllocation.SuiteData objects.
+        male_suites: A list of SuiteAllocation.SuiteData objects.
+        demographic_weight: (optional) The demographic weight of scoring.calculate_rca_score().
+    """
+    people = _People([student.data for suite in female_suites + male_suites for student in suite.students])
+    female_members, num_female_members = people.members(female_suites)
+    male_members, num_male_members = people.members(male_suites)
+    female_rcs = np.array([rc_bits(suite.allowable_rcs) for suite in female_suites], dtype=np.int64)
+    male_rcs = np.array([rc_bits(suite.allowable_rcs) for suite in male_suites], dtype=np.int64)
+    return _kernels()["_rca_scores"](
+        female_members, num_female_members, female_rcs, male_members, num_male_members, male_rcs, people.living_prefs,
+        people.weights, people.max_scores, people.local, people.schools, people.countries, people.south_asian,
+        people.china, demographic_weight, COMPENSATED_SUM)
+
+
+def gale_shapley(scores, proposers, acceptors):
+    """Matches proposers to acceptors like match.gale_shapley(), given the score of every pair.
+
+    Proposers rank acceptors by their scores, and acceptors compare proposers by their scores and then by the order of
+    the proposers, as in match.gale_shapley(). The current_choice of every matched proposer and acceptor is set.
+
+    Args:
+        scores: An array of the score of every proposer (rows) with every acceptor (columns).
+        proposers: A list of matchee objects.
+        acceptors: A list of matchee objects.
+
+    Returns:
+        A tuple of the number of proposals made and the number of proposals that were rejected.
+    """
+    scores = np.ascontiguousarray(scores)
+    # A stable sort keeps tied acceptors in order, as sorted() does for rankings
+    preferences = np.argsort(scores, axis=1, kind="stable").astype(np.int64)
+    proposer_matches, proposals, rejections = _kernels()["_gale_shapley"](preferences, scores)
+    for proposer, acceptor_id in zip(proposers, proposer_matches.tolist()):
+        if acceptor_id >= 0:
+            proposer.current_choice = acceptors[acceptor_id]
+            acceptors[acceptor_id].current_choice = proposer
+    return int(proposals), int(rejections)
+
+
+# The functions below are the kernels. They only use NumPy arrays, numbers and loops, so that Numba can compile them.
+
+def _pairwise_root_diff(values, compensated):
+    # scoring.pairwise_root_diff() of one column of living preferences
+    length = values.shape[0]
+    total = 0.0
+    compensation = 0.0
+    for n in range(length):
+        for i in range(n + 1, length):
+            x = math.sqrt(abs(values[n] - values[i]))
+            if compensated:
+                t = total + x
+                if abs(total) >= abs(x):
+                    compensation += (total - t) + x
+                else:
+                    compensation += (x - t) + total
+                total = t
+            else:
+                total += x
+    if compensated and compensation != 0.0 and math.isfinite(compensation):
+        total += compensation
+    return total / (length * (length - 1) // 2)
+
+
+def _living_pref_scores(group, living_prefs, weights, max_scores, compensated):
+    # scoring.living_pref_scores() of the students in the rows of group
+    total = 0.0
+    compensation = 0.0
+    values = np.empty(group.shape[0])
+    for living_pref in range(weights.shape[0]):
+        for k in range(group.shape[0]):
+            values[k] = living_prefs[group[k], living_pref]
+        x = _pairwise_root_diff(values, compensated) / max_scores[living_pref] * weights[living_pref]
+        if compensated:
+            t = total + x
+            if abs(total) >= abs(x):
+                compensation += (total - t) + x
+            else:
+                compensation += (x - t) + total
+            total = t
+        else:
+            total += x
+    if compensated and compensation != 0.0 and math.isfinite(compensation):
+        total += compensation
+    return total
+
+
+def _count_distinct(values, length):
+    num_distinct = 0
+    for i in range(length):
+        distinct = True
+        for j in range(i):
+            if values[j] == values[i]:
+                distinct = False
+                break
+        if distinct:
+            num_distinct += 1
+    return num_distinct
+
+
+def _country_counts(group, countries, south_asian, non_asian, china):
+    """Returns the number of overseas countries of the students in the rows of group, the number of distinct ones, the
+    number of distinct South Asian and non-Asian ones, and whether any of them is China."""
+    buffer = np.empty(group.shape[0] * countries.shape[1], dtype=np.int64)
+    num_countries = 0
+    for k in range(group.shape[0]):
+        for c in range(countries.shape[1]):
+            if countries[group[k], c] >= 0:
+                buffer[num_countries] = countries[group[k], c]
+                num_countries += 1
+    num_distinct = 0
+    num_south_asian = 0
+    num_non_asian = 0
+    has_china = False
+    for i in range(num_countries):
+        country = buffer[i]
+        if country == china:
+            has_china = True
+        distinct = True
+        for j in range(i):
+            if buffer[j] == country:
+                distinct = False
+                break
+        if distinct:
+            num_distinct += 1
+            num_south_asian += south_asian[country]
+            num_non_asian += non_asian[country]
+    return num_countries, num_distinct, num_south_asian, num_non_asian, has_china
+
+
+def _suite_round_scores(members, num_members, suite_accessibility, suite_rcs, student_rows, living_prefs, weights,
+                        max_scores, local, accessibility, schools, countries, rcs, south_asian, non_asian,
+                        compensated):
+    # scoring.calculate_score() of every suite with every student, in the same order of operations
+    scores = np.empty((members.shape[0], student_rows.shape[0]))
+    group_buffer = np.empty(members.shape[1] + 1, dtype=np.int64)
+    school_buffer = np.empty(members.shape[1] + 1, dtype=np.int64)
+    for s in range(members.shape[0]):
+        size = num_members[s] + 1
+        group = group_buffer[:size]
+        group[:size - 1] = members[s, :size - 1]
+        for t in range(student_rows.shape[0]):
+            student = student_rows[t]
+            group[size - 1] = student
+            num_countries, distinct_countries, num_south_asian, num_non_asian, _ = _country_counts(
+                group, countries, south_asian, non_asian, -2)
+            num_locals = 0
+            for k in range(size):
+                school_buffer[k] = schools[group[k]]
+                num_locals += local[group[k]]
+            num_intls = size - num_locals
+            distinct_schools = _count_distinct(school_buffer, size)
+
+            score = _living_pref_scores(group, living_prefs, weights, max_scores, compensated)
+            score += (num_countries - distinct_countries * 120) + (size - distinct_schools * 120)
+            if num_locals == 4 and num_intls == 2:
+                score -= 1000
+            if (suite_accessibility[s] or accessibility[student]) and num_locals == 3 and num_intls == 1:
+                score -= 2000
+            if accessibility[student] and suite_accessibility[s]:
+                score += 2000
+            if (rcs[student] & suite_rcs[s]) == 0:
+                score += 2000
+            if num_south_asian > 1:
+                score += 2000
+            if num_non_asian > 1:
+                score += 2000
+            if num_countries - distinct_countries > 0:
+                score += 2000
+            if size - distinct_schools > 0:
+                score += 2000
+            scores[s, t] = score
+    return scores
+
+
+def _rca_scores(first_members, num_first_members, first_rcs, second_members, num_second_members, second_rcs,
+                living_prefs, weights, max_scores, local, schools, countries, south_asian, china, demographic_weight,
+                compensated):
+    # scoring.calculate_rca_score() of every suite of the first group with every suite of the second group
+    scores = np.empty((first_members.shape[0], second_members.shape[0]))
+    group_buffer = np.empty(first_members.shape[1] + second_members.shape[1], dtype=np.int64)
+    school_buffer = np.empty(first_members.shape[1] + second_members.shape[1], dtype=np.int64)
+    for i in range(first_members.shape[0]):
+        for j in range(second_members.shape[0]):
+            size = num_first_members[i] + num_second_members[j]
+            group = group_buffer[:size]
+            group[:num_first_members[i]] = first_members[i, :num_first_members[i]]
+            group[num_first_members[i]:] = second_members[j, :num_second_members[j]]
+            num_countries, distinct_countries, num_south_asian, _, has_china = _country_counts(
+                group, countries, south_asian, south_asian, china)
+            num_locals = 0
+            for k in range(size):
+                school_buffer[k] = schools[group[k]]
+                num_locals += local[group[k]]
+            num_intls = size - num_locals
+            distinct_schools = _count_distinct(school_buffer, size)
+
+            pref_score = _living_pref_scores(group, living_prefs, weights, max_scores, compensated)
+            citizenship_diversity = abs(num_locals - num_intls) / 2
+            country_diversity = num_countries - distinct_countries / 3
+            school_diversity = size - distinct_schools / 3
+            score = 0.4 * citizenship_diversity + 0.3 * country_diversity + 0.3 * school_diversity
+            if (num_locals == 7 and num_intls == 4) or (num_locals == 8 and num_intls == 4):
+                score += 2000
+            if num_south_asian > 1:
+                score += 2000
+            if not has_china:
+                score += 2000
+            score = demographic_weight * score + (1 - demographic_weight) * pref_score
+            if (first_rcs[i] & second_rcs[j]) == 0:
+                score += 2000
+            scores[i, j] = score
+    return scores
+
+
+def _gale_shapley(preferences, scores):
+    # match.gale_shapley(), with a circular queue of the unallocated proposers in place of a deque
+    num_proposers, num_acceptors = preferences.shape
+    next_choice = np.zeros(num_proposers, dtype=np.int64)
+    proposer_matches = np.full(num_proposers, -1, dtype=np.int64)
+    acceptor_matches = np.full(num_acceptors, -1, dtype=np.int64)
+    unallocated = np.arange(num_proposers)
+    head = 0
+    num_unallocated = num_proposers
+    proposals = 0
+    rejections = 0
+    while num_unallocated > 0:
+        proposer = unallocated[head]
+        head = (head + 1) % num_proposers
+        num_unallocated -= 1
+        if next_choice[proposer] < num_acceptors:
+            acceptor = preferences[proposer, next_choice[proposer]]
+            next_choice[proposer] += 1
+            proposals += 1
+            current = acceptor_matches[acceptor]
+            if current == -1:
+                acceptor_matches[acceptor] = proposer
+                proposer_matches[proposer] = acceptor
+            elif (scores[proposer, acceptor] < scores[current, acceptor]
+                  or (scores[proposer, acceptor] == scores[current, acceptor] and proposer < current)):
+                proposer_matches[current] = -1
+                unallocated[(head + num_unallocated) % num_proposers] = current
+                num_unallocated += 1
+                acceptor_matches[acceptor] = proposer
+                proposer_matches[proposer] = acceptor
+                rejections += 1
+            else:
+                unallocated[(head + num_unallocated) % num_proposers] = proposer
+                num_unallocated += 1
+                rejections += 1
+    return proposer_matches, proposals, rejections
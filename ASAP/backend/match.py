@@ -1,21 +1,37 @@
 import collections
 import random
+from typing import Dict, List, Optional, TYPE_CHECKING
 
+from ASAP.backend import exact
+from ASAP.backend import feasibility
+from ASAP.backend import instrumentation
+from ASAP.backend import kernels
 from ASAP.backend import scoring
-from ASAP.backend.allocation import SuiteAllocation
+from ASAP.backend import util
 from ASAP.backend.student import StudentData
 
+if TYPE_CHECKING:
+    # allocation imports this module, so importing it at runtime would be circular
+    from ASAP.backend.allocation import SuiteAllocation
+
+np = util.LazyModule("numpy")
+
 
 class SuiteRound:
     class StudentMatchee:
         """
             scores: A dictionary mapping suite objects to the score given to that suite combined with the student
             ranking: A list that contains suite objects. The order represents the student's preference
+            candidates: The list of suite objects that a truncated ranking was chosen from, or None if the ranking
+                is not truncated (or has been extended to every candidate)
+            last_ranked: The position (in candidates) of the last candidate in the truncated ranking, or None
         """
         def __init__(self, student_data: StudentData):
             self.data = student_data
             self.scores = {}
             self.ranking = None
+            self.candidates = None
+            self.last_ranked = None
             self.current_choice = None
 
         # def __getattr__(self, attr):
@@ -38,18 +54,24 @@ class SuiteRound:
             if suite_matchee in self.scores:
                 return self.scores[suite_matchee]
             else:
-                score = scoring.calculate_score(suite_matchee.data, self)
+                score = self.calculate_score(suite_matchee)
                 suite_matchee.scores[self] = score
                 return score
 
-        def generate_ranking(self, suites):
-            self.ranking = collections.deque(sorted(suites, key=self.generate_score))
+        def calculate_score(self, suite_matchee):
+            """Returns the same score as generate_score(), without storing it."""
+            return scoring.calculate_score(suite_matchee.data, self)
+
+        def generate_ranking(self, suites, top_k=None):
+            generate_ranking(self, suites, top_k)
 
     class SuiteMatchee:
-        def __init__(self, suite: SuiteAllocation.SuiteData):
+        def __init__(self, suite: "SuiteAllocation.SuiteData"):
             self.data = suite
             self.scores = {}
             self.ranking = None
+            self.candidates = None
+            self.last_ranked = None
             self.current_choice = None
 
         def add_student(self, student):
@@ -60,17 +82,23 @@ class SuiteRound:
             if student_matchee in self.scores:
                 return self.scores[student_matchee]
             else:
-                score = scoring.calculate_score(self.data, student_matchee)
+                score = self.calculate_score(student_matchee)
                 student_matchee.scores[self] = score
                 return score
 
-        def generate_ranking(self, students):
-            self.ranking = collections.deque(sorted(students, key=self.generate_score))
+        def calculate_score(self, student_matchee):
+            return scoring.calculate_score(self.data, student_matchee)
+
+        def generate_ranking(self, students, top_k=None):
+            generate_ranking(self, students, top_k)
 
-    def __init__(self, students, suites, suite_propose=True):
+    def __init__(self, students, suites, suite_propose=True, top_k=None, exact_mode=None):
         self.students = [SuiteRound.StudentMatchee(student) for student in students]
         self.suites = [SuiteRound.SuiteMatchee(suite) for suite in suites if suite.vacancies > 0]
         self.suite_propose = suite_propose
+        self.top_k = top_k
+        # Small rounds are solved exactly if this is an exact.ExactMode object
+        self.exact_mode = exact_mode
         self.proposers = None
 
     @staticmethod
@@ -90,20 +118,191 @@ class SuiteRound:
         return students
 
     def run_match(self):
-        for student in self.students:
-            student.generate_ranking(self.suites)
-        for suite in self.suites:
-            suite.generate_ranking(self.students)
+        if self.exact_mode and self.exact_mode.applies(len(self.students)) and self.run_exact_match():
+            return self.students
         if self.suite_propose:
-            self.proposers = self.suites
+            self.proposers, acceptors = self.suites, self.students
         else:
-            self.proposers = self.students
-        gale_shapley(self.proposers)
+            self.proposers, acceptors = self.students, self.suites
+        if kernels.backend() != "python":
+            return self.run_kernel_match(acceptors)
+        with instrumentation.phase("Ranking"):
+            if self.top_k is None:
+                for student in self.students:
+                    student.generate_ranking(self.suites)
+                for suite in self.suites:
+                    suite.generate_ranking(self.students)
+                count_score_calls(self.proposers, acceptors, "calculate_score")
+            else:
+                # Acceptors compare proposers by their scores in gale_shapley(), so they do not need rankings
+                for proposer in self.proposers:
+                    proposer.generate_ranking(acceptors, self.top_k)
+        with instrumentation.phase("Gale-Shapley"):
+            proposals, rejections = gale_shapley(self.proposers)
+        instrumentation.count("Suite proposals", proposals)
+        instrumentation.count("Suite rejections", rejections)
+        release_preferences(self.students, self.suites)
+        for suite in self.suites:
+            suite.add_student(suite.current_choice)
+        return self.students
+
+    def run_exact_match(self) -> bool:
+        """Matches the students to the suites with the lowest total score (see exact.py).
+
+        Returns:
+            True if the round was solved exactly, or False if it should fall back to the Gale-Shapley algorithm.
+        """
+        if not exact.solver_available():
+            instrumentation.count("Exact fallbacks")
+            return False
+        with instrumentation.phase("Exact match"):
+            shape = (len(self.suites), len(self.students))
+            scores = np.array([scoring.calculate_score(suite.data, student)
+                               for suite in self.suites for student in self.students], dtype=float).reshape(shape)
+            allowed_pairs = np.array([exact.allowed(suite.data, student.data)
+                                      for suite in self.suites for student in self.students], dtype=bool).reshape(shape)
+            student_suites = exact.solve_round(scores, allowed_pairs, self.exact_mode.time_limit)
+        if student_suites is None:
+            instrumentation.count("Exact fallbacks")
+            return False
+        instrumentation.count("Exact rounds")
+        for student, i in zip(self.students, student_suites):
+            student.current_choice = self.suites[i]
+            self.suites[i].current_choice = student
+        for suite in self.suites:
+            suite.add_student(suite.current_choice)
+        return True
+
+    def run_kernel_match(self, acceptors):
+        """Runs the match with the compiled kernels (see kernels.py), which gives the same result as run_match()."""
+        kernels.warn_if_top_k(self.top_k)
+        with instrumentation.phase("Ranking"):
+            scores = kernels.suite_round_scores([suite.data for suite in self.suites],
+                                                [student.data for student in self.students])
+        instrumentation.count("calculate_score calls", scores.size)
+        with instrumentation.phase("Gale-Shapley"):
+            proposals, rejections = kernels.gale_shapley(scores if self.suite_propose else scores.T,
+                                                         self.proposers, acceptors)
+        instrumentation.count("Suite proposals", proposals)
+        instrumentation.count("Suite rejections", rejections)
         for suite in self.suites:
             suite.add_student(suite.current_choice)
         return self.students
 
 
+def count_score_calls(matchees, other_matchees, score_function):
+    """Counts the scores calculated while ranking two groups of matchees against each other, without slowing it down.
+
+    Every matchee ranks every matchee of the other group, calling generate_score() once per pair. Each score is
+    only calculated by the first of the two matchees to need it, which stores it in the scores of the other, so the
+    number of scores calculated is the number of scores stored and the rest of the calls are cache hits. Truncated
+    rankings count their own scores (see generate_ranking()).
+    """
+    if instrumentation.active() is None:
+        return
+    num_calls = 2 * len(matchees) * len(other_matchees)
+    num_calculated = (sum(len(matchee.scores) for matchee in matchees)
+                      + sum(len(matchee.scores) for matchee in other_matchees))
+    instrumentation.count(f"{score_function} calls", num_calculated)
+    instrumentation.count(f"{score_function} cache hits", num_calls - num_calculated)
+
+
+def release_preferences(*matchee_groups):
+    """Deletes the scores and rankings of matchees once they have been matched.
+
+    They are not needed after the match, and the matchees are kept with the allocation, so keeping them would retain
+    every score of every round. The scores also link every matchee to every other one, which makes the allocation too
+    deeply nested to pickle for large cohorts.
+    """
+    for matchees in matchee_groups:
+        for matchee in matchees:
+            matchee.scores = {}
+            matchee.ranking = None
+            matchee.candidates = None
+            matchee.last_ranked = None
+
+
+def generate_ranking(matchee, candidates, top_k=None):
+    """Ranks candidates for a matchee in order of the matchee's scores of them, lowest (best) first.
+
+    Ties keep the order of the candidates. With top_k, only the top_k best candidates are ranked (chosen with
+    argpartition, so the rest are not sorted), and extend_ranking() ranks more of them if the matchee runs out of
+    candidates in gale_shapley(). The ranking is always a prefix of the full ranking, so the result of the match does
+    not change. Only the scores of the ranked candidates are kept (in the scores of the candidates, where
+    gale_shapley() looks them up), so a match with top_k keeps O(top_k) scores per matchee instead of one per pair.
+
+    Args:
+        matchee: A matchee object with generate_score() and calculate_score().
+        candidates: A list of matchee objects of the other group.
+        top_k: (optional) An integer representing the number of candidates to rank. Defaults to all of them.
+    """
+    if top_k is not None:
+        instrumentation.count("Top-K scores", len(candidates))
+    if top_k is None or top_k >= len(candidates):
+        matchee.ranking = collections.deque(sorted(candidates, key=matchee.generate_score))
+        matchee.candidates = None
+        return
+    scores = np.array([matchee.calculate_score(candidate) for candidate in candidates])
+    top = best_candidates(scores, np.arange(len(candidates)), top_k)
+    matchee.ranking = collections.deque()
+    matchee.candidates = candidates
+    add_to_ranking(matchee, scores, top)
+
+
+def extend_ranking(matchee) -> bool:
+    """Ranks more candidates of a matchee whose truncated ranking has run out.
+
+    The candidates are scored again, since only the scores of the ranked ones are kept. Each extension ranks as many
+    candidates as have been ranked so far, so a matchee that goes far down its list is only extended (and scores its
+    candidates again) a few times.
+
+    Returns:
+        A boolean representing whether any candidates were added to the ranking.
+    """
+    if matchee.candidates is None:
+        return False
+    instrumentation.count("Top-K scores", len(matchee.candidates))
+    scores = np.array([matchee.calculate_score(candidate) for candidate in matchee.candidates])
+    positions = np.arange(len(scores))
+    last_score = scores[matchee.last_ranked]
+    not_ranked = (scores > last_score) | ((scores == last_score) & (positions > matchee.last_ranked))
+    remaining = positions[not_ranked]
+    num_ranked = len(scores) - len(remaining)
+    top = best_candidates(scores, remaining, num_ranked)
+    add_to_ranking(matchee, scores, top)
+    if len(top) == len(remaining):
+        matchee.candidates = None
+    return True
+
+
+def add_to_ranking(matchee, scores, top):
+    """Adds the candidates at the positions in top to the end of a matchee's truncated ranking.
+
+    Their scores are stored in the scores of the candidates, as generate_score() would, so that they do not need to
+    be calculated again when the candidates compare the matchee with other proposers in gale_shapley().
+    """
+    for i in top:
+        candidate = matchee.candidates[i]
+        candidate.scores[matchee] = float(scores[i])
+        matchee.ranking.append(candidate)
+    matchee.last_ranked = top[-1]
+
+
+def best_candidates(scores, positions, k):
+    """Returns the k positions (in ascending order) with the lowest scores, sorted by score and then by position.
+
+    This is the same as the first k positions of a stable sort by score, without sorting the rest.
+    """
+    if k < len(positions):
+        position_scores = scores[positions]
+        kth_score = position_scores[np.argpartition(position_scores, k - 1)[k - 1]]
+        better = positions[position_scores < kth_score]
+        # Of the candidates tied with the kth best, a stable sort would keep the earliest ones
+        tied = positions[position_scores == kth_score][:k - len(better)]
+        positions = np.concatenate([better, tied])
+    return positions[np.lexsort((positions, scores[positions]))]
+
+
 def suites_with_fewer_rcs_first(suite):
     if suite.current_choice:
         return min(len(suite.data.allowable_rcs), len(suite.current_choice.data.allowable_rcs))
@@ -113,10 +312,12 @@ def suites_with_fewer_rcs_first(suite):
 class RCAMatch:
     def __init__(self, female_suites, male_suites, saga_sextets, elm_sextets, cendana_sextets,
                  saga_a11y_suites, elm_a11y_suites, cendana_a11y_suites,
-                 female_suites_propose=True):
-        self.female_suites = [RCAMatch.Matchee(suite) for suite in female_suites]
-        self.male_suites = [RCAMatch.Matchee(suite) for suite in male_suites]
+                 female_suites_propose=True, rng=random, top_k=None):
+        self.female_suites = [RCAMatch.Matchee(suite, female=True) for suite in female_suites]
+        self.male_suites = [RCAMatch.Matchee(suite, female=False) for suite in male_suites]
         self.female_suites_propose = female_suites_propose
+        self.top_k = top_k
+        self.rng = rng
         self.proposers = None
         self.saga_sextets = saga_sextets
         self.elm_sextets = elm_sextets
@@ -129,101 +330,188 @@ class RCAMatch:
             raise ValueError("Not enough suites.")
 
     class Matchee:
-        def __init__(self, suite):
+        def __init__(self, suite, female=True):
             self.data = suite
+            self.female = female
             self.scores = {}
             self.ranking = None
+            self.candidates = None
+            self.last_ranked = None
             self.current_choice = None
 
         def generate_score(self, suite_matchee):
             if suite_matchee in self.scores:
                 return self.scores[suite_matchee]
             else:
-                score = scoring.calculate_rca_score(self.data, suite_matchee.data)
+                score = self.calculate_score(suite_matchee)
                 suite_matchee.scores[self] = score
                 return score
 
-        def generate_ranking(self, suite):
-            self.ranking = collections.deque(sorted(suite, key=self.generate_score))
+        def calculate_score(self, suite_matchee):
+            # The students of the female suite are always listed first, so that the score (which adds floats in the
+            # order of the students) does not depend on which of the two suites ranks the other first
+            female, male = (self, suite_matchee) if self.female else (suite_matchee, self)
+            return scoring.calculate_rca_score(female.data, male.data)
+
+        def generate_ranking(self, suites, top_k=None):
+            generate_ranking(self, suites, top_k)
 
     def run_match(self):  # NEED TO PREVENT 4-2 suites from being paired with 3-2 suites (Citizenship)
-        for female_suite in self.female_suites:
-            female_suite.generate_ranking(self.male_suites)
-        for male_suite in self.male_suites:
-            male_suite.generate_ranking(self.female_suites)
         if self.female_suites_propose:
-            self.proposers = self.female_suites
+            self.proposers, acceptors = self.female_suites, self.male_suites
+        else:
+            self.proposers, acceptors = self.male_suites, self.female_suites
+        if kernels.backend() != "python":
+            kernels.warn_if_top_k(self.top_k)
+            scores = kernels.rca_scores([suite.data for suite in self.female_suites],
+                                        [suite.data for suite in self.male_suites])
+            instrumentation.count("calculate_rca_score calls", scores.size)
+            proposals, rejections = kernels.gale_shapley(scores if self.female_suites_propose else scores.T,
+                                                         self.proposers, acceptors)
         else:
-            self.proposers = self.male_suites
-        gale_shapley(self.proposers)
+            if self.top_k is None:
+                for female_suite in self.female_suites:
+                    female_suite.generate_ranking(self.male_suites)
+                for male_suite in self.male_suites:
+                    male_suite.generate_ranking(self.female_suites)
+                count_score_calls(self.proposers, acceptors, "calculate_rca_score")
+            else:
+                for proposer in self.proposers:
+                    proposer.generate_ranking(acceptors, self.top_k)
+            proposals, rejections = gale_shapley(self.proposers)
+        instrumentation.count("RCA proposals", proposals)
+        instrumentation.count("RCA rejections", rejections)
+        release_preferences(self.female_suites, self.male_suites)
         suites = self.female_suites if len(self.female_suites) > len(self.male_suites) else self.male_suites
-        random.shuffle(suites)
+        self.rng.shuffle(suites)
         suites.sort(key=suites_with_fewer_rcs_first)
+        pairs = [(suite.data, suite.current_choice.data) for suite in suites if suite.current_choice]
+        rcs = iter(self.assign_rcs(pairs))
         i = 1
         for suite in suites:
             if not suite.current_choice:
                 suite.data.rca = "Unallocated"
                 suite.data.rc = "Unallocated"
             else:
-                rc = self.get_rc(suite.data, suite.current_choice.data)
+                rc = next(rcs)
                 suite.data.rc = rc
                 suite.current_choice.data.rc = rc
                 suite.current_choice.data.rca = f"RCA {i:02d}"
                 suite.data.rca = f"RCA {i:02d}"
                 i += 1
 
-    def get_rc(self, first_suite, second_suite):
-        allowable_rcs = first_suite.allowable_rcs.intersection(second_suite.allowable_rcs)
-        if not allowable_rcs:
-            raise RuntimeError("No common RCs between two suites")
-
-        # TODO: Quick hack - there will never be two accessibility suites in the same RCA group
-
-        # TODO: This also assumes that ALL accessibility suites will have their RCs pre-defined
-        # If there are accessibility suites with non-predefined RCs, and they get their RC first before
-        # suites with predefined RCs, then we have a problem because the earlier suite might steal the RC
-        # that the second suite needs.
-        # TODO: Actually this might be resolved? With suites.sort(key=suites_with_fewer_rcs_first)
-
-        saga_can = "Saga" in allowable_rcs
-        elm_can = "Elm" in allowable_rcs
-        cendana_can = "Cendana" in allowable_rcs
-
-        if first_suite.accessibility or second_suite.accessibility:
-            i = random.randint(1, 3)
-            if i == 1:
-                if self.saga_sextets >= 1 and self.saga_a11y_suites >= 1 and saga_can:
-                    self.saga_sextets -= 1
-                    self.saga_a11y_suites -= 1
-                    return "Saga"
-            elif i == 2:
-                if self.elm_sextets >= 1 and self.elm_a11y_suites >= 1 and elm_can:
-                    self.elm_sextets -= 1
-                    self.elm_a11y_suites -= 1
-                    return "Elm"
-            elif i == 3:
-                if self.cendana_sextets >= 1 and self.cendana_a11y_suites >= 1 and cendana_can:
-                    self.cendana_sextets -= 1
-                    self.cendana_a11y_suites -= 1
-                    return "Cendana"
-        else:
-            i = random.randint(1, 3)
-            if i == 1:
-                if self.saga_sextets >= 2 and saga_can:
-                    self.saga_sextets -= 2
-                    return "Saga"
-            elif i == 2:
-                if self.elm_sextets >= 2 and elm_can:
-                    self.elm_sextets -= 2
-                    return "Elm"
-            elif i == 3:
-                if self.cendana_sextets >= 2 and cendana_can:
-                    self.cendana_sextets -= 2
-                    return "Cendana"
-        return self.get_rc(first_suite, second_suite)
+    def assign_rcs(self, pairs) -> List[str]:
+        """Chooses the RC of every RCA group so that all of them fit in the available suites.
+
+        A group needs an accessibility suite of its RC for each of its accessibility suites, and a sextet for each of
+        its other suites. Choosing the RC of each group at random can use up the sextets of the only RCs with
+        accessibility suites before the groups that need them are placed, so the groups with an accessibility suite
+        are placed first. Their RCs are tried in random order (RCs with an odd number of sextets left first, as the
+        spare sextet could not be used by another group), and a choice is undone if it leaves no way to place the
+        other groups. Those are then placed with a maximum flow (see place_groups()), so a placement is always found
+        if one exists.
+
+        Args:
+            pairs: A list of tuples of the two SuiteData objects of each RCA group.
+
+        Returns:
+            A list of the RC of each group, in the same order as pairs.
+
+        Raises:
+            RuntimeError: The groups cannot all be placed in the available suites.
+        """
+        sextets = {"Saga": self.saga_sextets, "Elm": self.elm_sextets, "Cendana": self.cendana_sextets}
+        a11y_suites = {"Saga": self.saga_a11y_suites, "Elm": self.elm_a11y_suites,
+                       "Cendana": self.cendana_a11y_suites}
+        allowed = [[rc for rc in sextets if rc in first.allowable_rcs and rc in second.allowable_rcs]
+                   for first, second in pairs]
+        for (first, second), rcs in zip(pairs, allowed):
+            if not rcs:
+                raise RuntimeError(f"No common RCs between {first} and {second}")
+        num_a11y = [first.accessibility + second.accessibility for first, second in pairs]
+        a11y_groups = [i for i in range(len(pairs)) if num_a11y[i]]
+        other_groups = [i for i in range(len(pairs)) if i not in a11y_groups]
+        self.rng.shuffle(other_groups)
+        a11y_groups.sort(key=lambda i: len(allowed[i]))
+        assigned = {}
+
+        def place(k):
+            if k == len(a11y_groups):
+                placement = place_groups(other_groups, allowed, sextets)
+                if placement is None:
+                    return False
+                assigned.update(placement)
+                return True
+            i = a11y_groups[k]
+            needs_sextet = num_a11y[i] < 2
+            options = [rc for rc in allowed[i] if sextets[rc] >= needs_sextet and a11y_suites[rc] >= num_a11y[i]]
+            self.rng.shuffle(options)
+            options.sort(key=lambda rc: needs_sextet and sextets[rc] % 2 == 0)
+            for rc in options:
+                sextets[rc] -= needs_sextet
+                a11y_suites[rc] -= num_a11y[i]
+                # Placing the other groups only gets harder as more accessibility groups are placed, so a choice that
+                # already leaves no room for them is undone straight away
+                if place_groups(other_groups, allowed, sextets) is not None and place(k + 1):
+                    assigned[i] = rc
+                    return True
+                sextets[rc] += needs_sextet
+                a11y_suites[rc] += num_a11y[i]
+            return False
+
+        if not place(0):
+            raise RuntimeError(f"The {len(pairs)} RCA groups cannot all be placed in the available suites (sextets: "
+                               f"{', '.join(f'{rc} {n}' for rc, n in sextets.items())}; accessibility suites: "
+                               f"{', '.join(f'{rc} {n}' for rc, n in a11y_suites.items())}).")
+        for i in other_groups:
+            sextets[assigned[i]] -= 2
+        self.saga_sextets, self.elm_sextets, self.cendana_sextets = sextets["Saga"], sextets["Elm"], sextets["Cendana"]
+        self.saga_a11y_suites, self.elm_a11y_suites, self.cendana_a11y_suites = (
+            a11y_suites["Saga"], a11y_suites["Elm"], a11y_suites["Cendana"])
+        return [assigned[i] for i in range(len(pairs))]
+
+
+def place_groups(groups, allowed, sextets) -> Optional[Dict[int, str]]:
+    """Places RCA groups without an accessibility suite in RCs with a maximum flow, or returns None if they do not fit.
+
+    Args:
+        groups: A list of the indices of the groups.
+        allowed: A list of the RCs that each group (by index) can live in.
+        sextets: A dictionary mapping each RC to its number of sextets left. Each group needs two of them.
+
+    Returns:
+        A dictionary mapping the index of each group to its RC.
+    """
+    capacity = collections.defaultdict(dict)
+
+    def add_edge(u, v, cap):
+        capacity[u][v] = cap
+        capacity[v].setdefault(u, 0)
+
+    for i in groups:
+        add_edge(feasibility.SOURCE, ("group", i), 1)
+        for rc in allowed[i]:
+            add_edge(("group", i), ("rc", rc), 1)
+    for rc, num_sextets in sextets.items():
+        add_edge(("rc", rc), feasibility.SINK, num_sextets // 2)
+    num_placed, _ = feasibility.max_flow(capacity, feasibility.SOURCE, feasibility.SINK)
+    if num_placed < len(groups):
+        return None
+    # An edge that carried flow has no capacity left
+    return {i: next(rc for rc in allowed[i] if capacity[("group", i)][("rc", rc)] == 0) for i in groups}
 
 
 def gale_shapley(proposers):
+    """Matches proposers to acceptors with the Gale-Shapley algorithm, using the rankings of the proposers.
+
+    Acceptors compare two proposers by their scores of them, and then by the order of the proposers. This is the order
+    of their rankings, since the acceptors ranked the proposers in that order (with ties kept in order), but it does
+    not need the acceptors to have rankings, and it does not search them.
+
+    Returns:
+        A tuple of the number of proposals made and the number of proposals that were rejected (either straight
+        away or later, when the acceptor received a better proposal).
+    """
     def unmatch(old_proposer, current_acceptor):
         old_proposer.current_choice = None
         unallocated.append(old_proposer)
@@ -233,15 +521,25 @@ def gale_shapley(proposers):
         current_acceptor.current_choice = current_proposer
         current_proposer.current_choice = current_acceptor
 
+    def rank(current_acceptor, current_proposer):
+        return current_acceptor.generate_score(current_proposer), positions[current_proposer]
+
+    positions = {proposer: i for i, proposer in enumerate(proposers)}
     unallocated = collections.deque(proposers)
+    proposals = 0
+    rejections = 0
     while unallocated:
         proposer = unallocated.popleft()
-        if proposer.ranking:
+        if proposer.ranking or extend_ranking(proposer):
             acceptor = proposer.ranking.popleft()
+            proposals += 1
             if acceptor.current_choice is None:
                 match(proposer, acceptor)
-            elif acceptor.ranking.index(proposer) < acceptor.ranking.index(acceptor.current_choice):
+            elif rank(acceptor, proposer) < rank(acceptor, acceptor.current_choice):
                 unmatch(acceptor.current_choice, acceptor)
                 match(proposer, acceptor)
+                rejections += 1
             else:
                 unallocated.append(proposer)
+                rejections += 1
+    return proposals, rejections
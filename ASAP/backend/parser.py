@@ -2,17 +2,95 @@
 
     Typical usage example:
 
+    students_df, column_profiles = read_student_csv(csv_path)
     female_students, male_students = parse_student_data(student_df)
 """
 
-import pandas as pd
-import numpy as np
 import datetime
+from typing import Dict, Iterable, List, Tuple
 
 from ASAP.backend.student import StudentData
 from ASAP.backend import scoring
 from ASAP.backend import util
 
+pd = util.LazyModule("pandas")
+np = util.LazyModule("numpy")
+
+# Columns with at most this fraction of unique values (e.g. sex, school, country, RCs, living preferences) are stored
+# as categoricals. Columns that are mostly unique (e.g. student ID, name) are kept as plain strings.
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+class ColumnProfile:
+    """Contains the unique values and their frequencies for one column of the student data
+
+    Attributes:
+        name: A string representing the column name.
+        values: A list of the unique (non-missing) values in the column, from most to least frequent.
+        counts: A list of integers representing the frequency of each value in values.
+        num_nulls: An integer representing the number of missing values in the column.
+    """
+
+    def __init__(self, name, values, counts, num_nulls):
+        self.name: str = name
+        self.values: List[str] = values
+        self.counts: List[int] = counts
+        self.num_nulls: int = num_nulls
+
+    @property
+    def num_unique(self):
+        return len(self.values)
+
+    def count(self, value):
+        """Returns the number of rows that contain the value."""
+        try:
+            return self.counts[self.values.index(value)]
+        except ValueError:
+            return 0
+
+    def __repr__(self):
+        return f"ColumnProfile({self.name}, {self.num_unique} unique, {self.num_nulls} missing)"
+
+
+def read_student_csv(csv_path) -> Tuple["pd.DataFrame", Dict[str, ColumnProfile]]:
+    """Reads student data from a CSV file with explicit dtypes and profiles every column.
+
+    Every column is read as text, so that values such as IDs with leading zeros are preserved and no type inference
+    is needed. Low-cardinality columns are then stored as categoricals to reduce memory use.
+
+    Args:
+        csv_path: A string representing the path of the CSV file.
+
+    Returns:
+        A tuple of the student DataFrame and a dictionary mapping each column name to its ColumnProfile.
+    """
+    students_df = pd.read_csv(csv_path, dtype=str)
+    column_profiles = profile_columns(students_df)
+    for col, profile in column_profiles.items():
+        if profile.num_unique <= CATEGORY_MAX_UNIQUE_RATIO * len(students_df):
+            students_df[col] = students_df[col].astype("category")
+    return students_df, column_profiles
+
+
+def profile_columns(students_df, cols: Iterable[str] = None) -> Dict[str, ColumnProfile]:
+    """Computes the unique values, frequencies and number of missing values of each column in a single pass.
+
+    Args:
+        students_df: A Pandas DataFrame containing student data.
+        cols: (optional) An iterable of the column names to profile. Defaults to all columns.
+
+    Returns:
+        A dictionary mapping each column name to its ColumnProfile.
+    """
+    column_profiles = {}
+    for col in students_df.columns if cols is None else cols:
+        value_counts = students_df[col].value_counts(dropna=False)
+        null_mask = value_counts.index.isna()
+        num_nulls = int(value_counts[null_mask].sum())
+        value_counts = value_counts[~null_mask & (value_counts.values > 0)]
+        column_profiles[col] = ColumnProfile(col, value_counts.index.tolist(), value_counts.values.tolist(), num_nulls)
+    return column_profiles
+
 
 def parse_student_data(students_df):
     """Parses student data from a CSV file.
@@ -1,8 +1,12 @@
 import math
 import itertools
+import threading
 
+from ASAP.backend import util
 from ASAP.backend.student import Citizenship
 
+np = util.LazyModule("numpy")
+
 SOUTH_ASIAN_COUNTRIES = {"India", "Pakistan", "Sri Lanka", "Bangladesh", "Nepal"}
 ASIAN_COUNTRIES = {"Philippines", "Pakistan", "India", "Indonesia", "Japan", "China", "Taiwan", "Malaysia", "Thailand",
                    "Hong Kong", "South Korea", "Vietnam", "Bhutan", "Macau"}
@@ -93,26 +97,25 @@ def living_pref_score(students, living_pref, higher_better=False):
 
 def living_pref_scores(students, higher_better=False):
     return sum(living_pref_score(students, living_pref, higher_better) * weight
-               for living_pref, weight in Scores.weights.items())
+               for living_pref, weight in Scores.get_weights().items())
 
 
 def rca_demographic_scores(suite1, suite2):
-    citizenships = ([student.data.citizenship for student in suite1.students]
-                    + [student.data.citizenship for student in suite2.students])
-    num_locals = citizenships.count(Citizenship.LOCAL)
-    num_intls = citizenships.count(Citizenship.INTERNATIONAL)
+    students = suite1.students + suite2.students
+    num_locals = [student.data.citizenship for student in students].count(Citizenship.LOCAL)
+    num_intls = len(students) - num_locals
 
-    citizenship_diversity = abs(num_locals - num_intls) / 2
+    if num_locals <= MAX_GROUP_SIZE and num_intls <= MAX_GROUP_SIZE:
+        citizenship_diversity = RCA_CITIZENSHIP_DIVERSITY[num_locals][num_intls]
+    else:
+        citizenship_diversity = abs(num_locals - num_intls) / 2
 
-    overseas_countries = ([country for student in suite1.students
-                           for country in student.data.country if country != "Singapore"]
-                          + [country for student in suite2.students
-                             for country in student.data.country if country != "Singapore"])
-    country_diversity = len(overseas_countries) - len(set(overseas_countries)) / 3
+    overseas_countries = [country for student in students for country in student.data.country if country != "Singapore"]
+    distinct_countries = set(overseas_countries)
+    country_diversity = lookup_rca_duplicates(len(overseas_countries), len(distinct_countries))
 
-    schools = ([student.data.school for student in suite1.students]
-               + [student.data.school for student in suite2.students])
-    school_diversity = len(schools) - len(set(schools)) / 3
+    schools = [student.data.school for student in students]
+    school_diversity = lookup_rca_duplicates(len(schools), len(set(schools)))
 
     score = 0.4 * citizenship_diversity + 0.3 * country_diversity + 0.3 * school_diversity
 
@@ -122,7 +125,7 @@ def rca_demographic_scores(suite1, suite2):
 
     # TEMPORARY FIXES FOR 2021 ALLOCATION (CLASS OF 2025) #
     # Prevent South Asian countries from being in the same RCA
-    if len(SOUTH_ASIAN_COUNTRIES.intersection(set(overseas_countries))) > 1:
+    if len(SOUTH_ASIAN_COUNTRIES.intersection(distinct_countries)) > 1:
         score += 2000
     # Make sure RCA groupings have one student from China, to prevent leftover female suites from having too many
     # students from China
@@ -180,6 +183,10 @@ def demographic_scores(students):
     citizenship_diversity = citizenship_diversity_score(students)
     country_diversity = country_diversity_score(students)
     school_diversity = school_diversity_score(students)
+    return combine_demographic_scores(citizenship_diversity, country_diversity, school_diversity)
+
+
+def combine_demographic_scores(citizenship_diversity, country_diversity, school_diversity):
     return 0.4 * citizenship_diversity + 0.3 * country_diversity + 0.3 * school_diversity
 
 
@@ -191,10 +198,73 @@ def calculate_success(students, demographic_weight=0.4):
     demographic_score = demographic_scores(students)
     # pref_score = 0.2 * sleep_prefs + 0.4 * suite_prefs + 0.2 * cleanliness_prefs + 0.2 * alcohol_prefs
     pref_score = living_pref_scores(students, higher_better=True)
+    return combine_success_scores(demographic_score, pref_score, demographic_weight)
+
+
+def combine_success_scores(demographic_score, pref_score, demographic_weight=0.4):
     score = demographic_weight * demographic_score + (1 - demographic_weight) * pref_score
     return score
 
 
+def suite_scores(students):
+    """Calculates every score of a suite that is reported in the results, computing each component only once.
+
+    The scores are the same as those returned by citizenship_diversity_score(), country_diversity_score(),
+    school_diversity_score(), living_pref_score() (higher is better), demographic_scores(), living_pref_scores()
+    (higher is better) and calculate_success().
+
+    Returns:
+        A dictionary mapping the name of each score to its value. The score of each living preference is keyed by
+        "Score: {living_pref}".
+    """
+    citizenship_diversity = citizenship_diversity_score(students)
+    country_diversity = country_diversity_score(students)
+    school_diversity = school_diversity_score(students)
+    pref_scores = {living_pref: living_pref_score(students, living_pref, higher_better=True)
+                   for living_pref in Scores.get_weights()}
+    demographic_score = combine_demographic_scores(citizenship_diversity, country_diversity, school_diversity)
+    pref_score = sum(pref_scores[living_pref] * weight for living_pref, weight in Scores.get_weights().items())
+    return {
+        "Citizenship Diversity": citizenship_diversity,
+        "Country Diversity": country_diversity,
+        "School Diversity": school_diversity,
+        **{f"Score: {living_pref}": score for living_pref, score in pref_scores.items()},
+        "Demographic Score": demographic_score,
+        "Living Pref Score": pref_score,
+        "Final Score": combine_success_scores(demographic_score, pref_score),
+    }
+
+
+def rescore_suites(suite_scores, weights, demographic_weight=0.4):
+    """Recalculates the living preference and final scores of many suites at once under other weights.
+
+    The score of each living preference and the demographic score of a suite do not depend on the weights, so the new
+    scores are weighted sums of the columns of suite_scores, without looking at the students. With the weights that
+    suite_scores were calculated with, the scores are the same as those of suite_scores().
+
+    Args:
+        suite_scores: A dictionary mapping the name of each score (see suite_scores()) to an array with the score of
+            each suite, as returned by ASAP.score_suites().
+        weights: A dictionary mapping each living preference to its weight. The weights should sum to 1.
+        demographic_weight: (optional) The weight of the demographic score in the final score (see
+            calculate_success()).
+
+    Returns:
+        A dictionary mapping "Demographic Score", "Living Pref Score" and "Final Score" to an array with the score of
+        each suite.
+    """
+    demographic_score = np.asarray(suite_scores["Demographic Score"], dtype=float)
+    pref_score = np.zeros(len(demographic_score))
+    # Adding the weighted scores one living preference at a time matches the order of the sum in suite_scores()
+    for living_pref, weight in weights.items():
+        pref_score = pref_score + np.asarray(suite_scores[f"Score: {living_pref}"], dtype=float) * weight
+    return {
+        "Demographic Score": demographic_score,
+        "Living Pref Score": pref_score,
+        "Final Score": combine_success_scores(demographic_score, pref_score, demographic_weight),
+    }
+
+
 # def get_suite_score(citizenship, school_diversity, sleep_prefs, suite_prefs, cleanliness_prefs, alcohol_prefs, demographic_weight=0.4):
 #     demographic_score = 0.6 * citizenship + 0.4 * school_diversity
 #     pref_score = 0.2 * sleep_prefs + 0.4 * suite_prefs + 0.2 * cleanliness_prefs + 0.2 * alcohol_prefs
@@ -203,9 +273,21 @@ def calculate_success(students, demographic_weight=0.4):
 
 
 def citizenship_diversity_score(students):
-    citizenships = [student.data.citizenship for student in students]
-    num_locals = citizenships.count(Citizenship.LOCAL)
-    num_intls = citizenships.count(Citizenship.INTERNATIONAL)
+    num_locals = [student.data.citizenship for student in students].count(Citizenship.LOCAL)
+    return lookup_citizenship_diversity(num_locals, len(students) - num_locals)
+
+
+def country_diversity_score(students):
+    overseas_countries = [country for student in students for country in student.data.country if country != "Singapore"]
+    return lookup_duplicates(COUNTRY_DIVERSITY, len(overseas_countries) - len(set(overseas_countries)))
+
+
+def school_diversity_score(students):
+    schools = [student.data.school for student in students]
+    return lookup_duplicates(SCHOOL_DIVERSITY, len(schools) - len(set(schools)))
+
+
+def _citizenship_diversity(num_locals, num_intls):
     try:
         ratio = num_locals / num_intls
     except ZeroDivisionError:
@@ -224,30 +306,77 @@ def citizenship_diversity_score(students):
         return 0
 
 
-def country_diversity_score(students):
-    overseas_countries = [country for student in students for country in student.data.country if country != "Singapore"]
-    if len(overseas_countries) == len(set(overseas_countries)):
-        return 1
-    elif len(overseas_countries) - len(set(overseas_countries)) == 1:
-        return 0.5
-    else:
-        return 0
+# The diversity scores only depend on small counts (of locals and internationals, and of duplicate countries and
+# schools), so they are looked up in tables indexed by those counts instead of being worked out every time. Every
+# table has an entry for each count up to MAX_GROUP_SIZE (the number of students in an RCA group), and the tables of
+# duplicates end with the score for all larger counts. The tables are built with the same arithmetic as the original
+# calculations, so the scores are exactly the same.
+MAX_GROUP_SIZE = 12
+CITIZENSHIP_DIVERSITY = tuple(tuple(_citizenship_diversity(num_locals, num_intls)
+                                    for num_intls in range(MAX_GROUP_SIZE + 1))
+                              for num_locals in range(MAX_GROUP_SIZE + 1))
+COUNTRY_DIVERSITY = (1, 0.5, 0)
+SCHOOL_DIVERSITY = (1, 0.5, 0.3, 0.2, 0.1, 0)
+RCA_CITIZENSHIP_DIVERSITY = tuple(tuple(abs(num_locals - num_intls) / 2 for num_intls in range(MAX_GROUP_SIZE + 1))
+                                  for num_locals in range(MAX_GROUP_SIZE + 1))
+# Indexed by the number of values (countries or schools) and the number of distinct values in an RCA group
+RCA_DUPLICATES = tuple(tuple(num_values - num_distinct / 3 for num_distinct in range(num_values + 1))
+                       for num_values in range(MAX_GROUP_SIZE + 1))
 
 
-def school_diversity_score(students):
+def lookup_citizenship_diversity(num_locals, num_intls):
+    if num_locals <= MAX_GROUP_SIZE and num_intls <= MAX_GROUP_SIZE:
+        return CITIZENSHIP_DIVERSITY[num_locals][num_intls]
+    return _citizenship_diversity(num_locals, num_intls)
+
+
+def lookup_duplicates(table, num_duplicates):
+    return table[min(num_duplicates, len(table) - 1)]
+
+
+def lookup_rca_duplicates(num_values, num_distinct):
+    if num_values <= MAX_GROUP_SIZE:
+        return RCA_DUPLICATES[num_values][num_distinct]
+    return num_values - num_distinct / 3
+
+
+def diversity_counts(students):
+    """Returns the counts that the diversity scores of a suite depend on.
+
+    Returns:
+        A tuple of the number of local students, the number of international students, the number of duplicate
+        overseas countries and the number of duplicate schools.
+    """
+    num_locals = [student.data.citizenship for student in students].count(Citizenship.LOCAL)
+    overseas_countries = [country for student in students for country in student.data.country if country != "Singapore"]
     schools = [student.data.school for student in students]
-    if len(schools) == len(set(schools)):
-        return 1
-    elif len(schools) - len(set(schools)) == 1:
-        return 0.5
-    elif len(schools) - len(set(schools)) == 2:
-        return 0.3
-    elif len(schools) - len(set(schools)) == 3:
-        return 0.2
-    elif len(schools) - len(set(schools)) == 4:
-        return 0.1
-    else:
-        return 0
+    return (num_locals, len(students) - num_locals, len(overseas_countries) - len(set(overseas_countries)),
+            len(schools) - len(set(schools)))
+
+
+def diversity_scores_from_counts(num_locals, num_intls, country_duplicates, school_duplicates):
+    """Looks up the diversity scores of many suites at once from arrays of their counts (see diversity_counts()).
+
+    Args:
+        num_locals: An array of the number of local students in each suite.
+        num_intls: An array of the number of international students in each suite.
+        country_duplicates: An array of the number of duplicate overseas countries in each suite.
+        school_duplicates: An array of the number of duplicate schools in each suite.
+
+    Returns:
+        A tuple of float arrays of the citizenship, country and school diversity scores and the demographic score of
+        each suite.
+    """
+    num_locals = np.asarray(num_locals)
+    num_intls = np.asarray(num_intls)
+    if num_locals.size and max(num_locals.max(), num_intls.max()) > MAX_GROUP_SIZE:
+        raise ValueError(f"Suites with more than {MAX_GROUP_SIZE} locals or internationals cannot be looked up.")
+    citizenship_diversity = np.array(CITIZENSHIP_DIVERSITY, dtype=float)[num_locals, num_intls]
+    country_diversity = np.array(COUNTRY_DIVERSITY, dtype=float)[
+        np.minimum(country_duplicates, len(COUNTRY_DIVERSITY) - 1)]
+    school_diversity = np.array(SCHOOL_DIVERSITY, dtype=float)[np.minimum(school_duplicates, len(SCHOOL_DIVERSITY) - 1)]
+    demographic_score = combine_demographic_scores(citizenship_diversity, country_diversity, school_diversity)
+    return citizenship_diversity, country_diversity, school_diversity, demographic_score
 
 
 # def sleep_pref_score(students):
@@ -267,21 +396,41 @@ def school_diversity_score(students):
 
 
 class Scores:
-    max_scores = {}
-    weights = {}
+    """Holds the max score and weight of each living preference.
+
+    These are stored separately for each thread, so that allocations for different sessions can run side by side
+    without overwriting each other's weights.
+    """
+    _local = threading.local()
 
     @staticmethod
     def set_max_scores(living_pref_unique_options):
-        for living_pref, unique_options in living_pref_unique_options.items():
-            Scores.max_scores[living_pref] = get_max_score(unique_options)
+        Scores._local.max_scores = {living_pref: get_max_score(unique_options)
+                                    for living_pref, unique_options in living_pref_unique_options.items()}
 
     @staticmethod
     def set_weights(weights):
-        Scores.weights = weights
+        Scores._local.weights = weights
+
+    @staticmethod
+    def get_weights():
+        return getattr(Scores._local, "weights", {})
+
+    @staticmethod
+    def get_state():
+        """Returns the max scores and weights of this thread, so that they can be applied in another process."""
+        return getattr(Scores._local, "max_scores", None), Scores.get_weights()
+
+    @staticmethod
+    def set_state(state):
+        max_scores, weights = state
+        if max_scores is not None:
+            Scores._local.max_scores = max_scores
+        Scores._local.weights = weights
 
     @staticmethod
     def get_max(living_pref):
         try:
-            return Scores.max_scores[living_pref]
-        except KeyError:
+            return Scores._local.max_scores[living_pref]
+        except (AttributeError, KeyError):
             raise RuntimeError(f"Max score has not yet been set for {living_pref}.")
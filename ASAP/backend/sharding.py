@@ -0,0 +1,313 @@
+"""This module provides sharded allocation of suites, which makes very large cohorts tractable.
+
+The cost of allocating the students of one sex grows quadratically with their number, because every student is scored
+against every suite in every round. In sharded mode, the students of each sex are split into shards that are allocated
+independently (in parallel, in separate processes), and their suites are then combined.
+
+Shards are stratified: students are grouped by their available RCs, citizenship and accessibility, and every group is
+dealt out evenly across the shards, so each shard has the same mix of students as the whole cohort. The shard sizes are
+then adjusted so that every shard except the last fills its suites exactly, so sharding uses no more suites than an
+unsharded allocation.
+
+Students can only share a suite with students from the same shard, so a repair pass then swaps students between suites
+of different shards whenever that improves the combined success score of both suites. The success score does not
+penalise the constraints that the suite rounds enforce (see num_violations()), so a swap is never made if it leaves
+either suite breaking one of them.
+
+    Typical usage example:
+
+    suites = allocate_sharded(female_students, "Female", num_a11y_females, num_shards=4, num_restarts=10)
+"""
+
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import random
+from typing import List, Optional, Tuple
+
+from ASAP.backend import instrumentation
+from ASAP.backend import scoring
+from ASAP.backend import streaming
+from ASAP.backend.allocation import SuiteAllocation
+from ASAP.backend.student import StudentData
+
+RC_LIST = ("Saga", "Elm", "Cendana")
+# Shards smaller than this are merged, as the suites of small shards are allocated from too few students
+MIN_SHARD_STUDENTS = 120
+# Number of suites from other shards that each suite tries to swap students with in the repair pass
+REPAIR_CANDIDATES = 8
+# Same penalty as scoring.calculate_score(), so that a swap which fixes a broken constraint outweighs any success score
+VIOLATION_PENALTY = 2000
+
+
+def split_into_shards(students: List[StudentData], num_shards, rng=random) -> List[List[StudentData]]:
+    """Splits students into shards that have the same mix of available RCs, citizenship and accessibility.
+
+    Args:
+        students: A list of StudentData objects of one sex.
+        num_shards: An integer representing the number of shards. Fewer shards are returned if there are not enough
+            students for every shard to have at least MIN_SHARD_STUDENTS.
+        rng: (optional) The random number generator used to shuffle the students.
+
+    Returns:
+        A list of lists of StudentData objects, one for each shard.
+    """
+    num_shards = max(1, min(num_shards, len(students) // MIN_SHARD_STUDENTS))
+    groups = collections.defaultdict(list)
+    for student in students:
+        groups[tuple(sorted(student.available_rcs)), student.citizenship, student.accessibility].append(student)
+    shards = [[] for _ in range(num_shards)]
+    i = 0
+    # Continuing to deal from the shard where the previous group stopped keeps the shards within one student in size
+    for key in sorted(groups, key=str):
+        group = groups[key]
+        rng.shuffle(group)
+        for student in group:
+            shards[i % num_shards].append(student)
+            i += 1
+
+    # A suite with an accessibility student has 5 places, and every other suite has 6, so a shard fills its suites
+    # exactly if it has a multiple of 6 students once 5 are counted for every accessibility student. The students that
+    # are left over are moved to the last shard.
+    for shard in shards[:-1]:
+        num_a11y = sum(student.accessibility for student in shard)
+        leftover = (len(shard) - num_a11y * 5) % 6
+        movable = [student for student in shard if not student.accessibility]
+        for student in rng.sample(movable, leftover):
+            shard.remove(student)
+            shards[-1].append(student)
+    return shards
+
+
+def allocate_shard(students, name, num_a11y_students, num_restarts, seed, scores_state, top_k=None, exact_mode=None,
+                   stop_event=None) -> Tuple[float, list, instrumentation.RunReport]:
+    """Runs the restarts of one shard and returns its best allocation. This runs in a worker process.
+
+    Args:
+        students: A list of StudentData objects.
+        name: A string representing the name of the suites (e.g. "Female").
+        num_a11y_students: An integer representing the number of accessibility students in the shard.
+        num_restarts: An integer representing the number of restarts.
+        seed: The seed of the shard's random number generator.
+        scores_state: The max scores and weights of the living preferences (see scoring.Scores.get_state()).
+        top_k: (optional) The number of candidates ranked in suite rounds (see match.generate_ranking()).
+        exact_mode: (optional) An exact.ExactMode object if small suite rounds are solved exactly.
+        stop_event: (optional) An event that is set to stop after the current restart.
+
+    Returns:
+        A tuple of the best global score, the suites of the best allocation and the run report of the shard.
+    """
+    scoring.Scores.set_state(scores_state)
+    rng = random.Random(seed)
+    best_score = None
+    best_suites = None
+    report = instrumentation.RunReport()
+    restart_stats = streaming.RestartStats()
+    with instrumentation.recording(report), instrumentation.phase("Restarts"):
+        instrumentation.record_restarts(f"{name} suites", restart_stats)
+        for _ in range(num_restarts):
+            if best_suites is not None and stop_event is not None and stop_event.is_set():
+                break
+            instrumentation.count("Restarts")
+            suite_allocation = SuiteAllocation(students, name, num_a11y_students, rng, top_k, exact_mode)
+            suite_allocation.match()
+            global_score = suite_allocation.global_score()
+            restart_stats.add(global_score)
+            # Later allocations replace earlier ones with the same score, as in ASAP.allocate_suites()
+            if best_score is None or global_score >= best_score:
+                best_score = global_score
+                best_suites = suite_allocation.get_allocation()
+    return best_score, best_suites, report
+
+
+def allocate_sharded(students, name, num_a11y_students, num_shards, num_restarts, rng=random, progress=None,
+                     should_stop=None, max_workers=None, top_k=None, exact_mode=None) -> list:
+    """Allocates students to suites in shards, then repairs the combined allocation.
+
+    Args:
+        students: A list of StudentData objects of one sex.
+        name: A string representing the name of the suites (e.g. "Female").
+        num_a11y_students: An integer representing the number of accessibility students.
+        num_shards: An integer representing the number of shards.
+        num_restarts: An integer representing the number of restarts of every shard.
+        rng: (optional) The random number generator used to split the students and seed the shards.
+        progress: (optional) A function that is called after every shard with the same arguments as the progress
+            function of ASAP.run_allocation().
+        should_stop: (optional) A function that is polled while the shards run. If it returns True, every shard
+            stops after its current restart.
+        max_workers: (optional) An integer representing the maximum number of worker processes. Defaults to the number
+            of CPUs. With 1, the shards run one after another in this process.
+        top_k: (optional) The number of candidates ranked in suite rounds (see match.generate_ranking()).
+        exact_mode: (optional) An exact.ExactMode object if small suite rounds are solved exactly.
+
+    Returns:
+        A list of the suites of the allocation, numbered from 1 across all shards.
+    """
+    with instrumentation.phase("Sharding"):
+        shards = split_into_shards(students, num_shards, rng)
+    seeds = [rng.getrandbits(64) for _ in shards]
+    scores_state = scoring.Scores.get_state()
+    num_workers = min(len(shards), max_workers or os.cpu_count() or 1)
+    args = [(shard, name, sum(student.accessibility for student in shard), num_restarts, seed, scores_state,
+             top_k, exact_mode) for shard, seed in zip(shards, seeds)]
+    print(f"Allocating {len(students)} {name.lower()} students in {len(shards)} shards")
+    if progress:
+        progress(f"{name} suites", 0, num_restarts * len(shards), None)
+
+    results = []
+    if num_workers == 1:
+        for shard_args in args:
+            results.append(allocate_shard(*shard_args, StopCheck(should_stop)))
+            if progress:
+                progress(f"{name} suites", num_restarts * len(results), num_restarts * len(shards), None)
+    else:
+        context = multiprocessing.get_context("spawn")
+        with context.Manager() as manager, concurrent.futures.ProcessPoolExecutor(num_workers, context) as executor:
+            stop_event = manager.Event()
+            futures = [executor.submit(allocate_shard, *shard_args, stop_event) for shard_args in args]
+            pending = set(futures)
+            while pending:
+                done, pending = concurrent.futures.wait(pending, timeout=0.5)
+                if done and progress:
+                    completed = num_restarts * (len(futures) - len(pending))
+                    progress(f"{name} suites", completed, num_restarts * len(shards), None)
+                if should_stop and should_stop():
+                    stop_event.set()
+            results = [future.result() for future in futures]
+
+    suites = []
+    shard_ids = []
+    for shard_id, (_, shard_suites, report) in enumerate(results):
+        suites.extend(shard_suites)
+        shard_ids.extend([shard_id] * len(shard_suites))
+        if instrumentation.active():
+            # Every shard has its own restarts, so their statistics are kept apart
+            report.restart_stats = {f"{phase} (shard {shard_id + 1})": stats
+                                    for phase, stats in report.restart_stats.items()}
+            instrumentation.active().merge(report)
+    with instrumentation.phase("Repair"):
+        num_swaps = repair(suites, shard_ids, rng)
+    instrumentation.count("Repair swaps", num_swaps)
+    for i, suite in enumerate(suites, 1):
+        suite.suite_num = f"FY {name} Suite {i:02d}" + (" (Accessibility)" if suite.accessibility else "")
+    final_score = sum(scoring.calculate_success(suite.students) for suite in suites) / len(suites)
+    print(f"Repair pass made {num_swaps} swaps between shards")
+    print(f"\nFinal score: {final_score}\n")
+    if progress:
+        progress(f"{name} suites", num_restarts * len(shards), num_restarts * len(shards), final_score)
+    return suites
+
+
+class StopCheck:
+    """Makes a should_stop function look like an event, so that shards that run in this process can be stopped"""
+
+    def __init__(self, should_stop):
+        self.should_stop = should_stop
+
+    def is_set(self):
+        return bool(self.should_stop and self.should_stop())
+
+
+def repair(suites, shard_ids, rng=random, num_candidates=REPAIR_CANDIDATES) -> int:
+    """Swaps students between suites of different shards when that improves the success scores of both suites combined.
+
+    Every suite is compared with num_candidates random suites from other shards, and the best swap of one student from
+    each (if any improves the combined score) is made. Only students that are both accessibility students or both not
+    are swapped, both suites must still have an RC that all their students can live in, and neither suite may break a
+    constraint after the swap (see num_violations()). A suite that already breaks one counts as VIOLATION_PENALTY less
+    per constraint, so swaps that fix it are preferred.
+
+    Args:
+        suites: A list of SuiteData objects.
+        shard_ids: A list of the shard of each suite.
+        rng: (optional) The random number generator used to choose the candidates.
+        num_candidates: (optional) An integer representing the number of suites that each suite is compared with.
+
+    Returns:
+        An integer representing the number of swaps made.
+    """
+    if len(set(shard_ids)) < 2:
+        return 0
+    scores = [repair_score(suite.students) for suite in suites]
+    num_swaps = 0
+    for a in range(len(suites)):
+        candidates = [b for b in rng.sample(range(len(suites)), min(len(suites), 2 * num_candidates))
+                      if shard_ids[b] != shard_ids[a]][:num_candidates]
+        for b in candidates:
+            swap = best_swap(suites[a], suites[b], scores[a] + scores[b])
+            if swap is None:
+                continue
+            i, j, scores[a], scores[b] = swap
+            student_a = suites[a].students[i]
+            student_b = suites[b].students[j]
+            suites[a].students[i] = student_b
+            suites[b].students[j] = student_a
+            student_a.current_choice, student_b.current_choice = student_b.current_choice, student_a.current_choice
+            suites[a].allowable_rcs = allowable_rcs(suites[a].students)
+            suites[b].allowable_rcs = allowable_rcs(suites[b].students)
+            num_swaps += 1
+    return num_swaps
+
+
+def best_swap(suite_a, suite_b, current_score) -> Optional[Tuple[int, int, float, float]]:
+    """Returns the swap of a student of suite_a with a student of suite_b that most improves their combined score.
+
+    Args:
+        suite_a: A SuiteData object.
+        suite_b: A SuiteData object.
+        current_score: A float representing the combined repair_score() of both suites before the swap.
+
+    Returns:
+        A tuple of the index of the student in suite_a, the index of the student in suite_b and the new scores of both
+        suites, or None if no swap improves the combined score.
+    """
+    best = None
+    best_score = current_score
+    for i, student_a in enumerate(suite_a.students):
+        others_a = suite_a.students[:i] + suite_a.students[i + 1:]
+        for j, student_b in enumerate(suite_b.students):
+            if student_a.data.accessibility != student_b.data.accessibility:
+                continue
+            students_a = others_a + [student_b]
+            students_b = suite_b.students[:j] + suite_b.students[j + 1:] + [student_a]
+            # Students who can live in the same RCs can always be swapped
+            if (student_a.data.available_rcs != student_b.data.available_rcs
+                    and (not allowable_rcs(students_a) or not allowable_rcs(students_b))):
+                continue
+            if num_violations(students_a) or num_violations(students_b):
+                continue
+            score_a = scoring.calculate_success(students_a)
+            score_b = scoring.calculate_success(students_b)
+            # Ignore improvements that are only floating-point noise
+            if score_a + score_b > best_score + 1e-9:
+                best = (i, j, score_a, score_b)
+                best_score = score_a + score_b
+    return best
+
+
+def repair_score(students) -> float:
+    return scoring.calculate_success(students) - VIOLATION_PENALTY * num_violations(students)
+
+
+def num_violations(students) -> int:
+    """Returns the number of constraints that a suite breaks, i.e. that scoring.calculate_score() adds 2000 for.
+
+    The constraints are: no duplicate overseas countries, no duplicate schools, and at most one South Asian and at most
+    one non-Asian country.
+    """
+    overseas_countries = [country for student in students for country in student.data.country
+                          if country != "Singapore"]
+    schools = [student.data.school for student in students]
+    distinct_countries = set(overseas_countries)
+    return ((len(overseas_countries) > len(distinct_countries))
+            + (len(schools) > len(set(schools)))
+            + (len(scoring.SOUTH_ASIAN_COUNTRIES.intersection(distinct_countries)) > 1)
+            + (len(scoring.NON_ASIAN_COUNTRIES.intersection(distinct_countries)) > 1))
+
+
+def allowable_rcs(students):
+    rcs = set(RC_LIST)
+    for student in students:
+        rcs.intersection_update(student.data.available_rcs)
+    return rcs
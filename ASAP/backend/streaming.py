@@ -0,0 +1,211 @@
+"""This module provides statistics of the global scores of restarts that are updated in constant memory.
+
+RestartStats summarises the distribution of the global scores of the restarts of a phase without keeping the scores:
+their mean and variance (Welford's algorithm), their quantiles (the P² algorithm of Jain and Chlamtac, which estimates
+a quantile from five markers), a histogram whose bins widen as the scores spread out, and the best score so far after
+each restart that improved it. The best-so-far curve only grows when a restart beats every earlier one, which happens
+about ln(n) times in n restarts.
+
+The summary shows whether the number of restarts is worth its cost: if the best score stopped improving long before
+the last restart, or the best score is far above the 90th percentile, fewer or more restarts may be needed.
+
+    Typical usage example:
+
+    stats = RestartStats()
+    for _ in range(num_restarts):
+        stats.add(global_score)
+    print(stats.as_dict())
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+QUANTILES = (0.1, 0.5, 0.9)
+NUM_BINS = 20
+# Scores are between 0 and 1, so the bins start narrow and double in width until the scores fit in them
+INITIAL_BIN_WIDTH = 2 ** -12
+
+
+class RunningStats:
+    """Contains the count, mean, variance, minimum and maximum of a stream of values (Welford's algorithm)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def variance(self) -> Optional[float]:
+        """Returns the sample variance, or None if there are fewer than two values."""
+        return self._m2 / (self.count - 1) if self.count > 1 else None
+
+    def std(self) -> Optional[float]:
+        variance = self.variance()
+        return math.sqrt(variance) if variance is not None else None
+
+
+class P2Quantile:
+    """Estimates a quantile of a stream of values from five markers (the P² algorithm)
+
+    The markers are the minimum, the maximum, the quantile and the quantiles halfway between it and each end. After
+    every value, the middle markers are moved towards their desired positions, and their heights are adjusted with a
+    piecewise-parabolic interpolation. The estimate is exact for the first five values.
+
+    Attributes:
+        p: A float between 0 and 1 representing the quantile.
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self._heights: List[float] = []
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, value):
+        heights = self._heights
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= heights[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            self._positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+        for i in range(1, 4):
+            self._adjust(i)
+
+    def _adjust(self, i):
+        heights = self._heights
+        positions = self._positions
+        d = self._desired[i] - positions[i]
+        if not ((d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1)):
+            return
+        d = 1 if d > 0 else -1
+        # Piecewise-parabolic prediction of the new height, which is only used if it stays between the neighbours
+        height = heights[i] + d / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + d) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+            + (positions[i + 1] - positions[i] - d) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1]))
+        if not heights[i - 1] < height < heights[i + 1]:
+            height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+        heights[i] = height
+        positions[i] += d
+
+    def value(self) -> Optional[float]:
+        """Returns the estimate of the quantile, or None if there are no values."""
+        heights = self._heights
+        if not heights:
+            return None
+        if len(heights) < 5 or self._positions[4] < 5:
+            # Linear interpolation between the sorted values, as in numpy.quantile()
+            position = self.p * (len(heights) - 1)
+            lower = math.floor(position)
+            upper = min(lower + 1, len(heights) - 1)
+            return heights[lower] + (heights[upper] - heights[lower]) * (position - lower)
+        return heights[2]
+
+
+class StreamingHistogram:
+    """Counts values in a fixed number of bins that widen as the values spread out
+
+    Bin i covers [(start + i) * width, (start + i + 1) * width). When a value falls outside the bins, the width is
+    doubled (and neighbouring bins merged) until it fits, so the bins always cover every value with the same memory.
+
+    Attributes:
+        num_bins: An integer representing the number of bins.
+        width: A float representing the width of each bin.
+        counts: A list of the number of values in each bin.
+    """
+
+    def __init__(self, num_bins=NUM_BINS, width=INITIAL_BIN_WIDTH):
+        self.num_bins = num_bins
+        self.width = width
+        self.counts = [0] * num_bins
+        self._start: Optional[int] = None
+
+    def add(self, value):
+        index = math.floor(value / self.width)
+        if self._start is None:
+            self._start = index - self.num_bins // 2
+        while not self._start <= index < self._start + self.num_bins:
+            self._widen()
+            index = math.floor(value / self.width)
+        self.counts[index - self._start] += 1
+
+    def _widen(self):
+        # Bins are aligned to multiples of their width, so each new bin is made of exactly two old bins. The old bins
+        # fill the middle half of the new ones, so the bins can grow in either direction.
+        new_start = self._start // 2 - self.num_bins // 4
+        counts = [0] * self.num_bins
+        for i, count in enumerate(self.counts):
+            counts[(self._start + i) // 2 - new_start] += count
+        self._start = new_start
+        self.counts = counts
+        self.width *= 2
+
+    def bins(self) -> List[Tuple[float, float, int]]:
+        """Returns the lower edge, upper edge and count of each bin from the first to the last non-empty bin."""
+        used = [i for i, count in enumerate(self.counts) if count]
+        if not used:
+            return []
+        return [((self._start + i) * self.width, (self._start + i + 1) * self.width, self.counts[i])
+                for i in range(used[0], used[-1] + 1)]
+
+
+class RestartStats:
+    """Contains the statistics of the global scores of the restarts of a phase
+
+    Attributes:
+        scores: A RunningStats object of the global scores.
+        quantiles: A list of P2Quantile objects, one for each of QUANTILES.
+        histogram: A StreamingHistogram object of the global scores.
+        best_so_far: A list of tuples of the number of a restart (from 1) that improved on every earlier restart, and
+            its global score.
+    """
+
+    def __init__(self):
+        self.scores = RunningStats()
+        self.quantiles = [P2Quantile(p) for p in QUANTILES]
+        self.histogram = StreamingHistogram()
+        self.best_so_far: List[Tuple[int, float]] = []
+
+    def add(self, score):
+        self.scores.add(score)
+        for quantile in self.quantiles:
+            quantile.add(score)
+        self.histogram.add(score)
+        if not self.best_so_far or score > self.best_so_far[-1][1]:
+            self.best_so_far.append((self.scores.count, score))
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Returns the statistics as a JSON-serialisable dictionary."""
+        return {
+            "count": self.scores.count,
+            "mean": self.scores.mean if self.scores.count else None,
+            "std": self.scores.std(),
+            "min": self.scores.min,
+            "max": self.scores.max,
+            "quantiles": {f"{quantile.p:.0%}": quantile.value() for quantile in self.quantiles},
+            "best_so_far": [list(point) for point in self.best_so_far],
+            "last_improvement": self.best_so_far[-1][0] if self.best_so_far else None,
+            "histogram": [{"low": low, "high": high, "count": count} for low, high, count in self.histogram.bins()],
+        }
@@ -1,3 +1,6 @@
+import importlib
+
+
 def input_yes_no(message, /, *, full_message=None, true_input=("y", "Y"), false_input=('n', "N"),
                  try_again_text="Oops! Please enter 'y' or 'n': "):
     """Gets a boolean user input (typically 'y' or 'n').
@@ -25,4 +28,34 @@ def input_yes_no(message, /, *, full_message=None, true_input=("y", "Y"), false_
             return True
         elif response in false_input:
             return False
-        response = input(try_again_text)
\ No newline at end of file
+        response = input(try_again_text)
+
+
+class LazyModule:
+    """A module that is only imported when one of its attributes is first used.
+
+    Importing pandas and numpy takes a noticeable fraction of the startup time, so modules that only need them once
+    an allocation is being set up can use this in place of a normal import, e.g. pd = LazyModule("pandas").
+
+    Attributes:
+        name: A string representing the full name of the module.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        # Only called for attributes that are not found normally, i.e. those of the module
+        if self._module is None:
+            self._module = importlib.import_module(self.name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self.name}'{' (imported)' if self._module else ''}>"
+
+
+def preload(*names):
+    """Imports modules ahead of time (e.g. in a background thread) so that their first use is not slowed down."""
+    for name in names:
+        importlib.import_module(name)
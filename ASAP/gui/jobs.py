@@ -0,0 +1,189 @@
+"""This module provides background jobs that run allocations without blocking the server.
+
+Each job runs ASAP.run_allocation() in its own thread and records its progress (the current phase, the number of
+restarts completed, the best score so far for each sex and an estimate of the time remaining), so that the browser can
+poll for it while the allocation runs. A job can be cancelled, which skips the remaining restarts and keeps the best
+allocation found so far. Completed restarts are checkpointed, so a job that is cancelled or interrupted by the program
+closing can be resumed later without redoing them.
+
+    Typical usage example:
+
+    job = jobs.start(session_key, asap_obj, lock=store.lock(session_key), on_completed=store.put,
+                     on_failed=store.revert)
+    status = jobs.get(job.id).status()
+"""
+
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, Optional
+
+from ASAP.__main__ import ASAP
+from ASAP.backend.cache import AllocationCache
+from ASAP.backend.checkpoint import RestartCheckpoint
+from ASAP.backend.history import RunHistory
+
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+# Finished jobs are forgotten after this many seconds
+JOB_RETENTION = 60 * 60
+
+
+class AllocationJob:
+    """Contains the progress of an allocation that is running in the background
+
+    Attributes:
+        id: A string that uniquely identifies the job.
+        session_key: A string representing the session that the job belongs to.
+        state: A string representing whether the job is running, completed, cancelled or failed.
+        phase: A string representing the current phase (e.g. "Female suites", "Male suites", "RCA match").
+        restarts_completed: A dictionary mapping each phase to the number of restarts completed.
+        restarts_total: A dictionary mapping each phase to the total number of restarts.
+        best_scores: A dictionary mapping each phase to the best global score so far.
+        error_msg: A string describing the error if the job failed.
+    """
+
+    def __init__(self, session_key, num_restarts):
+        self.id = uuid.uuid4().hex
+        self.session_key = session_key
+        self.state = RUNNING
+        self.phase = "Starting"
+        self.restarts_completed: Dict[str, int] = {"Female suites": 0, "Male suites": 0}
+        self.restarts_total: Dict[str, int] = {"Female suites": num_restarts, "Male suites": num_restarts}
+        self.best_scores: Dict[str, Optional[float]] = {"Female suites": None, "Male suites": None}
+        self.error_msg = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.restarts_resumed = 0
+        self._cancel_event = threading.Event()
+
+    def update(self, phase, completed, total, best_score):
+        """Records the progress of the allocation. Passed to ASAP.run_allocation() as the progress function."""
+        self.phase = phase
+        if phase in self.restarts_total:
+            self.restarts_completed[phase] = completed
+            self.restarts_total[phase] = total
+            self.best_scores[phase] = best_score
+
+    def cancel(self):
+        """Asks the allocation to stop after the current restart."""
+        self._cancel_event.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.state != RUNNING
+
+    def eta(self) -> Optional[float]:
+        """Returns the estimated number of seconds until the job finishes, based on the time taken per restart."""
+        if self.finished:
+            return 0
+        completed = sum(self.restarts_completed.values())
+        # Restarts loaded from a checkpoint took no time in this job
+        completed_in_job = completed - self.restarts_resumed
+        if not completed_in_job:
+            return None
+        remaining = sum(self.restarts_total.values()) - completed
+        return (time.time() - self.started_at) / completed_in_job * remaining
+
+    def status(self):
+        """Returns a JSON-serialisable dictionary describing the progress of the job."""
+        return {
+            "id": self.id,
+            "state": self.state,
+            "phase": self.phase,
+            "restarts_completed": self.restarts_completed,
+            "restarts_total": self.restarts_total,
+            "best_scores": self.best_scores,
+            "elapsed": (self.finished_at or time.time()) - self.started_at,
+            "eta": self.eta(),
+            "cancel_requested": self.cancel_requested,
+            "error_msg": self.error_msg,
+        }
+
+
+class JobManager:
+    """Starts allocation jobs in background threads and keeps track of them"""
+
+    def __init__(self):
+        self._jobs: Dict[str, AllocationJob] = {}
+        self._lock = threading.RLock()
+
+    def start(self, session_key, asap_obj: ASAP, *, lock, on_completed: Callable[[str, ASAP], None],
+              on_failed: Callable[[str], None] = None, checkpoint: RestartCheckpoint = None,
+              cache: AllocationCache = None, history: RunHistory = None) -> AllocationJob:
+        """Starts an allocation in a background thread, unless the session already has one running.
+
+        Args:
+            session_key: A string representing the session that the allocation belongs to.
+            asap_obj: The ASAP object to run the allocation on.
+            lock: The lock of the session, which is held while the allocation runs.
+            on_completed: A function that is called with the session key and ASAP object when the allocation
+                completes successfully.
+            on_failed: (optional) A function that is called with the session key if the allocation fails.
+            checkpoint: (optional) A RestartCheckpoint object that completed restarts are saved to and resumed from.
+                It is cleared once the allocation completes without being cancelled.
+            cache: (optional) An AllocationCache object that the allocation is loaded from or added to.
+            history: (optional) A RunHistory object that the allocation is recorded in.
+
+        Returns:
+            The AllocationJob object of the new (or already running) job.
+        """
+        with self._lock:
+            self._forget_finished()
+            running_job = self.running(session_key)
+            if running_job:
+                return running_job
+            job = AllocationJob(session_key, asap_obj.num_restarts)
+            if checkpoint:
+                job.restarts_resumed = checkpoint.restarts_completed()
+            self._jobs[job.id] = job
+
+        def run():
+            with lock:
+                try:
+                    asap_obj.run_allocation(progress=job.update, should_stop=job._cancel_event.is_set,
+                                            checkpoint=checkpoint, cache=cache, history=history)
+                    on_completed(session_key, asap_obj)
+                except Exception as e:  # General Exception because various kinds of errors can be thrown
+                    traceback.print_exc()
+                    job.error_msg = str(e)
+                    state = FAILED
+                    if on_failed:
+                        on_failed(session_key)
+                else:
+                    if job.cancel_requested:
+                        state = CANCELLED
+                    else:
+                        state = COMPLETED
+                        if checkpoint:
+                            checkpoint.clear()
+                job.finished_at = time.time()
+                job.state = state
+
+        threading.Thread(target=run, name=f"allocation-{job.id}", daemon=True).start()
+        return job
+
+    def get(self, job_id) -> Optional[AllocationJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def running(self, session_key) -> Optional[AllocationJob]:
+        with self._lock:
+            for job in self._jobs.values():
+                if job.session_key == session_key and not job.finished:
+                    return job
+        return None
+
+    def _forget_finished(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and now - job.finished_at > JOB_RETENTION]:
+            del self._jobs[job_id]
@@ -1,14 +1,22 @@
 import os
 import inspect
-import pickle
+import datetime
+import functools
 import shutil
 import json
+import threading
 import time
+import uuid
 
-from flask import Flask, request, render_template, redirect, url_for
-import webview
+from flask import Flask, request, render_template, redirect, url_for, session, jsonify, abort
 
 from ASAP.__main__ import ASAP, LivingPrefColumnType
+from ASAP.backend import util
+from ASAP.backend.cache import AllocationCache
+from ASAP.backend.checkpoint import RestartCheckpoint
+from ASAP.backend.history import RunHistory
+from ASAP.gui.jobs import JobManager
+from ASAP.gui.state import SessionStore, SessionNotFound
 
 # NOT USING CSRF TOKENS FOR SIMPLICITY
 # REFERENCES
@@ -24,31 +32,107 @@ app.config['SESSION_TYPE'] = 'filesystem'
 CURRENT_FILENAME = inspect.getframeinfo(inspect.currentframe()).filename
 CURRENT_PATH = os.path.dirname(os.path.abspath(CURRENT_FILENAME))
 UPLOAD_PATH = os.path.join(CURRENT_PATH, UPLOAD_FOLDER)
-PICKLE_FILEPATH = os.path.join(UPLOAD_PATH, "asap_temp_storage.pickle")
-WINDOW = webview.create_window('ASAP: Automated Suite Allocation Program for Yale-NUS First-Years', app,
-                               width=1200, height=800, text_select=True)
+SESSIONS_PATH = os.path.join(UPLOAD_PATH, "sessions")
+JOBS = JobManager()
+# The window is only created in main(), so that importing this module does not set up the GUI
+webview = util.LazyModule("webview")
+WINDOW = None
 
 
-def save_pickle(obj):
-    if not os.path.exists(UPLOAD_PATH):
-        os.makedirs(UPLOAD_PATH)
-    with open(PICKLE_FILEPATH, "wb") as f:
-        pickle.dump(obj, f)
+def lazy(factory):
+    """Makes a function that creates an object on its first call and returns the same object on every later call.
 
+    The session store, allocation cache and run history create files when they are set up, so they are only set up
+    when they are first used, and importing this module does not create anything on disk.
+    """
+    lock = threading.Lock()
+    created = []
 
-def restore_pickle() -> ASAP:
-    with open(PICKLE_FILEPATH, "rb") as f:
-        return pickle.load(f)
+    @functools.wraps(factory)
+    def wrapper():
+        with lock:
+            if not created:
+                created.append(factory())
+            return created[0]
+    return wrapper
+
+
+@lazy
+def store() -> SessionStore:
+    return SessionStore(SESSIONS_PATH)
+
+
+@lazy
+def cache() -> AllocationCache:
+    return AllocationCache(os.path.join(UPLOAD_PATH, "cache"))
+
+
+@lazy
+def history() -> RunHistory:
+    return RunHistory(os.path.join(UPLOAD_PATH, "history.sqlite3"))
+
+
+def session_key():
+    if "key" not in session:
+        session["key"] = uuid.uuid4().hex
+    return session["key"]
+
+
+def save_asap(obj):
+    store().put(session_key(), obj)
+
+
+def restore_asap() -> ASAP:
+    return store().get(session_key())
+
+
+def revert_asap():
+    # Discard changes made by a step that failed validation
+    store().revert(session_key())
+
+
+def session_route(route):
+    """Only lets one request of a session use its ASAP object at a time. Other sessions are not blocked.
+
+    While an allocation job of the session is running, it holds the lock of the session for minutes, so requests are
+    answered straight away instead of waiting for it: pages redirect to the progress of the allocation, and other
+    requests get a "job running" error.
+    """
+    @functools.wraps(route)
+    def wrapper(*args, **kwargs):
+        if JOBS.running(session_key()):
+            return job_running()
+        with store().lock(session_key()):
+            # Checked again, as a job may have been started (and be waiting for the lock) while this request waited
+            if JOBS.running(session_key()):
+                return job_running()
+            return route(*args, **kwargs)
+    return wrapper
+
+
+def job_running():
+    if request.method == 'GET':
+        return redirect(url_for("run_allocation"))
+    return jsonify(error="An allocation is running. Wait for it to finish or stop it first."), 409
+
+
+@app.errorhandler(SessionNotFound)
+def session_not_found(e):
+    return redirect(url_for("home"))
 
 
 @app.route('/', methods=['GET', 'POST'])
 def home():
+    # Not a session_route, because it does not use the ASAP object of the session (a new CSV file gets a new session)
     error_msg = None
     if request.method == 'POST':
         filepath = WINDOW.create_file_dialog(webview.OPEN_DIALOG, directory='/', file_types=('CSV Files (*.csv)',))
         if filepath:
             try:
-                save_pickle(ASAP(filepath[0]))
+                asap_obj = ASAP(filepath[0])
+                # Each CSV file gets a new session, so that earlier sessions are left untouched
+                session["key"] = uuid.uuid4().hex
+                save_asap(asap_obj)
                 return redirect(url_for("select_column_type"))
             except ValueError as e:
                 error_msg = str(e)
@@ -56,10 +140,11 @@ def home():
 
 
 @app.route('/select_column_type', methods=['GET', 'POST'])
+@session_route
 def select_column_type():
     error_msg = None
     selected_values = {}
-    asap_obj = restore_pickle()
+    asap_obj = restore_asap()
     colnames, unique_values, head_values = asap_obj.get_colnames_and_unique_values()
     if request.method == 'POST':
         col_type_assoc = [(col, request.form[f"column{i}"]) for i, col in enumerate(colnames)]
@@ -67,8 +152,9 @@ def select_column_type():
             asap_obj.set_column_types(col_type_assoc)
         except ValueError as e:
             error_msg = str(e)
+            revert_asap()
         else:
-            save_pickle(asap_obj)
+            save_asap(asap_obj)
             return redirect(url_for("verify_living_preferences"))
     elif request.method == 'GET':
         if asap_obj.col_types_defined:
@@ -98,9 +184,10 @@ def select_column_type():
 
 
 @app.route('/verify_living_preferences', methods=['GET', 'POST'])
+@session_route
 def verify_living_preferences():
     error_msg = None
-    asap_obj = restore_pickle()
+    asap_obj = restore_asap()
     colnames, unique_values, _ = asap_obj.get_colnames_and_unique_values()
     unique_values = [sorted(values) for col, values in zip(colnames, unique_values) if col in asap_obj.LIVING_PREF.cols]
     # Temporarily here to speed up development #
@@ -115,8 +202,9 @@ def verify_living_preferences():
             asap_obj.set_living_pref_order(selected_order)
         except ValueError as e:
             error_msg = str(e)
+            revert_asap()
         else:
-            save_pickle(asap_obj)
+            save_asap(asap_obj)
             return redirect(url_for("select_weights"))
     return render_template('verify_living_preferences.html',
                            living_pref_cols=asap_obj.LIVING_PREF.cols,
@@ -125,9 +213,10 @@ def verify_living_preferences():
 
 
 @app.route('/select_weights', methods=['GET', 'POST'])
+@session_route
 def select_weights():
     error_msg = None
-    asap_obj = restore_pickle()
+    asap_obj = restore_asap()
     if asap_obj.weights_defined:
         weights = asap_obj.LIVING_PREF.weights
     else:
@@ -142,8 +231,9 @@ def select_weights():
             asap_obj.set_weights(weights)
         except ValueError as e:
             error_msg = str(e)
+            revert_asap()
         else:
-            save_pickle(asap_obj)
+            save_asap(asap_obj)
             return redirect(url_for("select_options"))
     return render_template('select_weights.html',
                            living_pref_cols=asap_obj.LIVING_PREF.cols,
@@ -152,9 +242,10 @@ def select_weights():
 
 
 @app.route('/select_options', methods=['GET', 'POST'])
+@session_route
 def select_options():
     error_msg = None
-    asap_obj = restore_pickle()
+    asap_obj = restore_asap()
     if asap_obj.options_defined:
         saga_sextets = asap_obj.avail_sextets_saga
         elm_sextets = asap_obj.avail_sextets_elm
@@ -177,8 +268,9 @@ def select_options():
                                  saga_a11y_suites, elm_a11y_suites, cendana_a11y_suites)
         except ValueError as e:
             error_msg = str(e)
+            revert_asap()
         else:
-            save_pickle(asap_obj)
+            save_asap(asap_obj)
             return redirect(url_for("review_data"))
     return render_template('select_options.html',
                            saga_sextets=saga_sextets,
@@ -191,8 +283,9 @@ def select_options():
 
 
 @app.route('/review_data', methods=['GET', 'POST'])
+@session_route
 def review_data():
-    asap_obj = restore_pickle()
+    asap_obj = restore_asap()
     colnames, _, head_values = asap_obj.get_colnames_and_unique_values()
     colnames = [f"Living Pref: {col}"
                 if isinstance(asap_obj.col_to_type[col], LivingPrefColumnType)
@@ -227,26 +320,54 @@ def review_data():
 
 @app.route('/run_allocation', methods=['GET', 'POST'])
 def run_allocation():
-    error_msg = None
-    asap_obj = restore_pickle()
-    if request.method == 'POST':
-        asap_obj.run_allocation()
-        save_pickle(asap_obj)
-        return redirect(url_for("results"))
-        try:
-            asap_obj.run_allocation()
-        except Exception as e:  # General Exception because various kinds of errors can be thrown by run_allocation()
-            error_msg = str(e)
-        else:
-            save_pickle(asap_obj)
-            return redirect(url_for("results"))
-    return render_template('run_allocation.html', error_msg=error_msg)
+    # Not a session_route, because it shows the progress of a running allocation job, which holds the lock of the
+    # session while it runs
+    key = session_key()
+    job = JOBS.running(key)
+    if job:
+        if request.method == 'POST':
+            return jsonify(job.status())
+        return render_template('run_allocation.html', job_id=job.id, restarts_saved=0,
+                               restarts_total=sum(job.restarts_total.values()), cached=False)
+    with store().lock(key):
+        # The job is started while the lock is held, so that no other request can change the ASAP object between
+        # building the checkpoint and the job taking the lock
+        asap_obj = restore_asap()
+        checkpoint = RestartCheckpoint(os.path.join(store().session_path(key), "restarts"), asap_obj.config())
+        if request.method == 'POST':
+            if request.form.get("rerun"):
+                # Replace the cached allocation with a new one
+                cache().discard(asap_obj.cache_key())
+            session_store = store()
+            job = JOBS.start(key, asap_obj, lock=session_store.lock(key), on_completed=session_store.put,
+                             on_failed=session_store.revert, checkpoint=checkpoint, cache=cache(), history=history())
+            return jsonify(job.status())
+        return render_template('run_allocation.html', job_id=None, restarts_saved=checkpoint.restarts_completed(),
+                               restarts_total=2 * asap_obj.num_restarts, cached=asap_obj.cache_key() in cache())
+
+
+@app.route('/run_allocation/status/<job_id>', methods=['GET'])
+def allocation_status(job_id):
+    job = JOBS.get(job_id)
+    if job is None or job.session_key != session_key():
+        abort(404)
+    return jsonify(job.status())
+
+
+@app.route('/run_allocation/cancel/<job_id>', methods=['POST'])
+def cancel_allocation(job_id):
+    job = JOBS.get(job_id)
+    if job is None or job.session_key != session_key():
+        abort(404)
+    job.cancel()
+    return jsonify(job.status())
 
 
 @app.route('/results', methods=['GET', 'POST'])
+@session_route
 def results():
     error_msg = None
-    asap_obj = restore_pickle()
+    asap_obj = restore_asap()
     context = {
         "datetime": asap_obj.datetime,
         "csv_filename": asap_obj.filename,
@@ -270,13 +391,21 @@ def results():
         "living_prefs": asap_obj.LIVING_PREF.cols,
         "living_pref_order": asap_obj.LIVING_PREF.selected_order,
         "weights": asap_obj.LIVING_PREF.weights,
+        "run_report": asap_obj.run_report.as_dict() if asap_obj.run_report else None,
+        "manual_changes": asap_obj.editor.changes if asap_obj.editor else [],
+        "student_ids": sorted(str(student.data.matric) for suite in asap_obj.suites for student in suite.students),
+        "vacant_suites": vacant_suites(asap_obj),
+        # The what-if scoring and manual change controls need the server, so it is left out of the exported report
+        "interactive": True,
     }
     if request.method == 'POST':
         folder_path = WINDOW.create_file_dialog(webview.FOLDER_DIALOG, directory='/')
         if folder_path:
             try:
                 asap_obj.export_files(folder_path[0])
-                save_pickle(asap_obj)
+                # The report now includes the time taken to export
+                context["run_report"] = asap_obj.run_report.as_dict() if asap_obj.run_report else None
+                context["interactive"] = False
                 with open(os.path.join(folder_path[0], "allocation_report.html"), 'w') as f:
                     f.write(render_template('results.html', **context))
                 return redirect(url_for("completed"))
@@ -285,13 +414,99 @@ def results():
     return render_template('results.html', error_msg=error_msg, **context)
 
 
+@app.route('/results/rescore', methods=['POST'])
+@session_route
+def rescore_results():
+    """Returns the scores of the current allocation under the weights in the form, without changing either."""
+    asap_obj = restore_asap()
+    start = time.perf_counter()
+    try:
+        weights = {col: int(request.form[f"column{i}"]) for i, col in enumerate(asap_obj.LIVING_PREF.cols)}
+        demographic_weight = int(request.form["demographic-weight"]) / 100
+        scores = asap_obj.rescore(weights, demographic_weight)
+    except (KeyError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+    current = asap_obj.rescore(asap_obj.LIVING_PREF.weights)
+    return jsonify(
+        suites=[{"suite": str(suite.suite_num), "rca": suite.rca,
+                 "current": current_score, "rescored": rescored_score}
+                for suite, current_score, rescored_score in zip(asap_obj.suites, current["Final Score"].tolist(),
+                                                                scores["Final Score"].tolist())],
+        global_scores={"current": current["Global Score"], "rescored": scores["Global Score"]},
+        milliseconds=(time.perf_counter() - start) * 1000,
+    )
+
+
+@app.route('/results/swap', methods=['POST'])
+@session_route
+def swap_students():
+    """Previews or applies a swap of two students, or a move of a student to a vacancy (see ASAP.edit_allocation())."""
+    asap_obj = restore_asap()
+    start = time.perf_counter()
+    apply = request.form.get("action") == "apply"
+    try:
+        change = asap_obj.edit_allocation(request.form["student"].strip(), request.form["other"].strip(), apply)
+    except (KeyError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+    milliseconds = (time.perf_counter() - start) * 1000
+    if apply:
+        save_asap(asap_obj)
+    return jsonify(applied=apply, changes=asap_obj.editor.changes, vacant_suites=vacant_suites(asap_obj),
+                   milliseconds=milliseconds, **change)
+
+
+def vacant_suites(asap_obj):
+    return [str(suite.suite_num) for suite in asap_obj.suites if len(suite.students) < suite.capacity]
+
+
+@app.route('/history', methods=['GET', 'POST'])
+@session_route
+def run_history():
+    """Lists the past runs of the session's CSV file (or of every file), and reloads one of them as the results."""
+    error_msg = None
+    asap_obj = restore_asap()
+    if request.method == 'POST':
+        try:
+            asap_obj.load_allocation(history().allocation(int(request.form["run_id"])))
+        except (KeyError, ValueError) as e:
+            error_msg = str(e)
+            revert_asap()
+            asap_obj = restore_asap()
+        else:
+            save_asap(asap_obj)
+            return redirect(url_for("results"))
+    filters = {
+        "all_files": bool(request.args.get("all_files")),
+        "same_config": bool(request.args.get("same_config")),
+        "since": request.args.get("since", ""),
+        "until": request.args.get("until", ""),
+    }
+    try:
+        since = datetime.date.fromisoformat(filters["since"]) if filters["since"] else None
+        until = datetime.date.fromisoformat(filters["until"]) if filters["until"] else None
+    except ValueError:
+        since = until = None
+        error_msg = "Dates must be in the format YYYY-MM-DD."
+    start = time.perf_counter()
+    runs = history().runs(input_hash=None if filters["all_files"] else asap_obj.input_hash,
+                        config=asap_obj.config() if filters["same_config"] else None, since=since, until=until)
+    return render_template('history.html', error_msg=error_msg, runs=runs, filters=filters,
+                           input_hash=asap_obj.input_hash, milliseconds=(time.perf_counter() - start) * 1000)
+
+
 @app.route('/completed', methods=['GET'])
 def completed():
     return render_template('completed.html')
 
 
 def main():
-    webview.start(debug=True)
+    global WINDOW
+    WINDOW = webview.create_window('ASAP: Automated Suite Allocation Program for Yale-NUS First-Years', app,
+                                   width=1200, height=800, text_select=True)
+    # Import pandas while the window opens, so that loading the first CSV file is not slowed down by it
+    webview.start(util.preload, ("pandas",), debug=True)
+    # Checkpoints are written in the background, so the last one may not have been written when the window is closed
+    store().flush()
 
 
 if __name__ == "__main__":
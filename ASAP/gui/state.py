@@ -0,0 +1,211 @@
+"""This module provides an in-memory store for the ASAP object of each session.
+
+The live ASAP object is kept in memory, so navigating between pages does not need to serialise or deserialise it.
+Every time the object is saved, a checkpoint is also written to disk so that the session can be recovered if the
+program crashes. Checkpoints are gzip-compressed pickles and are written incrementally: the student data is only
+rewritten when it has changed, and the rest of the object is written separately. They are written by a background
+thread, so saving does not hold up the request that saved; the next request of the session waits for the checkpoint
+if it has not been written yet, and several saves in quick succession are written once.
+
+Each session has its own checkpoint folder and its own lock, so several allocation sessions (e.g. for two cohorts) can
+run side by side in one process. The least recently used sessions are evicted from memory once there are more than
+max_sessions of them (they can still be recovered from their checkpoints), and checkpoints that have not been used for
+max_age seconds are deleted.
+
+    Typical usage example:
+
+    store = SessionStore(storage_path)
+    with store.lock(session_key):
+        store.put(session_key, ASAP(csv_path))
+        asap_obj = store.get(session_key)
+"""
+
+import collections
+import gzip
+import os
+import pickle
+import shutil
+import threading
+import time
+import traceback
+from typing import Dict
+
+from ASAP.__main__ import ASAP
+from ASAP.backend import instrumentation
+
+DATA_ATTR = "students_df"
+DATA_FILENAME = "students.pickle.gz"
+STATE_FILENAME = "state.pickle.gz"
+
+
+class SessionNotFound(KeyError):
+    pass
+
+
+class SessionStore:
+    """Stores the ASAP object of each session in memory, with checkpoints on disk for crash recovery
+
+    Attributes:
+        storage_path: A string representing the folder that checkpoints are written to.
+        max_sessions: An integer representing the maximum number of sessions kept in memory.
+        max_age: A number representing how many seconds an unused checkpoint is kept on disk.
+    """
+
+    def __init__(self, storage_path, max_sessions=8, max_age=7 * 24 * 60 * 60):
+        self.storage_path = storage_path
+        self.max_sessions = max_sessions
+        self.max_age = max_age
+        self._sessions: Dict[str, ASAP] = collections.OrderedDict()
+        self._data_versions: Dict[str, int] = {}
+        self._locks: Dict[str, threading.RLock] = collections.defaultdict(threading.RLock)
+        self._lock = threading.Lock()
+        # ASAP objects that have been saved but not checkpointed yet, and the thread that checkpoints them
+        self._pending: Dict[str, ASAP] = {}
+        self._pending_added = threading.Condition(self._lock)
+        self._writer = None
+
+    def lock(self, key) -> threading.RLock:
+        """Returns the lock of a session. Hold it while reading and modifying the session's ASAP object."""
+        with self._lock:
+            return self._locks[key]
+
+    def get(self, key) -> ASAP:
+        """Returns the ASAP object of a session, recovering it from its checkpoint if it is not in memory.
+
+        Raises:
+            SessionNotFound: There is no ASAP object for the session.
+        """
+        # The object may be changed once it is returned, so a pending checkpoint of it is written first
+        self.flush(key)
+        with self._lock:
+            if key in self._sessions:
+                self._sessions.move_to_end(key)
+                return self._sessions[key]
+        asap_obj = self.recover(key)
+        with self._lock:
+            asap_obj = self._sessions.setdefault(key, asap_obj)
+            self._evict()
+            return asap_obj
+
+    def put(self, key, asap_obj: ASAP):
+        """Stores the ASAP object of a session, and checkpoints it to disk in the background."""
+        with self._lock:
+            if self._sessions.get(key) is not asap_obj:
+                self._data_versions.pop(key, None)
+            self._sessions[key] = asap_obj
+            self._sessions.move_to_end(key)
+            self._evict()
+            self._pending[key] = asap_obj
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_pending, name="SessionStore writer", daemon=True)
+                self._writer.start()
+            self._pending_added.notify()
+
+    def revert(self, key):
+        """Discards the in-memory ASAP object of a session, so that it is restored from its last checkpoint.
+
+        A pending checkpoint of the session is written first, so the object is restored as it was when it was last
+        saved (requests get the object before changing it, which writes any checkpoint of it that is pending).
+        """
+        self.flush(key)
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def flush(self, key=None):
+        """Writes the pending checkpoint of a session (or of every session if key is None) straight away."""
+        with self._lock:
+            keys = list(self._pending) if key is None else [key]
+        for pending_key in keys:
+            # The lock of the session stops the object from being changed while it is written
+            with self.lock(pending_key):
+                with self._lock:
+                    asap_obj = self._pending.pop(pending_key, None)
+                if asap_obj is not None:
+                    self.checkpoint(pending_key, asap_obj)
+
+    def checkpoint(self, key, asap_obj: ASAP):
+        """Writes the ASAP object of a session to disk.
+
+        The student data is only written if it has changed since the last checkpoint.
+        """
+        session_path = self.session_path(key)
+        os.makedirs(session_path, exist_ok=True)
+        with instrumentation.phase("Checkpoint"):
+            if self._data_versions.get(key) != asap_obj.data_version:
+                _write(os.path.join(session_path, DATA_FILENAME), getattr(asap_obj, DATA_ATTR))
+                self._data_versions[key] = asap_obj.data_version
+            state = asap_obj.__dict__.copy()
+            del state[DATA_ATTR]
+            _write(os.path.join(session_path, STATE_FILENAME), state)
+
+    def recover(self, key) -> ASAP:
+        """Restores the ASAP object of a session from its checkpoint on disk.
+
+        Raises:
+            SessionNotFound: There is no checkpoint for the session.
+        """
+        session_path = self.session_path(key)
+        try:
+            state = _read(os.path.join(session_path, STATE_FILENAME))
+            students_df = _read(os.path.join(session_path, DATA_FILENAME))
+        except FileNotFoundError:
+            raise SessionNotFound(key)
+        asap_obj = ASAP.__new__(ASAP)
+        asap_obj.__dict__.update(state)
+        setattr(asap_obj, DATA_ATTR, students_df)
+        with self._lock:
+            self._data_versions[key] = asap_obj.data_version
+        return asap_obj
+
+    def purge_expired(self):
+        """Deletes the checkpoints of sessions that have not been saved for more than max_age seconds."""
+        if not os.path.isdir(self.storage_path):
+            return
+        now = time.time()
+        for key in os.listdir(self.storage_path):
+            state_filepath = os.path.join(self.session_path(key), STATE_FILENAME)
+            try:
+                expired = now - os.path.getmtime(state_filepath) > self.max_age
+            except FileNotFoundError:
+                continue
+            if expired:
+                with self._lock:
+                    self._sessions.pop(key, None)
+                    self._data_versions.pop(key, None)
+                    self._locks.pop(key, None)
+                shutil.rmtree(self.session_path(key), ignore_errors=True)
+
+    def session_path(self, key):
+        return os.path.join(self.storage_path, key)
+
+    def _write_pending(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._pending_added.wait()
+                key = next(iter(self._pending))
+            try:
+                self.flush(key)
+                self.purge_expired()
+            except Exception:
+                # The session stays in memory, so it is only lost if the program also crashes before the next save
+                traceback.print_exc()
+
+    def _evict(self):
+        # Must be called while holding self._lock. Evicted sessions stay checkpointed on disk.
+        while len(self._sessions) > self.max_sessions:
+            key, _ = self._sessions.popitem(last=False)
+            self._data_versions.pop(key, None)
+
+
+def _write(filepath, obj):
+    # Write to a temporary file first so that a crash never leaves a half-written checkpoint behind
+    tmp_filepath = filepath + ".tmp"
+    with gzip.open(tmp_filepath, "wb", compresslevel=1) as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_filepath, filepath)
+
+
+def _read(filepath):
+    with gzip.open(filepath, "rb") as f:
+        return pickle.load(f)
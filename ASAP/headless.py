@@ -0,0 +1,212 @@
+"""This module provides a headless entry point that runs an allocation without the GUI.
+
+The choices that are made in the setup steps of the GUI (the column types, the order of the living preference options,
+the weights and the options) are read from a JSON or TOML configuration file instead, in the same format as the one
+returned by ASAP.config(). The CSV file is then ingested, validated, allocated and exported end to end. Flask and
+pywebview are never imported, so this can be run on a server without a display.
+
+    Typical usage example:
+
+    python cli.py "data/First Year Mock Data 243 students.csv" config.json --output results/
+    python cli.py "data/First Year Mock Data 243 students.csv" --from-allocation results/allocation.npz -o results2/
+    python cli.py "data/First Year Mock Data 243 students.csv" --history runs.sqlite3 --from-run 12 -o results3/
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict
+
+from ASAP.__main__ import ASAP
+from ASAP.backend import exact
+from ASAP.backend import instrumentation
+from ASAP.backend import streaming
+from ASAP.backend.cache import AllocationCache
+from ASAP.backend.history import RunHistory
+
+
+def load_config(config_path) -> Dict[str, Any]:
+    """Reads a configuration from a JSON or TOML file.
+
+    Args:
+        config_path: A string representing the path to the configuration file. Files ending in .toml are read as TOML,
+            and everything else is read as JSON.
+
+    Returns:
+        A dictionary in the same format as the one returned by ASAP.config().
+    """
+    if config_path.lower().endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError("Reading TOML configuration files requires Python 3.11 or the tomli package.")
+        with open(config_path, "rb") as f:
+            return tomllib.load(f)
+    with open(config_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run(csv_path, config: Dict[str, Any], output_path, quiet=False, allocation_path=None, cache_path=None,
+        profile_memory=False, history_path=None) -> ASAP:
+    """Runs an allocation from start to finish and exports the results.
+
+    Args:
+        csv_path: A string representing the path to the student data CSV file.
+        config: A dictionary in the same format as the one returned by ASAP.config().
+        output_path: A string representing the folder that the results are exported to. It is created if it does not
+            exist.
+        quiet: (optional) A boolean representing whether to hide the progress of the allocation, including the
+            scores that it prints after every restart.
+        allocation_path: (optional) A string representing the path to an allocation.npz file saved by an earlier
+            export (or a file object of one, see RunHistory.allocation()). If given, its allocation is exported again
+            instead of running a new one, and config is ignored.
+        cache_path: (optional) A string representing the folder of an AllocationCache. If given, an allocation of the
+            same CSV file with the same configuration is loaded from it instead of being run again.
+        profile_memory: (optional) A boolean representing whether to record the memory used by each phase in the run
+            report of the returned object. This makes the allocation several times slower.
+        history_path: (optional) A string representing the path of a RunHistory database. If given, the allocation
+            is recorded in it.
+
+    Returns:
+        The ASAP object of the completed allocation. Its run_report includes the time taken to ingest the CSV file.
+    """
+    report = instrumentation.RunReport(profile_memory=profile_memory)
+    with instrumentation.recording(report):
+        asap_obj = _run(csv_path, config, output_path, quiet, allocation_path, cache_path, history_path)
+    asap_obj.run_report = report
+    return asap_obj
+
+
+def _run(csv_path, config, output_path, quiet, allocation_path, cache_path, history_path) -> ASAP:
+    with instrumentation.phase("Ingest"):
+        asap_obj = ASAP(csv_path)
+        asap_obj.verify_csv()
+        if not allocation_path:
+            asap_obj.apply_config(config)
+    if allocation_path:
+        asap_obj.load_allocation(allocation_path)
+        os.makedirs(output_path, exist_ok=True)
+        asap_obj.export_files(output_path)
+        return asap_obj
+
+    def progress(phase, completed, total, best_score):
+        if best_score is None:
+            print(f"{phase}: {completed}/{total}", file=sys.stderr)
+        else:
+            print(f"{phase}: {completed}/{total} (best score: {best_score:.4f})", file=sys.stderr)
+
+    # The allocation prints the score of every restart to stdout
+    with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        asap_obj.run_allocation(progress=None if quiet else progress,
+                                cache=AllocationCache(cache_path) if cache_path else None,
+                                history=RunHistory(history_path) if history_path else None)
+    os.makedirs(output_path, exist_ok=True)
+    asap_obj.export_files(output_path)
+    return asap_obj
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Allocates first-years to suites without the GUI.",
+        epilog="The configuration file has the same format as the config.json file saved with every export.")
+    arg_parser.add_argument("csv_path", help="the student data CSV file")
+    arg_parser.add_argument("config_path", nargs="?", help="a JSON or TOML configuration file")
+    arg_parser.add_argument("--from-allocation", metavar="NPZ_PATH",
+                            help="export the allocation.npz file of an earlier export instead of running a new one")
+    arg_parser.add_argument("-o", "--output", default="output", help="the folder to export the results to")
+    arg_parser.add_argument("--cache", metavar="FOLDER",
+                            help="reuse allocations with the same data and configuration that are cached in this folder")
+    arg_parser.add_argument("--history", metavar="DB_PATH",
+                            help="records the allocation in this run history database (created if it does not exist)")
+    arg_parser.add_argument("--from-run", type=int, metavar="RUN_ID",
+                            help="export a run recorded in the --history database instead of running a new one")
+    arg_parser.add_argument("--seed", type=int, help="overrides the random seed in the configuration")
+    arg_parser.add_argument("--restarts", type=int, help="overrides the number of restarts in the configuration")
+    arg_parser.add_argument("--shards", type=int,
+                            help="splits each sex into this many shards that are allocated in parallel (for very "
+                                 "large cohorts)")
+    arg_parser.add_argument("--top-k", type=int,
+                            help="ranks only the best K candidates of every student and suite at a time, which "
+                                 "uses less memory for large cohorts and gives the same allocation (ignored by the "
+                                 "compiled kernels)")
+    arg_parser.add_argument("--exact-max-students", type=int, metavar="N",
+                            help="solves suite rounds of at most N students exactly with SciPy's MILP solver, if it "
+                                 "is installed")
+    arg_parser.add_argument("--exact-time-limit", type=float, metavar="SECONDS",
+                            help="the time the MILP solver may spend on a round before the round falls back to the "
+                                 f"usual matching (default: {exact.DEFAULT_TIME_LIMIT})")
+    arg_parser.add_argument("-q", "--quiet", action="store_true",
+                            help="do not print the progress or scores of the allocation")
+    arg_parser.add_argument("--profile-memory", action="store_true",
+                            help="print the memory used by each phase (this makes the allocation much slower)")
+    args = arg_parser.parse_args(argv)
+    if not args.config_path and not args.from_allocation and args.from_run is None:
+        arg_parser.error("a configuration file is required unless --from-allocation or --from-run is given")
+    if args.from_run is not None and not args.history:
+        arg_parser.error("--from-run requires --history")
+
+    try:
+        config = load_config(args.config_path) if args.config_path else {}
+        if args.seed is not None:
+            config["seed"] = args.seed
+        if args.restarts is not None:
+            config["num_restarts"] = args.restarts
+        if args.shards is not None:
+            config["num_shards"] = args.shards
+        if args.top_k is not None:
+            config["top_k"] = args.top_k
+        if args.exact_max_students is not None:
+            config["exact_max_students"] = args.exact_max_students
+        if args.exact_time_limit is not None:
+            config["exact_time_limit"] = args.exact_time_limit
+        start_time = time.perf_counter()
+        allocation_path = args.from_allocation
+        if args.from_run is not None:
+            allocation_path = RunHistory(args.history).allocation(args.from_run)
+        asap_obj = run(args.csv_path, config, args.output, quiet=args.quiet, allocation_path=allocation_path,
+                       cache_path=args.cache, profile_memory=args.profile_memory,
+                       history_path=None if allocation_path else args.history)
+    except (OSError, ValueError, RuntimeError) as e:
+        arg_parser.exit(1, f"Error: {e}\n")
+    print(f"Exported results to {args.output} in {time.perf_counter() - start_time:.1f}s", file=sys.stderr)
+    if not args.quiet:
+        print_restart_stats(asap_obj.run_report)
+    if args.profile_memory:
+        print_memory(asap_obj.run_report)
+
+
+def print_restart_stats(report: instrumentation.RunReport):
+    """Prints the distribution of the global scores of the restarts of each phase of a report."""
+    if not report.restart_stats:
+        return
+    quantiles = [f"{p:.0%}" for p in streaming.QUANTILES]
+    print(f"{'Phase':<28}{'Restarts':>9}{'Mean':>9}{'Std':>9}" + "".join(f"{q:>9}" for q in quantiles)
+          + f"{'Best':>9}{'Last improvement':>18}", file=sys.stderr)
+    for name, stats in report.restart_stats.items():
+        stats = stats.as_dict()
+        if not stats["count"]:
+            continue
+        std = f"{stats['std']:.4f}" if stats["std"] is not None else "-"
+        print(f"{name:<28}{stats['count']:>9}{stats['mean']:9.4f}{std:>9}"
+              + "".join(f"{stats['quantiles'][q]:9.4f}" for q in quantiles)
+              + f"{stats['max']:9.4f}{stats['last_improvement']:>18}", file=sys.stderr)
+
+
+def print_memory(report: instrumentation.RunReport):
+    """Prints the memory used by each phase of a report that was recorded with profile_memory."""
+    print(f"{'Phase':<24}{'Peak (MB)':>12}{'Retained (MB)':>15}{'Peak RSS (MB)':>15}", file=sys.stderr)
+    for name, memory in report.phase_memory.items():
+        peak_rss = f"{memory['peak_rss_bytes'] / 2 ** 20:.1f}" if memory["peak_rss_bytes"] is not None else "-"
+        print(f"{name:<24}{memory['peak_bytes'] / 2 ** 20:12.1f}{memory['retained_bytes'] / 2 ** 20:15.1f}"
+              f"{peak_rss:>15}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
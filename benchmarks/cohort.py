@@ -0,0 +1,116 @@
+"""This script generates synthetic cohorts of first-years with the same schema and distributions as the mock data.
+
+Students are resampled from a template CSV file (by default the mock data), so every column keeps its distribution and
+the correlations between columns (e.g. between nationality and high school) are preserved. Student IDs and names are
+generated, and high schools that only one student in the template went to are replaced by new schools, so that large
+cohorts keep the long tail of schools instead of repeating the same few. Optionally, some students can be restricted
+to one or two RCs, which the mock data does not have.
+
+    Typical usage example:
+
+    python -m benchmarks.cohort 5000 cohort_5000.csv --seed 1
+
+    students_df = generate_cohort(5000, seed=1)
+    options = suite_options(students_df)
+"""
+
+import argparse
+import math
+import os
+import random
+from typing import Dict
+
+import pandas as pd
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK_DATA_PATH = os.path.join(ROOT_PATH, "data", "First Year Mock Data 243 students.csv")
+MOCK_CONFIG_PATH = os.path.join(ROOT_PATH, "data", "First Year Mock Data config.json")
+
+ID_COL = "Student ID"
+NAME_COL = "Name"
+SEX_COL = "Sex"
+SCHOOL_COL = "High School"
+ACCESSIBILITY_COL = "Accessibility"
+AVAILABLE_RCS_COL = "Available RCs"
+RC_LIST = ("Saga", "Elm", "Cendana")
+CHECK_LETTERS = "ABCDEFGHJKLMNPRTUWXY"
+
+# Spare capacity given by suite_options(), as a fraction of the suites that are required
+SPARE_SUITES = 0.15
+
+
+def generate_cohort(num_students, seed=0, template_path=MOCK_DATA_PATH, restricted_rcs=0.0) -> pd.DataFrame:
+    """Generates a synthetic cohort by resampling the students of a template CSV file.
+
+    Args:
+        num_students: An integer representing the number of students in the cohort.
+        seed: (optional) An integer representing the random seed. The same seed always gives the same cohort.
+        template_path: (optional) A string representing the path to the CSV file that students are resampled from.
+        restricted_rcs: (optional) A float representing the fraction of students that are restricted to one or two
+            RCs. Accessibility students are never restricted.
+
+    Returns:
+        A Pandas DataFrame with the same columns as the template.
+    """
+    rng = random.Random(seed)
+    template_df = pd.read_csv(template_path, dtype=str)
+    rows = [rng.randrange(len(template_df)) for _ in range(num_students)]
+    students_df = template_df.iloc[rows].reset_index(drop=True)
+
+    students_df[ID_COL] = [f"A{i:07d}{CHECK_LETTERS[i % len(CHECK_LETTERS)]}" for i in range(num_students)]
+    students_df[NAME_COL] = [f"Student {i}" for i in range(num_students)]
+
+    school_counts = template_df[SCHOOL_COL].value_counts()
+    unique_schools = set(school_counts.index[school_counts == 1])
+    students_df[SCHOOL_COL] = [f"{school} {i}" if school in unique_schools else school
+                               for i, school in enumerate(students_df[SCHOOL_COL])]
+
+    if restricted_rcs:
+        available_rcs = students_df[AVAILABLE_RCS_COL].tolist()
+        for i, accessibility in enumerate(students_df[ACCESSIBILITY_COL]):
+            if accessibility != "Yes" and rng.random() < restricted_rcs:
+                rcs = rng.sample(RC_LIST, rng.randint(1, 2))
+                available_rcs[i] = ", ".join(rc for rc in RC_LIST if rc in rcs)
+        students_df[AVAILABLE_RCS_COL] = available_rcs
+    return students_df
+
+
+def suite_options(students_df) -> Dict[str, int]:
+    """Returns options with enough suites in each RC to house a cohort, in the format of the "options" of a config.
+
+    The required number of suites is calculated in the same way as in ASAP.set_options(), then SPARE_SUITES is added
+    and the suites are split evenly between the RCs.
+    """
+    options = {}
+    required_suites = 0
+    required_a11y_suites = 0
+    for sex in ("F", "M"):
+        sex_df = students_df[students_df[SEX_COL] == sex]
+        num_a11y = int((sex_df[ACCESSIBILITY_COL] == "Yes").sum())
+        required_a11y_suites += num_a11y
+        required_suites += math.ceil((len(sex_df) - num_a11y * 5) / 6) + num_a11y
+    sextets = math.ceil(required_suites * (1 + SPARE_SUITES) / len(RC_LIST))
+    a11y_suites = math.ceil(required_a11y_suites * (1 + SPARE_SUITES) / len(RC_LIST))
+    for rc in RC_LIST:
+        options[f"{rc.lower()}_sextets"] = sextets
+    for rc in RC_LIST:
+        options[f"{rc.lower()}_a11y_suites"] = a11y_suites
+    return options
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Generates a synthetic cohort of first-years.")
+    arg_parser.add_argument("num_students", type=int, help="the number of students")
+    arg_parser.add_argument("output_path", help="the CSV file to write the cohort to")
+    arg_parser.add_argument("--seed", type=int, default=0, help="the random seed")
+    arg_parser.add_argument("--template", default=MOCK_DATA_PATH, help="the CSV file to resample students from")
+    arg_parser.add_argument("--restricted-rcs", type=float, default=0.0,
+                            help="the fraction of students that are restricted to one or two RCs")
+    args = arg_parser.parse_args(argv)
+    students_df = generate_cohort(args.num_students, args.seed, args.template, args.restricted_rcs)
+    students_df.to_csv(args.output_path, index=False)
+    print(f"Wrote {len(students_df)} students to {args.output_path}. Options: {suite_options(students_df)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""This script compares allocation engines and their parameters by the quality of the allocations and the time taken.
+
+Each variant (an engine with a choice of suite_propose for the suite rounds and female_suites_propose for the RCA match)
+is run for a number of restarts on the same cohort with each of a fixed list of seeds, so every variant sees the same
+students and random streams. A restart allocates both the female and the male students, and its score is the mean
+success score of all its suites (the same score as SuiteAllocation.global_score(), weighted by the number of suites of
+each sex). For each variant, the script reports:
+
+    * The distribution of restart scores (mean, standard deviation, 10th percentile, median and 90th percentile).
+    * The best score, i.e. the score of the allocation that ASAP would keep (the best female and male restarts).
+    * The time taken to reach the target score, as the median over the seeds. By default, the target is the lowest
+      of the best scores of the variants that are not baselines, so that every one of them reaches it.
+    * The throughput in restarts per second.
+    * The mean RCA score of the paired suites (lower is better), the number of suites left unpaired, and the number
+      of seeds for which the RCA match failed because the RCs ran out of suites.
+
+New engines are added to ENGINES.
+
+    Typical usage example:
+
+    python -m benchmarks.engines --restarts 20 --seeds 0 1 2
+    python -m benchmarks.engines --size 1000 --engines gale-shapley --output engines.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from ASAP.__main__ import ASAP
+from ASAP.backend import match
+from ASAP.backend import scoring
+from ASAP.backend.allocation import SuiteAllocation
+from benchmarks import cohort
+
+SEXES = ("Female", "Male")
+
+
+def gale_shapley_engine(suite_allocation: SuiteAllocation, suite_propose):
+    suite_allocation.match(suite_propose)
+
+
+def random_engine(suite_allocation: SuiteAllocation, suite_propose):
+    """Places each batch of students in the suites without looking at any scores, as a baseline for the other engines.
+
+    The batches are the same as those of the other engines (the students were shuffled when they were split), and
+    the same rules apply: each suite gets one student per batch, accessibility students never share a suite, and the
+    last batch only goes into sextets.
+    """
+    suite_allocation.allocate_first_batch()
+    while suite_allocation.batches:
+        students = suite_allocation.batches.pop(0)
+        last_batch = not suite_allocation.batches
+        suites = [suite for suite in suite_allocation.suites
+                  if suite.vacancies > 0 and not (last_batch and suite.accessibility)]
+        for student in sorted(students, key=lambda student: not student.accessibility):
+            suite = next(suite for suite in suites if not (student.accessibility and suite.accessibility))
+            suites.remove(suite)
+            suite.add_student(match.SuiteRound.StudentMatchee(student))
+
+
+# Engine name: function that allocates the students of a SuiteAllocation to its suites
+ENGINES: Dict[str, Callable[[SuiteAllocation, bool], None]] = {
+    "gale-shapley": gale_shapley_engine,
+    "random": random_engine,
+}
+# Engines that are only run for comparison, and are left out of the default target score
+BASELINE_ENGINES = ("random",)
+
+
+def load_asap(size, seed, folder_path) -> ASAP:
+    """Returns a configured ASAP object of the mock data, or of a synthetic cohort if size is given."""
+    with open(cohort.MOCK_CONFIG_PATH, encoding="utf-8") as f:
+        config = json.load(f)
+    if size is None:
+        csv_path = cohort.MOCK_DATA_PATH
+    else:
+        students_df = cohort.generate_cohort(size, seed=seed)
+        csv_path = os.path.join(folder_path, f"cohort_{size}.csv")
+        students_df.to_csv(csv_path, index=False)
+        config["options"] = cohort.suite_options(students_df)
+    asap_obj = ASAP(csv_path)
+    asap_obj.apply_config(config)
+    return asap_obj
+
+
+def run_variant(asap_obj: ASAP, students, engine, suite_propose, female_suites_propose, restarts,
+                seed) -> Dict[str, Any]:
+    """Runs the restarts of one variant with one seed and returns the score and time of every restart.
+
+    Args:
+        asap_obj: A configured ASAP object.
+        students: A dictionary mapping "Female" and "Male" to the StudentData objects of each sex.
+        engine: A string representing the name of the engine in ENGINES.
+        suite_propose: A boolean representing whether suites propose to students in the suite rounds.
+        female_suites_propose: A boolean representing whether female suites propose to male suites in the RCA match.
+        restarts: An integer representing the number of restarts.
+        seed: An integer representing the seed. Each sex gets its own random stream, as in ASAP.rng().
+
+    Returns:
+        A dictionary with the score of each restart, the best score so far and time elapsed after each restart, and
+        the mean RCA score and number of unpaired suites of the best allocation.
+    """
+    asap_obj.activate_scores()
+    num_a11y = {"Female": asap_obj.num_a11y_females, "Male": asap_obj.num_a11y_males}
+    rngs = {sex: random.Random(f"{seed}:{sex}") for sex in SEXES}
+    best_scores = {}
+    best_suites = {}
+    restart_scores = []
+    best_so_far = []
+    elapsed = []
+    total_seconds = 0.0
+    for _ in range(restarts):
+        suite_scores = []
+        start = time.perf_counter()
+        for sex in SEXES:
+            suite_allocation = SuiteAllocation(students[sex], sex, num_a11y[sex], rngs[sex])
+            ENGINES[engine](suite_allocation, suite_propose)
+            scores = [scoring.calculate_success(suite.students) for suite in suite_allocation.suites]
+            suite_scores.append(scores)
+            global_score = sum(scores) / len(scores)
+            if sex not in best_scores or global_score >= best_scores[sex][0]:
+                best_scores[sex] = (global_score, len(scores))
+                best_suites[sex] = suite_allocation.get_allocation()
+        total_seconds += time.perf_counter() - start
+        restart_scores.append(weighted_mean([(sum(scores) / len(scores), len(scores)) for scores in suite_scores]))
+        best_so_far.append(weighted_mean(best_scores.values()))
+        elapsed.append(total_seconds)
+
+    start = time.perf_counter()
+    rca_match = match.RCAMatch(best_suites["Female"], best_suites["Male"],
+                               saga_sextets=asap_obj.avail_sextets_saga,
+                               elm_sextets=asap_obj.avail_sextets_elm,
+                               cendana_sextets=asap_obj.avail_sextets_cendana,
+                               saga_a11y_suites=asap_obj.avail_a11y_suites_saga,
+                               elm_a11y_suites=asap_obj.avail_a11y_suites_elm,
+                               cendana_a11y_suites=asap_obj.avail_a11y_suites_cendana,
+                               female_suites_propose=female_suites_propose,
+                               rng=random.Random(f"{seed}:RCA"))
+    try:
+        rca_match.run_match()
+        rca_failed = False
+    except RuntimeError:  # The RCs ran out of suites for some pairs
+        rca_failed = True
+    rca_seconds = time.perf_counter() - start
+    pairs = [(suite.data, suite.current_choice.data) for suite in rca_match.female_suites
+             if suite.current_choice and not rca_failed]
+    rca_scores = [scoring.calculate_rca_score(female_suite, male_suite) for female_suite, male_suite in pairs]
+    num_suites = len(rca_match.female_suites) + len(rca_match.male_suites)
+    return {
+        "restart_scores": restart_scores,
+        "best_so_far": best_so_far,
+        "elapsed": elapsed,
+        "rca_seconds": rca_seconds,
+        "rca_score": statistics.mean(rca_scores) if rca_scores else None,
+        "rca_failed": rca_failed,
+        "unpaired_suites": None if rca_failed else num_suites - 2 * len(pairs),
+    }
+
+
+def weighted_mean(scores_and_weights) -> float:
+    scores_and_weights = list(scores_and_weights)
+    return (sum(score * weight for score, weight in scores_and_weights)
+            / sum(weight for _, weight in scores_and_weights))
+
+
+def time_to_target(run: Dict[str, Any], target) -> Optional[float]:
+    """Returns the seconds taken by a run to reach the target score, or None if it never did."""
+    for best_score, seconds in zip(run["best_so_far"], run["elapsed"]):
+        if best_score >= target:
+            return seconds
+    return None
+
+
+def summarise(runs: List[Dict[str, Any]], target) -> Dict[str, Any]:
+    """Summarises the runs of a variant (one per seed)."""
+    scores = sorted(score for run in runs for score in run["restart_scores"])
+    deciles = statistics.quantiles(scores, n=10) if len(scores) > 1 else scores * 9
+    times = [time_to_target(run, target) for run in runs]
+    reached = [seconds for seconds in times if seconds is not None]
+    total_restarts = sum(len(run["restart_scores"]) for run in runs)
+    total_seconds = sum(run["elapsed"][-1] for run in runs)
+    rca_scores = [run["rca_score"] for run in runs if run["rca_score"] is not None]
+    unpaired_suites = [run["unpaired_suites"] for run in runs if run["unpaired_suites"] is not None]
+    return {
+        "mean": statistics.mean(scores),
+        "stdev": statistics.stdev(scores) if len(scores) > 1 else 0.0,
+        "p10": deciles[0],
+        "median": statistics.median(scores),
+        "p90": deciles[-1],
+        "best": statistics.mean(run["best_so_far"][-1] for run in runs),
+        "seconds_to_target": statistics.median(reached) if reached else None,
+        "seeds_reaching_target": len(reached),
+        "restarts_per_second": total_restarts / total_seconds if total_seconds else None,
+        "rca_score": statistics.mean(rca_scores) if rca_scores else None,
+        "rca_seconds": statistics.mean(run["rca_seconds"] for run in runs),
+        "unpaired_suites": statistics.mean(unpaired_suites) if unpaired_suites else None,
+        "rca_failures": sum(run["rca_failed"] for run in runs),
+    }
+
+
+def variant_name(engine, suite_propose, female_suites_propose):
+    return f"{engine} (suite_propose={suite_propose}, female_suites_propose={female_suites_propose})"
+
+
+def parse_bools(values) -> List[bool]:
+    return [{"true": True, "false": False}[value.lower()] for value in values]
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Compares allocation engines by quality and time taken.")
+    arg_parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES), help="the engines")
+    arg_parser.add_argument("--suite-propose", nargs="+", default=["true", "false"], choices=["true", "false"],
+                            help="the values of suite_propose to try in the suite rounds")
+    arg_parser.add_argument("--female-suites-propose", nargs="+", default=["true", "false"],
+                            choices=["true", "false"], help="the values of female_suites_propose to try")
+    arg_parser.add_argument("--restarts", type=int, default=10, help="the number of restarts per seed")
+    arg_parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2], help="the random seeds")
+    arg_parser.add_argument("--size", type=int,
+                            help="the size of a synthetic cohort to use instead of the mock data")
+    arg_parser.add_argument("--target", type=float,
+                            help="the target score (by default, the lowest best score of the non-baseline variants)")
+    arg_parser.add_argument("--output", help="save the results as JSON to this file")
+    args = arg_parser.parse_args(argv)
+
+    variants = [(engine, suite_propose, female_suites_propose) for engine in args.engines
+                for suite_propose in parse_bools(args.suite_propose)
+                for female_suites_propose in parse_bools(args.female_suites_propose)]
+    runs = {}
+    with tempfile.TemporaryDirectory() as folder_path:
+        asap_obj = load_asap(args.size, args.seeds[0], folder_path)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            female_students, male_students = asap_obj.add_students()
+        students = {"Female": female_students, "Male": male_students}
+        for variant in variants:
+            runs[variant] = [run_variant(asap_obj, students, *variant, args.restarts, seed) for seed in args.seeds]
+            print(f"Ran {variant_name(*variant)}")
+
+    target = args.target
+    if target is None:
+        targeted = [variant for variant in variants if variant[0] not in BASELINE_ENGINES] or variants
+        target = min(statistics.mean(run["best_so_far"][-1] for run in runs[variant]) for variant in targeted)
+    results = {
+        "cohort": "mock data" if args.size is None else f"synthetic, {args.size} students",
+        "restarts": args.restarts,
+        "seeds": args.seeds,
+        "target": target,
+        "variants": [dict(engine=engine, suite_propose=suite_propose, female_suites_propose=female_suites_propose,
+                          **summarise(runs[engine, suite_propose, female_suites_propose], target))
+                     for engine, suite_propose, female_suites_propose in variants],
+    }
+
+    print(f"\nTarget score: {target:.4f}, {args.restarts} restarts x {len(args.seeds)} seeds")
+    print(f"{'Engine':<14}{'SP':<7}{'FSP':<7}{'Mean':>8}{'Std':>8}{'P10':>8}{'Median':>8}{'P90':>8}{'Best':>8}"
+          f"{'To target':>11}{'Restarts/s':>12}{'RCA score':>11}{'Unpaired':>10}{'RCA failed':>12}")
+    for variant in results["variants"]:
+        seconds_to_target = (f"{variant['seconds_to_target']:.2f}s" if variant["seconds_to_target"] is not None
+                             else "never")
+        rca_score = f"{variant['rca_score']:.2f}" if variant["rca_score"] is not None else "-"
+        unpaired_suites = f"{variant['unpaired_suites']:.1f}" if variant["unpaired_suites"] is not None else "-"
+        print(f"{variant['engine']:<14}{str(variant['suite_propose']):<7}{str(variant['female_suites_propose']):<7}"
+              f"{variant['mean']:8.4f}{variant['stdev']:8.4f}{variant['p10']:8.4f}{variant['median']:8.4f}"
+              f"{variant['p90']:8.4f}{variant['best']:8.4f}{seconds_to_target:>11}"
+              f"{variant['restarts_per_second']:12.2f}{rca_score:>11}{unpaired_suites:>10}"
+              f"{variant['rca_failures']:>12}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""This script reports how long the application entry points take to import.
+
+Each entry point is imported in a fresh interpreter with `python -X importtime`, and the output is summarised as the
+total import time, the time spent in each top-level package, and which of the heavy modules (pandas, numpy, Flask,
+pywebview) were imported at startup. Heavy modules that are only needed later should be loaded lazily (see
+ASAP.backend.util.LazyModule), so the script fails if an entry point takes longer than its budget.
+
+    Typical usage example:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --repeat 5 --top 15
+"""
+
+import argparse
+import collections
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry point name: (module imported at startup, budget in milliseconds)
+ENTRY_POINTS = {
+    "headless": ("ASAP.headless", 150),
+    "gui": ("ASAP.gui.server", 400),
+}
+HEAVY_MODULES = ("pandas", "numpy", "flask", "webview")
+
+
+def measure_imports(module) -> List[Tuple[str, int, int]]:
+    """Imports a module in a fresh interpreter and returns the output of -X importtime.
+
+    Args:
+        module: A string representing the module to import.
+
+    Returns:
+        A list of (module name, self time, cumulative time) tuples, in microseconds, in the order that the imports
+        finished.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT_PATH,
+                            capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative_time, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_time), int(cumulative_time)))
+    return imports
+
+
+def summarise(imports: List[Tuple[str, int, int]], module) -> Tuple[int, Dict[str, int], List[str]]:
+    """Summarises the output of measure_imports().
+
+    Returns:
+        A tuple of the total time taken to import the module (in microseconds), a dictionary mapping each top-level
+        package to the time spent importing it, and a list of the heavy modules that were imported.
+    """
+    total = next(cumulative_time for name, _, cumulative_time in imports if name == module)
+    packages = collections.Counter()
+    for name, self_time, _ in imports:
+        packages[name.split(".")[0]] += self_time
+    heavy_modules = [heavy_module for heavy_module in HEAVY_MODULES if heavy_module in packages]
+    return total, packages, heavy_modules
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Reports the import time of the application entry points.")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="number of runs per entry point (the fastest is kept)")
+    arg_parser.add_argument("--top", type=int, default=10, help="number of top-level packages to list")
+    args = arg_parser.parse_args(argv)
+
+    over_budget = []
+    for entry_point, (module, budget) in ENTRY_POINTS.items():
+        runs = [summarise(measure_imports(module), module) for _ in range(args.repeat)]
+        total, packages, heavy_modules = min(runs, key=lambda run: run[0])
+        print(f"{entry_point} ({module}): {total / 1000:.1f} ms (budget: {budget} ms)")
+        print(f"    Heavy modules imported: {', '.join(heavy_modules) or 'none'}")
+        for package, self_time in packages.most_common(args.top):
+            print(f"    {self_time / 1000:8.1f} ms  {package}")
+        if total / 1000 > budget:
+            over_budget.append(entry_point)
+    if over_budget:
+        sys.exit(f"Over the import time budget: {', '.join(over_budget)}")
+
+
+if __name__ == "__main__":
+    main()
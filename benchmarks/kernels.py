@@ -0,0 +1,80 @@
+"""This script checks that the compiled kernels give exactly the same allocations as the Python code, and times both.
+
+For every seed, the same cohort is allocated end to end and exported with the Python backend and with a kernel backend
+(see ASAP.backend.kernels), and the exported CSV files are compared byte for byte. The script fails if any of them
+differ. By default, the kernels are compiled with Numba if it is installed, and otherwise they are run by the
+interpreter, which still checks that they give the same allocations (but is much slower).
+
+    Typical usage example:
+
+    python -m benchmarks.kernels
+    python -m benchmarks.kernels --size 1000 --seeds 0 1 2 --backend numba
+"""
+
+import argparse
+import contextlib
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+from ASAP.backend import kernels
+from benchmarks import engines
+
+EXPORTED_FILES = ("female_suites.csv", "male_suites.csv", "rca_groups.csv", "masterlist.csv")
+
+
+def run_backend(backend, size, restarts, seed, folder_path):
+    """Allocates and exports a cohort with a backend, and returns the seconds taken and the hashes of the files."""
+    kernels.set_backend(backend)
+    asap_obj = engines.load_asap(size, seed, folder_path)
+    asap_obj.num_restarts = restarts
+    asap_obj.seed = seed
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asap_obj.run_allocation()
+    seconds = time.perf_counter() - start
+    output_path = os.path.join(folder_path, f"{backend}_{seed}")
+    os.makedirs(output_path)
+    asap_obj.export_files(output_path)
+    hashes = {}
+    for filename in EXPORTED_FILES:
+        with open(os.path.join(output_path, filename), "rb") as f:
+            hashes[filename] = hashlib.md5(f.read()).hexdigest()
+    return seconds, hashes
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Checks that the kernels give the same allocations as Python.")
+    arg_parser.add_argument("--backend", choices=[name for name in kernels.BACKENDS if name != "python"],
+                            default="numba" if kernels.numba_available() else "interpreted",
+                            help="the kernel backend to compare with the Python backend")
+    arg_parser.add_argument("--restarts", type=int, default=2, help="the number of restarts per phase")
+    arg_parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="the random seeds")
+    arg_parser.add_argument("--size", type=int,
+                            help="the size of a synthetic cohort to use instead of the mock data")
+    args = arg_parser.parse_args(argv)
+    try:
+        kernels.set_backend(args.backend)
+    except ValueError as e:
+        arg_parser.error(str(e))
+
+    mismatches = []
+    print(f"{'Seed':<6}{'Python (s)':>12}{f'{args.backend} (s)':>18}{'Speedup':>10}  Identical")
+    with tempfile.TemporaryDirectory() as folder_path:
+        for seed in args.seeds:
+            python_seconds, python_hashes = run_backend("python", args.size, args.restarts, seed, folder_path)
+            # The first run of the numba backend includes compiling the kernels
+            kernel_seconds, kernel_hashes = run_backend(args.backend, args.size, args.restarts, seed, folder_path)
+            different = [filename for filename in EXPORTED_FILES if python_hashes[filename] != kernel_hashes[filename]]
+            mismatches.extend(f"{filename} (seed {seed})" for filename in different)
+            print(f"{seed:<6}{python_seconds:12.2f}{kernel_seconds:18.2f}{python_seconds / kernel_seconds:10.2f}  "
+                  f"{'no: ' + ', '.join(different) if different else 'yes'}")
+    kernels.set_backend(None)
+    if mismatches:
+        sys.exit(f"The kernels gave different allocations: {', '.join(mismatches)}")
+
+
+if __name__ == "__main__":
+    main()
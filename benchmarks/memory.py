@@ -0,0 +1,112 @@
+"""This script profiles the memory used by each phase of an allocation and fails if it is over budget.
+
+For every cohort size, a cohort is generated with benchmarks.cohort and allocated end to end with memory profiling on
+(see ASAP.backend.instrumentation): ingesting the CSV file, the restarts, the RCA match, exporting, and saving a
+checkpoint of the ASAP object as the GUI does (the pickle save). For each phase, the script reports the peak memory
+allocated by the phase, the memory that it retained, and the peak resident set size (RSS) of the process.
+
+The script fails if the peak RSS of any run is over the budget, or if the peak of a phase is over its own budget
+(--phase-budget). Profiling makes the allocation several times slower, so the default sizes are small.
+
+    Typical usage example:
+
+    python -m benchmarks.memory
+    python -m benchmarks.memory --sizes 1000 5000 --budget 1024 --phase-budget Restarts=200
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+from typing import Dict
+
+from ASAP.__main__ import ASAP
+from ASAP.backend import instrumentation
+from ASAP.gui.state import SessionStore
+from benchmarks import cohort
+
+DEFAULT_SIZES = (250, 1000)
+# Budget for the peak RSS of the process, in megabytes
+DEFAULT_BUDGET_MB = 1024
+MB = 2 ** 20
+
+
+def profile_size(num_students, restarts, seed, folder_path) -> instrumentation.RunReport:
+    """Runs an allocation of a synthetic cohort with memory profiling and returns its run report."""
+    students_df = cohort.generate_cohort(num_students, seed=seed)
+    csv_path = os.path.join(folder_path, f"cohort_{num_students}.csv")
+    students_df.to_csv(csv_path, index=False)
+    with open(cohort.MOCK_CONFIG_PATH, encoding="utf-8") as f:
+        config = json.load(f)
+    config.update(options=cohort.suite_options(students_df), num_restarts=restarts, seed=seed)
+    output_path = os.path.join(folder_path, f"output_{num_students}")
+    os.makedirs(output_path, exist_ok=True)
+
+    report = instrumentation.RunReport(profile_memory=True)
+    with instrumentation.recording(report):
+        with instrumentation.phase("Ingest"):
+            asap_obj = ASAP(csv_path)
+            asap_obj.apply_config(config)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            asap_obj.run_allocation()
+        asap_obj.export_files(output_path)
+        SessionStore(os.path.join(folder_path, "sessions")).checkpoint(f"cohort_{num_students}", asap_obj)
+    return report
+
+
+def parse_phase_budgets(values) -> Dict[str, float]:
+    phase_budgets = {}
+    for value in values:
+        name, _, budget = value.rpartition("=")
+        if not name:
+            raise argparse.ArgumentTypeError(f"Phase budgets must look like PHASE=MB, not {value}")
+        phase_budgets[name] = float(budget)
+    return phase_budgets
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Profiles the memory used by each phase of an allocation.")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="the cohort sizes")
+    arg_parser.add_argument("--restarts", type=int, default=1, help="the number of restarts per phase")
+    arg_parser.add_argument("--seed", type=int, default=0, help="the random seed of the cohorts and allocations")
+    arg_parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_MB,
+                            help="the budget for the peak RSS of the process, in MB")
+    arg_parser.add_argument("--phase-budget", nargs="+", default=[], metavar="PHASE=MB",
+                            help="budgets for the peak memory allocated by phases, in MB")
+    arg_parser.add_argument("--output", help="save the run reports as JSON to this file")
+    args = arg_parser.parse_args(argv)
+    try:
+        phase_budgets = parse_phase_budgets(args.phase_budget)
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        arg_parser.error(str(e))
+
+    over_budget = []
+    results = {}
+    with tempfile.TemporaryDirectory() as folder_path:
+        for size in args.sizes:
+            report = profile_size(size, args.restarts, args.seed, folder_path)
+            results[str(size)] = report.as_dict()
+            peak_rss = report.peak_rss_bytes / MB if report.peak_rss_bytes is not None else None
+            print(f"{size} students: peak RSS {'-' if peak_rss is None else f'{peak_rss:.1f} MB'} "
+                  f"(budget: {args.budget:g} MB)")
+            print(f"    {'Phase':<24}{'Peak (MB)':>12}{'Retained (MB)':>15}{'Peak RSS (MB)':>15}")
+            for name, memory in report.phase_memory.items():
+                phase_rss = f"{memory['peak_rss_bytes'] / MB:.1f}" if memory["peak_rss_bytes"] is not None else "-"
+                print(f"    {name:<24}{memory['peak_bytes'] / MB:12.1f}{memory['retained_bytes'] / MB:15.1f}"
+                      f"{phase_rss:>15}")
+                if name in phase_budgets and memory["peak_bytes"] / MB > phase_budgets[name]:
+                    over_budget.append(f"{name} ({size} students)")
+            if peak_rss is not None and peak_rss > args.budget:
+                over_budget.append(f"peak RSS ({size} students)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    if over_budget:
+        sys.exit(f"Over the memory budget: {', '.join(over_budget)}")
+
+
+if __name__ == "__main__":
+    main()
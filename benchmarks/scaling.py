@@ -0,0 +1,153 @@
+"""This script times each phase of an allocation on synthetic cohorts of increasing size.
+
+For every cohort size, a cohort is generated with benchmarks.cohort and allocated with the mock data's configuration
+and enough suites to house it. The phases that are timed are:
+
+    * ingest: Reading the CSV file and running the setup steps (ASAP() and ASAP.apply_config()).
+    * allocate_suites: All the restarts of the female and male suite allocations (ASAP.allocate_suites()).
+    * SuiteRound.run_match: The Gale-Shapley rounds within allocate_suites.
+    * RCAMatch.run_match: Pairing the suites into RCA groups and assigning their RCs.
+    * export: Writing the output files (ASAP.export_files()).
+
+Allocating is roughly quadratic in the number of students, so the largest default size (20000) takes tens of minutes
+per restart. The results can be saved as JSON and compared against an earlier run (the baseline), in which case the
+script fails if any phase has become slower than the tolerance allows.
+
+    Typical usage example:
+
+    python -m benchmarks.scaling --sizes 250 1000 --output benchmarks/baseline.json
+    python -m benchmarks.scaling --sizes 250 1000 --compare benchmarks/baseline.json
+"""
+
+import argparse
+import collections
+import contextlib
+import functools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Dict, Iterable, Tuple
+
+from ASAP.__main__ import ASAP
+from ASAP.backend import match
+from benchmarks import cohort
+
+DEFAULT_SIZES = (250, 1000, 5000, 20000)
+# Phases that took less than this many seconds in the baseline are too noisy to compare
+MIN_COMPARABLE_SECONDS = 0.2
+
+
+@contextlib.contextmanager
+def timed_methods(timings: Dict[str, float], methods: Iterable[Tuple[type, str]]):
+    """Adds the time spent in each method to timings (keyed by "Class.method") while the context is active."""
+    originals = []
+    for cls, name in methods:
+        original = getattr(cls, name)
+        originals.append((cls, name, original))
+
+        @functools.wraps(original)
+        def wrapper(*args, _original=original, _key=f"{cls.__name__}.{name}", **kwargs):
+            start = time.perf_counter()
+            try:
+                return _original(*args, **kwargs)
+            finally:
+                timings[_key] += time.perf_counter() - start
+
+        setattr(cls, name, wrapper)
+    try:
+        yield timings
+    finally:
+        for cls, name, original in originals:
+            setattr(cls, name, original)
+
+
+def benchmark_size(num_students, restarts, seed, folder_path) -> Dict[str, float]:
+    """Runs an allocation of a synthetic cohort and returns the number of seconds taken by each phase."""
+    students_df = cohort.generate_cohort(num_students, seed=seed)
+    csv_path = os.path.join(folder_path, f"cohort_{num_students}.csv")
+    students_df.to_csv(csv_path, index=False)
+    with open(cohort.MOCK_CONFIG_PATH, encoding="utf-8") as f:
+        config = json.load(f)
+    config.update(options=cohort.suite_options(students_df), num_restarts=restarts, seed=seed)
+
+    timings = collections.defaultdict(float)
+    with timed_methods(timings, [(ASAP, "allocate_suites"), (match.SuiteRound, "run_match"),
+                                 (match.RCAMatch, "run_match")]):
+        start = time.perf_counter()
+        asap_obj = ASAP(csv_path)
+        asap_obj.apply_config(config)
+        timings["ingest"] = time.perf_counter() - start
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            asap_obj.run_allocation()
+        output_path = os.path.join(folder_path, f"output_{num_students}")
+        os.makedirs(output_path, exist_ok=True)
+        start = time.perf_counter()
+        asap_obj.export_files(output_path)
+        timings["export"] = time.perf_counter() - start
+    return {"ingest": timings["ingest"],
+            "allocate_suites": timings["ASAP.allocate_suites"],
+            "SuiteRound.run_match": timings["SuiteRound.run_match"],
+            "RCAMatch.run_match": timings["RCAMatch.run_match"],
+            "export": timings["export"]}
+
+
+def compare(results, baseline, tolerance) -> bool:
+    """Prints how each phase compares to the baseline and returns whether any phase has regressed."""
+    regressed = False
+    if baseline["restarts"] != results["restarts"]:
+        print(f"Warning: the baseline ran {baseline['restarts']} restarts but this run ran {results['restarts']}")
+    for size, timings in results["results"].items():
+        for phase, seconds in timings.items():
+            baseline_seconds = baseline["results"].get(size, {}).get(phase)
+            if baseline_seconds is None or baseline_seconds < MIN_COMPARABLE_SECONDS:
+                continue
+            ratio = seconds / baseline_seconds
+            slower = ratio > 1 + tolerance
+            regressed |= slower
+            print(f"{size:>6} {phase:<22} {baseline_seconds:9.3f}s -> {seconds:9.3f}s ({ratio:5.2f}x)"
+                  f"{'  REGRESSION' if slower else ''}")
+    return regressed
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Times each phase of an allocation on synthetic cohorts.")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="the cohort sizes")
+    arg_parser.add_argument("--restarts", type=int, default=1, help="the number of restarts per phase")
+    arg_parser.add_argument("--seed", type=int, default=0, help="the random seed of the cohorts and allocations")
+    arg_parser.add_argument("--repeat", type=int, default=1, help="number of runs per size (the fastest is kept)")
+    arg_parser.add_argument("--output", help="save the results as JSON to this file")
+    arg_parser.add_argument("--compare", metavar="BASELINE", help="compare the results to a JSON file saved earlier")
+    arg_parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="how much slower than the baseline a phase may be (0.25 means 25%%)")
+    args = arg_parser.parse_args(argv)
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "restarts": args.restarts,
+        "seed": args.seed,
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as folder_path:
+        for size in args.sizes:
+            runs = [benchmark_size(size, args.restarts, args.seed, folder_path) for _ in range(args.repeat)]
+            timings = {phase: min(run[phase] for run in runs) for phase in runs[0]}
+            results["results"][str(size)] = timings
+            print(f"{size:>6} students: " + ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in timings.items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit("Some phases are slower than the baseline")
+
+
+if __name__ == "__main__":
+    main()
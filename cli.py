@@ -1,6 +1,21 @@
-from ASAP.gui.server import main
+import multiprocessing
+import sys
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Never runs, but lets PyInstaller find the modules that are only imported lazily (see util.LazyModule)
+    import numpy
+    import pandas
+    import webview
 
 if __name__ == "__main__":
+    # Sharded allocations run in worker processes, which need this when the program is frozen with PyInstaller
+    multiprocessing.freeze_support()
+    # With arguments, run headless so that the GUI (and Flask and pywebview) is never imported
+    if len(sys.argv) > 1:
+        from ASAP.headless import main
+    else:
+        from ASAP.gui.server import main
     main()
 
 # pyinstaller ASAP.spec --onefile
@@ -0,0 +1,37 @@
+"""Checks that the kernels (see ASAP.backend.kernels) give exactly the same allocations as the Python code.
+
+The mock data is allocated and exported with the python backend and with the interpreted backend, which runs the
+kernels without Numba, and the exported files are compared. benchmarks.kernels does the same for larger cohorts and
+times the backends.
+
+    Typical usage example:
+
+    python -m unittest tests.test_kernels
+"""
+
+import tempfile
+import unittest
+
+from ASAP.backend import kernels
+from benchmarks import kernels as kernels_benchmark
+
+SEED = 0
+RESTARTS = 2
+
+
+class KernelBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.previous_backend = kernels.backend()
+
+    def tearDown(self):
+        kernels.set_backend(self.previous_backend)
+
+    def test_interpreted_matches_python(self):
+        with tempfile.TemporaryDirectory() as folder_path:
+            _, python_hashes = kernels_benchmark.run_backend("python", None, RESTARTS, SEED, folder_path)
+            _, kernel_hashes = kernels_benchmark.run_backend("interpreted", None, RESTARTS, SEED, folder_path)
+        self.assertEqual(python_hashes, kernel_hashes)
+
+
+if __name__ == "__main__":
+    unittest.main()